@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class ResponseCache:
+    """In-process LRU of results (response bodies, id lists) tied to a dataset version.
+
+    Entries are only valid for the version they were built from; the first
+    lookup that sees a newer version drops everything.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: int):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, version: int, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._check_version(version)
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, version: int, key: Hashable, body: Any):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
@@ -0,0 +1,29 @@
+import os
+from functools import lru_cache
+from typing import Iterator
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from database.session import DATABASE_URL, create_db_engine, make_session_factory
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    # Built on first use rather than at import, so importing the API (or
+    # its tests) never touches the database.
+    url = os.environ.get("DATABASE_URL", DATABASE_URL)
+    return create_db_engine(url, pool_size=10, max_overflow=20, pool_pre_ping=True)
+
+
+@lru_cache(maxsize=None)
+def get_session_factory() -> sessionmaker:
+    return make_session_factory(get_engine())
+
+
+def get_db() -> Iterator[Session]:
+    db = get_session_factory()()
+    try:
+        yield db
+    finally:
+        db.close()
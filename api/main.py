@@ -0,0 +1,22 @@
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+
+from api.dependencies import get_engine
+from api.routers import chatbot, metrics, outlets
+from database.session import init_db
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db(get_engine())
+    yield
+    get_engine().dispose()
+
+
+app = FastAPI(title="Subway Outlets API", lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.include_router(outlets.router)
+app.include_router(chatbot.router)
+app.include_router(metrics.router)
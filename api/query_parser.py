@@ -0,0 +1,136 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+MALAYSIA_TZ = timezone(timedelta(hours=8))
+
+DAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tue": 1, "tues": 1,
+    "wednesday": 2, "wed": 2, "thursday": 3, "thu": 3, "thur": 3, "thurs": 3,
+    "friday": 4, "fri": 4, "saturday": 5, "sat": 5, "sunday": 6, "sun": 6,
+}
+
+# Words that shape the question rather than name a place
+STOPWORDS = {
+    "a", "all", "am", "an", "and", "any", "are", "around", "at", "branch",
+    "branches", "can", "close", "closes", "closing", "count", "do", "does",
+    "find", "for", "get", "have", "hours", "how", "i", "in", "is", "list",
+    "located", "location", "locations", "many", "me", "near", "number", "of",
+    "on", "open", "opened", "opening", "opens", "outlet", "outlets", "please",
+    "pm", "restaurant", "restaurants", "show", "shop", "shops", "still", "store",
+    "stores", "subway", "subways", "that", "the", "there", "today", "tonight",
+    "what", "when", "where", "which", "with", "you",
+}
+
+_COUNT = re.compile(r"\b(how many|number of|count)\b")
+_LIMIT = re.compile(r"\b(?:top|first|show(?: me)?|list)\s+(\d{1,3})\b")
+_ALL_DAY = re.compile(r"\b24\s*(?:/\s*7|hours?|hrs?|h)\b")
+_NOW = re.compile(r"\b(?:right )?now\b")
+_TIME = re.compile(
+    r"\b(after|past|until|till|at|by|before)\s+"
+    r"(?:(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?|(midnight|noon))(?!\w)")
+_WORD = re.compile(r"[^\W_]+")
+
+# How each time preposition constrains an outlet's opening interval
+TIME_OPS = {
+    "after": "open_after", "past": "open_after", "until": "open_until",
+    "till": "open_until", "at": "open_at", "by": "open_at",
+    "before": "open_before",
+}
+
+
+@dataclass(frozen=True)
+class ParsedQuery:
+    """Structured filters extracted from a free-text question."""
+
+    terms: Tuple[str, ...] = ()
+    time_op: Optional[str] = None  # open_at, open_after, open_until or open_before
+    minutes: Optional[int] = None  # minutes after midnight
+    day: Optional[int] = None  # 0 = Monday
+    all_day: bool = False
+    count_only: bool = False
+    limit: Optional[int] = None
+
+    def describe(self) -> str:
+        parts = []
+        if self.terms:
+            parts.append("matching " + " ".join(self.terms))
+        if self.all_day:
+            parts.append("open 24 hours")
+        if self.time_op:
+            label = {"open_at": "open at", "open_after": "open after",
+                     "open_until": "open until", "open_before": "open before"}[self.time_op]
+            parts.append(f"{label} {format_minutes(self.minutes)}")
+        if self.day is not None:
+            parts.append("on " + [d for d, i in DAYS.items() if i == self.day][0].capitalize())
+        return ", ".join(parts)
+
+
+def format_minutes(minutes: int) -> str:
+    hour, minute = divmod(minutes % 1440, 60)
+    suffix = "AM" if hour < 12 else "PM"
+    return f"{hour % 12 or 12}:{minute:02d} {suffix}"
+
+
+def _to_minutes(hour: str, minute: Optional[str], meridiem: Optional[str],
+                word: Optional[str]) -> Optional[int]:
+    if word == "midnight":
+        return 0
+    if word == "noon":
+        return 12 * 60
+    hour, minute = int(hour), int(minute or 0)
+    if hour > 24 or minute > 59:
+        return None
+    meridiem = (meridiem or "").replace(".", "")
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    return (hour * 60 + minute) % 1440
+
+
+def parse_question(question: str, now: Optional[datetime] = None) -> ParsedQuery:
+    text = question.casefold()
+    removed: List[Tuple[int, int]] = []
+
+    def take(match):
+        removed.append(match.span())
+        return match
+
+    count_only = bool(_COUNT.search(text))
+    limit = None
+    match = _LIMIT.search(text)
+    if match:
+        limit = int(take(match).group(1)) or None
+
+    all_day = bool(_ALL_DAY.search(text))
+    if all_day:
+        take(_ALL_DAY.search(text))
+
+    time_op = minutes = day = None
+    match = _TIME.search(text)
+    if match:
+        value = _to_minutes(match.group(2), match.group(3), match.group(4), match.group(5))
+        if value is not None:
+            take(match)
+            time_op, minutes = TIME_OPS[match.group(1)], value
+    elif _NOW.search(text):
+        take(_NOW.search(text))
+        now = (now or datetime.now(MALAYSIA_TZ)).astimezone(MALAYSIA_TZ)
+        time_op, minutes, day = "open_at", now.hour * 60 + now.minute, now.weekday()
+
+    remaining = text
+    for start, end in sorted(removed, reverse=True):
+        remaining = remaining[:start] + " " + remaining[end:]
+
+    terms = []
+    for word in _WORD.findall(remaining):
+        if word in DAYS:
+            day = DAYS[word]
+        elif word not in STOPWORDS and not word.isdigit() and word not in terms:
+            terms.append(word)
+
+    return ParsedQuery(terms=tuple(terms), time_op=time_op, minutes=minutes, day=day,
+                       all_day=all_day, count_only=count_only, limit=limit)
+
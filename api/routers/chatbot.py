@@ -0,0 +1,106 @@
+from dataclasses import asdict
+from typing import List, Tuple
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from api.cache import ResponseCache
+from api.dependencies import get_db
+from api.query_parser import ParsedQuery, parse_question
+from api.schemas import OUTLET_FIELDS, ChatAnswer, ChatQuery
+from database.crud import get_dataset_version
+from database.hours import ALL_DAYS, OpenHoursIndex
+from database.models import OUTLET_OPEN, Outlet
+from database.search import search_outlet_ids
+
+router = APIRouter(prefix="/chatbot", tags=["chatbot"])
+
+# Parsed query -> matching outlet ids, valid for one dataset version
+answer_cache = ResponseCache(maxsize=2048)
+
+MAX_LISTED = 20
+
+# Weekly open-hours bitmaps of every outlet, rebuilt when the version moves
+_hours_index = ResponseCache(maxsize=1)
+
+
+def _open_ids(db: Session, version: int, parsed: ParsedQuery) -> set:
+    index = _hours_index.get(version, "index")
+    if index is None:
+        index = OpenHoursIndex.load(db)
+        _hours_index.put(version, "index", index)
+
+    days = ALL_DAYS if parsed.day is None else (parsed.day,)
+    matches = None
+    if parsed.all_day:
+        matches = set(index.open_all_day(days).tolist())
+    if parsed.time_op is not None:
+        finder = {"open_at": index.open_at, "open_after": index.open_after,
+                  "open_until": index.open_until,
+                  "open_before": index.open_before}[parsed.time_op]
+        found = set(finder(parsed.minutes, days).tolist())
+        matches = found if matches is None else matches & found
+    return matches
+
+
+def retrieve_ids(db: Session, parsed: ParsedQuery, version: int) -> Tuple[int, ...]:
+    """Ids of outlets answering the query, best text match first."""
+    if parsed.terms:
+        ids = search_outlet_ids(db, parsed.terms)
+        if not ids:
+            return ()
+    else:
+        ids = None
+
+    if parsed.time_op is None and not parsed.all_day:
+        if ids is None:
+            ids = db.execute(select(Outlet.id).where(Outlet.status == OUTLET_OPEN)
+                             .order_by(Outlet.id)).scalars().all()
+        return tuple(ids)
+
+    # Time filters are a vectorized bit test over the precomputed bitmaps
+    open_ids = _open_ids(db, version, parsed)
+    if ids is None:
+        return tuple(sorted(open_ids))
+    return tuple(i for i in ids if i in open_ids)
+
+
+def _load_outlets(db: Session, ids) -> List[dict]:
+    columns = [getattr(Outlet, f) for f in OUTLET_FIELDS]
+    rows = {row[0]: dict(zip(OUTLET_FIELDS, row))
+            for row in db.execute(select(*columns).where(Outlet.id.in_(ids)))}
+    return [rows[i] for i in ids if i in rows]
+
+
+def _answer_text(parsed: ParsedQuery, count: int, names: List[str]) -> str:
+    description = parsed.describe()
+    scope = f" {description}" if description else ""
+    if count == 0:
+        return f"I couldn't find any outlets{scope}."
+    noun = "outlet" if count == 1 else "outlets"
+    if parsed.count_only or not names:
+        return f"There are {count} {noun}{scope}."
+    listed = ", ".join(names)
+    more = f" and {count - len(names)} more" if count > len(names) else ""
+    return f"Found {count} {noun}{scope}: {listed}{more}."
+
+
+@router.post("/query", response_model=ChatAnswer)
+def answer_question(query: ChatQuery, db: Session = Depends(get_db)):
+    parsed = parse_question(query.question)
+    version = get_dataset_version(db).version
+
+    ids = answer_cache.get(version, parsed)
+    if ids is None:
+        ids = retrieve_ids(db, parsed, version)
+        answer_cache.put(version, parsed, ids)
+
+    shown = [] if parsed.count_only else ids[:parsed.limit or MAX_LISTED]
+    outlets = _load_outlets(db, shown) if shown else []
+    return {
+        "answer": _answer_text(parsed, len(ids), [o["name"] for o in outlets]),
+        "count": len(ids),
+        "outlets": outlets,
+        "filters": asdict(parsed),
+    }
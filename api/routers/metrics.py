@@ -0,0 +1,51 @@
+import json
+import os
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from api.dependencies import get_db
+from database.crud import get_dataset_version
+from database.models import Outlet, ScrapeRun
+from scraper.metrics import METRIC_PREFIX, render_prometheus
+
+router = APIRouter(tags=["metrics"])
+
+# The scraper is a batch job, so its last JSON report is served from here
+# for Prometheus to scrape between runs
+REPORT_PATH_ENV = "SCRAPER_METRICS_REPORT"
+DEFAULT_REPORT_PATH = "scrape_report.json"
+
+
+def _load_report() -> dict:
+    try:
+        with open(os.environ.get(REPORT_PATH_ENV, DEFAULT_REPORT_PATH), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(db: Session = Depends(get_db)):
+    lines = [
+        f"# HELP {METRIC_PREFIX}_dataset_version Current outlet dataset version.",
+        f"# TYPE {METRIC_PREFIX}_dataset_version gauge",
+        f"{METRIC_PREFIX}_dataset_version {get_dataset_version(db).version}",
+        f"# HELP {METRIC_PREFIX}_outlets Stored outlets by status.",
+        f"# TYPE {METRIC_PREFIX}_outlets gauge",
+    ]
+    for status, count in db.execute(
+            select(Outlet.status, func.count()).group_by(Outlet.status)):
+        lines.append(f'{METRIC_PREFIX}_outlets{{status="{status}"}} {count}')
+
+    last_run = db.execute(select(ScrapeRun).order_by(ScrapeRun.id.desc()).limit(1)).scalar()
+    if last_run is not None and last_run.finished_at is not None:
+        seconds = (last_run.finished_at - last_run.started_at).total_seconds()
+        lines += [
+            f"# HELP {METRIC_PREFIX}_last_run_seconds Duration of the last finished scrape run.",
+            f"# TYPE {METRIC_PREFIX}_last_run_seconds gauge",
+            f'{METRIC_PREFIX}_last_run_seconds{{status="{last_run.status}"}} {seconds}',
+        ]
+    return "\n".join(lines) + "\n" + render_prometheus(_load_report())
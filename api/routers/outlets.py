@@ -0,0 +1,154 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from api.cache import ResponseCache
+from api.dependencies import get_db
+from api.schemas import OUTLET_FIELDS, NearbyOutlet, OutletOut, OutletPage, OverlapOut
+from database import spatial
+from database.crud import get_dataset_version
+from database.models import OUTLET_OPEN, Outlet
+
+router = APIRouter(prefix="/outlets", tags=["outlets"])
+
+response_cache = ResponseCache()
+
+MAX_PAGE_SIZE = 1000
+
+
+def _validators(version_row, key: str):
+    etag = '"%d-%s"' % (version_row.version,
+                        hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+    last_modified = version_row.updated_at.replace(tzinfo=timezone.utc)
+    return etag, last_modified
+
+
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _cached_response(request: Request, db: Session, build: Callable[[int], object]) -> Response:
+    """Serve from validators or cache when possible, else build and cache.
+
+    ``build`` receives the dataset version and returns the payload to encode.
+    """
+    version_row = get_dataset_version(db)
+    key = request.url.path + "?" + str(request.query_params)
+    etag, last_modified = _validators(version_row, key)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(version_row.version, key)
+    if body is None:
+        body = orjson.dumps(build(version_row.version))
+        response_cache.put(version_row.version, key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _parse_fields(fields: Optional[str]):
+    if not fields:
+        return OUTLET_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(requested) - set(OUTLET_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+    # id is always returned because it is the pagination cursor
+    return ("id", *[f for f in requested if f != "id"])
+
+
+def _outlet_dict(outlet: Outlet) -> dict:
+    return {field: getattr(outlet, field) for field in OUTLET_FIELDS}
+
+
+def _get_or_404(db: Session, outlet_id: int) -> Outlet:
+    outlet = db.get(Outlet, outlet_id)
+    if outlet is None:
+        raise HTTPException(status_code=404, detail="Outlet not found")
+    return outlet
+
+
+@router.get("", response_model=OutletPage)
+def list_outlets(request: Request,
+                 cursor: Optional[int] = Query(None, description="id of the last outlet already seen"),
+                 limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                 fields: Optional[str] = Query(None, description="comma-separated columns"),
+                 city: Optional[str] = None,
+                 status: str = Query(OUTLET_OPEN, pattern="^(open|closed)$"),
+                 db: Session = Depends(get_db)):
+    columns = _parse_fields(fields)
+
+    def build(version: int):
+        # Keyset pagination: an indexed range scan on the primary key, so
+        # page N costs the same as page 1
+        query = select(*[getattr(Outlet, c) for c in columns]).order_by(Outlet.id).limit(limit + 1)
+        if cursor is not None:
+            query = query.where(Outlet.id > cursor)
+        if city:
+            query = query.where(Outlet.city == city)
+        query = query.where(Outlet.status == status)
+        rows = db.execute(query).all()
+        items = [dict(zip(columns, row)) for row in rows[:limit]]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor, "version": version}
+
+    return _cached_response(request, db, build)
+
+
+@router.get("/nearby", response_model=list[NearbyOutlet])
+def nearby_outlets(request: Request,
+                   lat: float = Query(..., ge=-90, le=90),
+                   lng: float = Query(..., ge=-180, le=180),
+                   k: int = Query(10, ge=1, le=100),
+                   radius_km: Optional[float] = Query(None, gt=0, le=500),
+                   db: Session = Depends(get_db)):
+    def build(version: int):
+        if radius_km is not None:
+            found = spatial.within_radius(db, lat, lng, radius_km, limit=k)
+        else:
+            found = spatial.nearest(db, lat, lng, k)
+        return [{**_outlet_dict(o), "distance_km": round(d, 3)} for o, d in found]
+
+    return _cached_response(request, db, build)
+
+
+@router.get("/{outlet_id}", response_model=OutletOut)
+def get_outlet(outlet_id: int, request: Request, db: Session = Depends(get_db)):
+    # Looked up only on a cache miss; a 304 or cached body skips the row
+    def build(version: int):
+        return _outlet_dict(_get_or_404(db, outlet_id))
+
+    return _cached_response(request, db, build)
+
+
+@router.get("/{outlet_id}/overlaps", response_model=list[OverlapOut])
+def outlet_overlaps(outlet_id: int, request: Request, db: Session = Depends(get_db)):
+    def build(version: int):
+        _get_or_404(db, outlet_id)
+        return [
+            {"outlet_id": o.outlet_id, "other_id": o.other_id,
+             "distance_km": round(o.distance_km, 3)}
+            for o in spatial.overlapping(db, outlet_id)
+        ]
+
+    return _cached_response(request, db, build)
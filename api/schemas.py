@@ -0,0 +1,49 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class OutletOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    operating_hours: Optional[str] = None
+    phone: Optional[str] = None
+    waze_link: Optional[str] = None
+    google_map_link: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    status: Optional[str] = None  # open, or closed when a full scrape no longer lists it
+    canonical_id: Optional[str] = None  # stable identity assigned by entity resolution
+
+
+class OutletPage(BaseModel):
+    items: List[OutletOut]
+    next_cursor: Optional[int] = None
+    version: int
+
+
+class NearbyOutlet(OutletOut):
+    distance_km: float
+
+
+class OverlapOut(BaseModel):
+    outlet_id: int
+    other_id: int
+    distance_km: float
+
+
+# Columns clients may request through ?fields=
+OUTLET_FIELDS = tuple(OutletOut.model_fields)
+
+
+class ChatQuery(BaseModel):
+    question: str = Field(..., min_length=1, max_length=500)
+
+
+class ChatAnswer(BaseModel):
+    answer: str
+    count: int
+    outlets: List[OutletOut]
+    filters: dict
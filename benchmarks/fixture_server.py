@@ -0,0 +1,301 @@
+"""Local stand-in for subway.com.my/find-a-subway.
+
+Serves a landing page with a popup, a city selector and ``#fp_locationlist``,
+``div.outlet-card`` listings that load more cards on scroll, static
+per-page listings for the HTTP engine, and injectable latency and failures.
+Outlets are synthesized from their index, so any size costs no memory.
+
+    python -m benchmarks.fixture_server --outlets 10000 --port 8765
+"""
+import argparse
+import html
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# City -> (latitude, longitude) the synthetic outlets are scattered around
+CITIES: Dict[str, Tuple[float, float]] = {
+    "Kuala Lumpur": (3.1390, 101.6869),
+    "Selangor": (3.0738, 101.5183),
+    "Johor": (1.4927, 103.7414),
+    "Penang": (5.4164, 100.3327),
+}
+
+HOURS = [
+    "Monday - Sunday, 10:00 AM - 10:00 PM",
+    "Monday - Friday, 8:00 AM - 9:00 PM\nSaturday - Sunday, 9:00 AM - 10:00 PM",
+    "Daily 7am - 11pm",
+    "Open 24 hours",
+    "Mon-Thu 9:00-22:00, Fri-Sun 9:00-01:00",
+    "Monday - Saturday, 10:00 AM - 10:00 PM\nSunday, Closed",
+]
+
+STREETS = ["Jalan Ampang", "Jalan Telawi", "Jalan Bukit Bintang", "Lebuh Pantai",
+           "Jalan Tun Razak", "Persiaran Gurney", "Jalan Wong Ah Fook", "Jalan SS 2/24"]
+
+
+def slugify(city: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", city.casefold()).strip("-")
+
+
+@dataclass
+class FixtureConfig:
+    outlets: int = 1000  # per city
+    cities: Tuple[str, ...] = tuple(CITIES)
+    default_city: str = "Kuala Lumpur"
+    page_size: int = 20
+    latency_ms: float = 0.0  # added to every response
+    jitter_ms: float = 0.0  # uniform extra latency on top
+    failure_rate: float = 0.0  # share of listing requests answered with a 503
+    popup: bool = True
+    advertise_total: bool = True  # data-total on the outlet list
+    seed: int = 0
+
+
+def synthetic_outlet(city: str, index: int, seed: int = 0) -> dict:
+    rng = random.Random(f"{seed}:{city}:{index}")
+    lat, lng = CITIES.get(city, (3.1390, 101.6869))
+    lat, lng = round(lat + rng.uniform(-0.3, 0.3), 6), round(lng + rng.uniform(-0.3, 0.3), 6)
+    slug = slugify(city)
+    return {
+        "id": f"{slug}-{index}",
+        "name": f"Subway {city} {index:06d}",
+        "address": f"Lot {rng.randint(1, 400)}, {rng.choice(STREETS)}, {city}",
+        "phone": f"03-{rng.randint(1000, 9999)} {rng.randint(1000, 9999)}" if index % 5 else None,
+        "hours": HOURS[index % len(HOURS)],
+        "latitude": lat,
+        "longitude": lng,
+    }
+
+
+def card_html(outlet: dict) -> str:
+    e = html.escape
+    parts = [
+        f'<div class="outlet-card" data-id="{e(outlet["id"])}" '
+        f'data-latitude="{outlet["latitude"]}" data-longitude="{outlet["longitude"]}">',
+        f'<h3>{e(outlet["name"])}</h3>',
+        f'<p class="address">{e(outlet["address"])}</p>',
+    ]
+    if outlet["phone"]:
+        parts.append(f'<p class="phone">{e(outlet["phone"])}</p>')
+    parts.append('<p class="hours">' + "<br>".join(
+        e(line) for line in outlet["hours"].split("\n")) + "</p>")
+    ll = f'{outlet["latitude"]},{outlet["longitude"]}'
+    parts.append(f'<div class="waze"><a href="https://waze.com/ul?ll={ll}">Waze</a></div>')
+    parts.append(f'<div class="google-map"><a href="https://maps.google.com/?q={ll}">'
+                 'Google Map</a></div>')
+    parts.append("</div>")
+    return "".join(parts)
+
+
+# Stands in for the live page closely enough for the Selenium engine:
+# clicking a city swaps the list, scrolling near the bottom fetches the next
+# page of cards, and the popup sits over everything until closed. The card
+# endpoint and its hints are this fixture's own (see http_engine.CardEndpoint).
+PAGE_JS = """
+const list = document.querySelector('.outlet-list');
+const state = {city: list.dataset.city, offset: Number(list.dataset.offset),
+               total: Number(list.dataset.total || Infinity), loading: false};
+async function more() {
+    if (state.loading || state.offset >= state.total) return;
+    state.loading = true;
+    try {
+        const url = '/api/cards?city=' + state.city + '&offset=' + state.offset;
+        const response = await fetch(url);
+        if (response.ok) {
+            list.insertAdjacentHTML('beforeend', await response.text());
+            state.offset = Number(response.headers.get('X-Next-Offset'));
+        }
+    } finally {
+        state.loading = false;
+    }
+}
+window.addEventListener('scroll', () => {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 200) more();
+});
+document.querySelector('.location_left').addEventListener('click', () => {
+    document.getElementById('fp_locationlist').style.display = 'block';
+});
+for (const item of document.querySelectorAll('#fp_locationlist .city-item')) {
+    item.addEventListener('click', event => {
+        event.preventDefault();
+        list.innerHTML = '';
+        state.city = item.dataset.city;
+        state.offset = 0;
+        state.total = Number(item.dataset.total);
+        document.getElementById('fp_locationlist').style.display = 'none';
+        more();
+    });
+}
+const popup = document.querySelector('.popup');
+if (popup) {
+    popup.querySelector('.modal-close').addEventListener('click', () => popup.remove());
+}
+"""
+
+
+class FixtureServer:
+    """Threaded HTTP server for one FixtureConfig; use as a context manager."""
+
+    def __init__(self, config: Optional[FixtureConfig] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FixtureConfig()
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def landing_url(self) -> str:
+        return f"{self.url}/find-a-subway"
+
+    def city_url(self, city: str, page: int = 0) -> str:
+        return f"{self.url}/find-a-subway/{slugify(city)}?page={page}"
+
+    def page_urls(self, city: str) -> List[str]:
+        pages = max(1, -(-self.config.outlets // self.config.page_size))
+        return [self.city_url(city, page) for page in range(pages)]
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    # -- page rendering -------------------------------------------------
+
+    def _cards(self, city: str, offset: int, limit: int) -> Tuple[str, int]:
+        end = min(offset + limit, self.config.outlets)
+        cards = "".join(card_html(synthetic_outlet(city, i, self.config.seed))
+                        for i in range(offset, end))
+        return cards, end
+
+    def _location_list(self) -> str:
+        items = "".join(
+            f'<a class="city-item" href="/find-a-subway/{slugify(c)}" data-city="{slugify(c)}" '
+            f'data-total="{self.config.outlets}">{html.escape(c)}</a>'
+            for c in self.config.cities)
+        return f'<div id="fp_locationlist" style="display:none">{items}</div>'
+
+    def _page(self, city: str, offset: int) -> str:
+        cards, end = self._cards(city, offset, self.config.page_size)
+        total = f' data-total="{self.config.outlets}"' if self.config.advertise_total else ""
+        popup = ('<div class="popup"><button class="modal-close">Close</button></div>'
+                 if self.config.popup else "")
+        return (
+            "<!DOCTYPE html><html><head><title>Find a Subway | Subway Malaysia</title>"
+            "<style>.outlet-card{height:120px}.popup{position:fixed;inset:0;"
+            "background:rgba(0,0,0,.5)}</style></head><body>"
+            f'{popup}<div class="location_left"><span>{html.escape(city)}</span></div>'
+            f"{self._location_list()}"
+            f'<div class="outlet-list" data-city="{slugify(city)}" data-offset="{end}"'
+            f'{total}>{cards}</div>'
+            f"<script>{PAGE_JS}</script></body></html>")
+
+    def _city(self, slug: str) -> Optional[str]:
+        return next((c for c in self.config.cities if slugify(c) == slug), None)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: str, headers: Optional[dict] = None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                config = server.config
+                with server._lock:
+                    server.requests += 1
+                    delay = config.latency_ms + server._rng.uniform(0, config.jitter_ms)
+                    fail = server._rng.random() < config.failure_rate
+                if delay:
+                    time.sleep(delay / 1000)
+
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                path = parts.path.rstrip("/")
+                if path == "/find-a-subway":
+                    return self._send(200, server._page(config.default_city, 0))
+
+                if fail:
+                    with server._lock:
+                        server.failures += 1
+                    return self._send(503, "Service Unavailable")
+
+                if path.startswith("/find-a-subway/"):
+                    city = server._city(path.rsplit("/", 1)[1])
+                    if city is None:
+                        return self._send(404, "Not Found")
+                    page = int(query.get("page", ["0"])[0])
+                    return self._send(200, server._page(city, page * config.page_size))
+                if path == "/api/cards":
+                    city = server._city(query.get("city", [""])[0])
+                    if city is None:
+                        return self._send(404, "Not Found")
+                    offset = int(query.get("offset", ["0"])[0])
+                    cards, end = server._cards(city, offset, config.page_size)
+                    return self._send(200, cards, {"X-Next-Offset": str(end)})
+                return self._send(404, "Not Found")
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic find-a-subway page")
+    parser.add_argument("--outlets", type=int, default=1000, help="outlets per city")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    config = FixtureConfig(outlets=args.outlets, page_size=args.page_size,
+                           latency_ms=args.latency_ms, failure_rate=args.failure_rate)
+    server = FixtureServer(config, port=args.port)
+    print(f"Serving {config.outlets} outlets per city at {server.landing_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,299 @@
+"""Offline benchmarks for the scraper, the ingest path and the API.
+
+Everything runs against benchmarks.fixture_server and throwaway SQLite
+databases, never the real site. Each result is appended to
+bench_output.txt as one JSON object per line, so runs can be diffed or
+plotted to catch regressions.
+
+    python -m benchmarks.harness --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fixture_server import FixtureConfig, FixtureServer, synthetic_outlet
+from database.crud import OutletWriter
+from database.session import create_db_engine, init_db, make_session_factory
+from scraper.http_engine import fetch_outlets, make_session, parse_outlet_cards
+from scraper.records import OutletRecord
+
+OUTPUT_PATH = "bench_output.txt"
+CITY = "Kuala Lumpur"
+
+BENCHMARKS = ("http_end_to_end", "extraction", "ingest", "api", "selenium")
+
+QUESTIONS = [
+    "outlets in bangsar",
+    "which outlets are open after 10pm",
+    "how many outlets are open 24 hours",
+    "subway ampang open at 8am on sunday",
+]
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _latency_summary(samples: List[float]) -> dict:
+    ms = [s * 1000 for s in samples]
+    return {"requests": len(ms), "p50_ms": round(_percentile(ms, 50), 3),
+            "p99_ms": round(_percentile(ms, 99), 3), "mean_ms": round(statistics.fmean(ms), 3)}
+
+
+def _records(n: int, city: str = CITY) -> List[OutletRecord]:
+    records = []
+    for i in range(n):
+        o = synthetic_outlet(city, i)
+        records.append(OutletRecord(o["name"], o["address"], hours=o["hours"], phone=o["phone"],
+                                    latitude=o["latitude"], longitude=o["longitude"],
+                                    location_id=o["id"], city=city))
+    return records
+
+
+def _session_factory(path: str):
+    engine = create_db_engine(f"sqlite:///{path}")
+    init_db(engine)
+    return engine, make_session_factory(engine)
+
+
+def _ingest(path: str, records, batch_size: int = 500):
+    engine, factory = _session_factory(path)
+    db = factory()
+    try:
+        with OutletWriter(db, batch_size=batch_size) as writer:
+            writer.add_many(records)
+        return writer.totals
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def bench_http_end_to_end(n: int, workdir: str, config: FixtureConfig) -> dict:
+    """Fetch every listing page over HTTP, parse it and store it."""
+    config = FixtureConfig(**{**config.__dict__, "outlets": n})
+    with FixtureServer(config) as server:
+        session = make_session()
+        try:
+            start = time.perf_counter()
+            records = fetch_outlets(server.page_urls(CITY), session=session)
+            fetched = time.perf_counter()
+        finally:
+            session.close()
+        for record in records:
+            record.city = CITY
+        _ingest(os.path.join(workdir, f"e2e-{n}.db"), records)
+        done = time.perf_counter()
+    return {
+        "outlets_scraped": len(records),
+        "requests": server.requests,
+        "failed_requests": server.failures,
+        "fetch_seconds": round(fetched - start, 4),
+        "total_seconds": round(done - start, 4),
+        "outlets_per_sec": round(len(records) / (done - start), 1),
+    }
+
+
+def bench_extraction(n: int, workdir: str, config: FixtureConfig) -> dict:
+    """Cost of turning card markup into records, per outlet."""
+    from benchmarks.fixture_server import card_html
+
+    cards = min(n, 1000)
+    markup = ("<html><body><div class='outlet-list'>"
+              + "".join(card_html(synthetic_outlet(CITY, i)) for i in range(cards))
+              + "</div></body></html>").encode("utf-8")
+    rounds = max(1, n // cards)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parsed = parse_outlet_cards(markup)
+    elapsed = time.perf_counter() - start
+    assert len(parsed) == cards
+    return {"outlets_parsed": cards * rounds,
+            "us_per_outlet": round(elapsed / (cards * rounds) * 1e6, 2)}
+
+
+def bench_ingest(n: int, workdir: str, config: FixtureConfig) -> dict:
+    """Rows/sec into a fresh database, then for an unchanged re-scrape."""
+    path = os.path.join(workdir, f"ingest-{n}.db")
+    records = _records(n)
+    start = time.perf_counter()
+    first = _ingest(path, records)
+    inserted = time.perf_counter() - start
+    start = time.perf_counter()
+    second = _ingest(path, _records(n))
+    rescrape = time.perf_counter() - start
+    return {
+        "inserted": first.inserted,
+        "insert_rows_per_sec": round(n / inserted, 1),
+        "unchanged": second.unchanged,
+        "rescrape_rows_per_sec": round(n / rescrape, 1),
+    }
+
+
+def bench_api(n: int, workdir: str, config: FixtureConfig, requests: int = 200) -> dict:
+    """In-process request latency for the read endpoints."""
+    from fastapi.testclient import TestClient
+
+    from api.dependencies import get_engine, get_session_factory
+    from api.main import app
+    from api.routers.outlets import response_cache
+
+    path = os.path.join(workdir, f"api-{n}.db")
+    _ingest(path, _records(n))
+    previous = os.environ.get("DATABASE_URL")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    get_engine.cache_clear()
+    get_session_factory.cache_clear()
+    response_cache.clear()
+
+    def timed(client, calls: Callable[[int], tuple]) -> List[float]:
+        samples = []
+        for i in range(requests):
+            method, url, kwargs = calls(i)
+            start = time.perf_counter()
+            response = client.request(method, url, **kwargs)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        return samples
+
+    step = max(1, n // requests)
+    results = {}
+    try:
+        with TestClient(app) as client:
+            # Distinct cursors, so every request misses the response cache
+            results["outlets_page"] = _latency_summary(timed(
+                client, lambda i: ("GET", "/outlets", {"params": {"cursor": i * step, "limit": 100}})))
+            results["outlets_page_cached"] = _latency_summary(timed(
+                client, lambda i: ("GET", "/outlets", {"params": {"limit": 100}})))
+            results["outlet_by_id"] = _latency_summary(timed(
+                client, lambda i: ("GET", f"/outlets/{i * step + 1}", {})))
+            results["nearby"] = _latency_summary(timed(
+                client, lambda i: ("GET", "/outlets/nearby", {"params": {
+                    "lat": 3.0 + (i % 50) / 100, "lng": 101.5 + (i % 40) / 100, "k": 10}})))
+            results["chatbot"] = _latency_summary(timed(
+                client, lambda i: ("POST", "/chatbot/query", {
+                    "json": {"question": f"{QUESTIONS[i % len(QUESTIONS)]} {i % 7}"}})))
+    finally:
+        get_engine.cache_clear()
+        get_session_factory.cache_clear()
+        response_cache.clear()
+        if previous is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = previous
+    return results
+
+
+def bench_selenium(n: int, workdir: str, config: FixtureConfig) -> dict:
+    """Browser scrape of the fixture page, cold then warm; needs Chrome and chromedriver."""
+    from scraper.browsers import BrowserPool
+    from scraper.metrics import metrics
+    from scraper.scraper import scrape_with_selenium
+
+    config = FixtureConfig(**{**config.__dict__, "outlets": n})
+    pool = BrowserPool(size=1)
+    metrics.reset()
+    try:
+        with FixtureServer(config) as server:
+            start = time.perf_counter()
+            count = sum(1 for _ in scrape_with_selenium(
+                CITY, start_url=server.landing_url, pool=pool))
+            elapsed = time.perf_counter() - start
+            report = metrics.report()
+            # Same scrape again on the browser the first one left warm
+            start = time.perf_counter()
+            sum(1 for _ in scrape_with_selenium(CITY, start_url=server.landing_url, pool=pool))
+            warm = time.perf_counter() - start
+    finally:
+        pool.close()
+    return {
+        "outlets_scraped": count,
+        "total_seconds": round(elapsed, 3),
+        "warm_total_seconds": round(warm, 3),
+        "outlets_per_sec": round(count / elapsed, 2) if elapsed else None,
+        "webdriver_calls": report["counters"].get("webdriver.calls", 0),
+        "phases": report["phases"],
+    }
+
+
+RUNNERS: Dict[str, Callable[..., dict]] = {
+    "http_end_to_end": bench_http_end_to_end,
+    "extraction": bench_extraction,
+    "ingest": bench_ingest,
+    "api": bench_api,
+    "selenium": bench_selenium,
+}
+
+
+def run(benchmarks, sizes, config: FixtureConfig, output: Optional[str] = OUTPUT_PATH) -> List[dict]:
+    revision = _git_revision()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="subway-bench-") as workdir:
+        for n in sizes:
+            for name in benchmarks:
+                start = time.perf_counter()
+                try:
+                    result = RUNNERS[name](n, workdir, config)
+                    status = "ok"
+                except Exception as e:
+                    # e.g. no Chrome for the selenium benchmark; record and move on
+                    result = {"error": f"{type(e).__name__}: {e}"}
+                    status = "error"
+                entry = {
+                    "benchmark": name,
+                    "outlets": n,
+                    "status": status,
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "latency_ms": config.latency_ms,
+                    "failure_rate": config.failure_rate,
+                    **result,
+                    "git_revision": revision,
+                    "python": platform.python_version(),
+                    "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                }
+                results.append(entry)
+                print(json.dumps(entry))
+                if output:
+                    with open(output, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline scraper/API benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS,
+                        default=[b for b in BENCHMARKS if b != "selenium"])
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="share of listing requests the fixture answers with a 503")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    config = FixtureConfig(page_size=args.page_size, latency_ms=args.latency_ms,
+                           failure_rate=args.failure_rate)
+    results = run(args.benchmarks, args.sizes, config, args.output)
+    return 1 if any(r["status"] == "error" and r["benchmark"] != "selenium" for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,504 @@
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Collection, Iterable, List, Optional
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from database.models import Outlet  # Corrected import path
+from database.hours import encode_bitmap, parse_hours
+from database.models import (OUTLET_CLOSED, OUTLET_OPEN, DatasetVersion, Outlet,  # Corrected import path
+                             OutletHours, ScrapeRun)
+from database.resolution import EntityIndex, canonical_id, geohash, geohash_neighbors, name_tokens
+from database.search import similar_outlet_ids
+from database.spatial import refresh_overlaps
 
 
-def create_outlet(db: Session, name: str, address: str, hours: str, waze_link: str):
-    outlet = Outlet(
-        name=name,
-        address=address,
-        operating_hours=hours,
-        waze_link=waze_link
-    )
-    db.add(outlet)
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def get_dataset_version(db: Session) -> DatasetVersion:
+    row = db.get(DatasetVersion, 1)
+    if row is None:
+        # Nothing has been scraped into this database yet
+        row = DatasetVersion(id=1, version=0, updated_at=datetime(1970, 1, 1))
+    return row
+
+
+def bump_dataset_version(db: Session) -> int:
+    """Mark the outlet data as changed; readers key their caches on this."""
+    row = get_dataset_version(db)
+    row.version += 1
+    row.updated_at = _now()
+    db.merge(row)
+    return row.version
+
+
+def replace_hours(db: Session, outlets: Iterable[Outlet],
+                  new_ids: Collection[int] = ()) -> List[Outlet]:
+    """Re-derive the interval rows and bitmaps of ``outlets`` from their hours text.
+
+    Old rows go in one DELETE (skipping ``new_ids``, outlets inserted in
+    this transaction that have none) and new rows in one executemany.
+    Returns the outlets whose hours could not be parsed.
+    """
+    rows, stale, unparsed = [], [], []
+    # An outlet may be queued twice when a batch repeats it
+    for outlet in {outlet.id: outlet for outlet in outlets}.values():
+        intervals = parse_hours(outlet.operating_hours)
+        outlet.hours_bitmap = encode_bitmap(intervals) if intervals is not None else None
+        if outlet.id not in new_ids:
+            stale.append(outlet.id)
+        if intervals is None:
+            unparsed.append(outlet)
+            continue
+        rows.extend({"outlet_id": outlet.id, "day": day, "open_minute": start,
+                     "close_minute": end} for day, start, end in intervals)
+    for start in range(0, len(stale), _IN_CHUNK):
+        db.query(OutletHours).filter(
+            OutletHours.outlet_id.in_(stale[start:start + _IN_CHUNK])
+        ).delete(synchronize_session=False)
+    if rows:
+        db.execute(OutletHours.__table__.insert(), rows)
+    return unparsed
+
+
+@dataclass
+class FlushStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    closed: int = 0
+    reopened: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+    def __iadd__(self, other: "FlushStats"):
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.closed += other.closed
+        self.reopened += other.reopened
+        return self
+
+
+_COORDINATES = ("latitude", "longitude")
+
+# Columns that are left alone when the incoming record has no value,
+# so a card without data-latitude does not wipe stored coordinates.
+_KEEP_IF_MISSING = ("latitude", "longitude", "city")
+
+# Scraped columns covered by Outlet.content_hash
+_HASHED = ("name", "address", "operating_hours", "phone", "waze_link",
+           "google_map_link", "latitude", "longitude", "location_id", "city")
+
+# Per-kind cap on the outlets listed in a run's stored diff summary
+MAX_DIFF_ENTRIES = 100
+
+# Bound on the parameters of one IN (...) query
+_IN_CHUNK = 500
+
+# Full-text hits loaded as fuzzy candidates per record without coordinates
+_FTS_CANDIDATES = 20
+
+
+def _outlet_values(record) -> dict:
+    return {
+        "name": record.name,
+        "address": record.address,
+        "operating_hours": record.hours,
+        "phone": record.phone,
+        "waze_link": record.waze_map,
+        "google_map_link": record.google_map,
+        "latitude": record.latitude,
+        "longitude": record.longitude,
+        "location_id": record.location_id,
+        "city": record.city,
+        "natural_key": record.natural_key,
+    }
+
+
+def _cell(outlet) -> Optional[str]:
+    if outlet.latitude is None or outlet.longitude is None:
+        return None
+    return geohash(outlet.latitude, outlet.longitude)
+
+
+@dataclass
+class _Lookups:
+    """Stored outlets a batch may resolve to, by each kind of key."""
+    by_canon: dict
+    by_id: dict
+    by_key: dict
+    fuzzy: EntityIndex
+
+
+def content_hash(values: dict) -> str:
+    """Stable digest of an outlet's scraped columns."""
+    parts = []
+    for column in _HASHED:
+        value = values.get(column)
+        if value is None:
+            parts.append("")
+        elif isinstance(value, float):
+            parts.append(f"{value:.6f}")
+        else:
+            parts.append(str(value))
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class OutletWriter:
+    """Buffers scraped records and upserts them in batches.
+
+    Records are objects shaped like ``scraper.records.OutletRecord``. A
+    record resolves to a stored outlet by canonical id, data-id or natural
+    key. Failing those, it is fuzzy-matched against the outlets sharing a
+    geohash or name block with it (see database.resolution). Only a record
+    that matches nothing is inserted, under a new canonical id. Each
+    batch costs one narrow SELECT of the stored keys and content hashes
+    and, for records no key matched, one of the outlets in their geohash
+    cells and one FTS query over their names. Only records whose hash
+    differs load their full row, all in one more SELECT, so an unchanged
+    outlet costs no write at all. Nothing is committed until
+    ``commit()``/``close()``, so a full run is a single transaction.
+    ``on_flush`` is called with each batch's FlushStats and duration.
+    """
+
+    def __init__(self, db: Session, batch_size: int = 500,
+                 on_flush: Optional[Callable[[FlushStats, float], None]] = None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.db = db
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.totals = FlushStats()
+        self._pending: List = []
+        # Outlets whose coordinates changed since the last commit
+        self._moved: List[Outlet] = []
+        self._changed = False
+        # Distinct hours strings the parser could not understand, for the report
+        self.unparsed_hours = set()
+        # Ids of every stored outlet this run has seen, for tombstoning
+        self.seen_ids = set()
+        # What this run changed, by kind, for the run's diff summary
+        self.changes = {"inserted": [], "updated": [], "closed": [], "reopened": []}
+
+    def add(self, record):
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            return self.flush()
+        return None
+
+    def add_many(self, records: Iterable):
+        for record in records:
+            self.add(record)
+
+    def _light_rows(self, condition):
+        # Plain rows, not ORM objects: most of them will turn out unchanged
+        return self.db.query(
+            Outlet.id, Outlet.canonical_id, Outlet.location_id, Outlet.natural_key,
+            Outlet.content_hash, Outlet.status, Outlet.name, Outlet.address, Outlet.geohash,
+            *[getattr(Outlet, c) for c in _KEEP_IF_MISSING],
+        ).filter(condition).all()
+
+    def _load_existing(self, keyed) -> _Lookups:
+        canonical = {cid for _, cid in keyed}
+        location_ids = {r.location_id for r, _ in keyed if r.location_id}
+        keys = {r.natural_key for r, _ in keyed}
+        conditions = [Outlet.canonical_id.in_(canonical), Outlet.natural_key.in_(keys)]
+        if location_ids:
+            conditions.append(Outlet.location_id.in_(location_ids))
+        lookups = _Lookups({}, {}, {}, EntityIndex())
+        for outlet in self._light_rows(or_(*conditions)):
+            if outlet.canonical_id:
+                lookups.by_canon[outlet.canonical_id] = outlet
+            if outlet.location_id:
+                lookups.by_id[outlet.location_id] = outlet
+            lookups.by_key.setdefault(outlet.natural_key, outlet)
+
+        # A record no key matched may still be a stored outlet whose text
+        # changed. Load the outlets sharing a block with it (nearby geohash
+        # cells, else FTS hits on its name) for fuzzy matching.
+        cells, names, unlocated = set(), set(), 0
+        for record, cid in keyed:
+            if self._match(record, cid, lookups) is not None:
+                continue
+            if record.latitude is not None and record.longitude is not None:
+                cells |= geohash_neighbors(record.latitude, record.longitude)
+            else:
+                names |= name_tokens(record.name)
+                unlocated += 1
+        ids = []
+        if names:
+            ids = similar_outlet_ids(self.db, sorted(names),
+                                     limit=_FTS_CANDIDATES * unlocated)
+        cells, ids = sorted(cells), sorted(ids)
+        blocked = {}
+        for values, column in ((cells, Outlet.geohash), (ids, Outlet.id)):
+            for start in range(0, len(values), _IN_CHUNK):
+                for outlet in self._light_rows(column.in_(values[start:start + _IN_CHUNK])):
+                    blocked[outlet.id] = outlet
+        for outlet in blocked.values():
+            lookups.fuzzy.add(outlet)
+        return lookups
+
+    def _claimed(self, outlet) -> bool:
+        # Already matched by another record this run, so not this one
+        return outlet.id is not None and outlet.id in self.seen_ids
+
+    def _match(self, record, cid: str, lookups: _Lookups, fuzzy: bool = False):
+        outlet = lookups.by_canon.get(cid)
+        if outlet is None and record.location_id:
+            outlet = lookups.by_id.get(record.location_id)
+        if outlet is None:
+            candidate = lookups.by_key.get(record.natural_key)
+            # Same name+address but a different data-id is a different outlet
+            if candidate is not None and candidate.location_id in (None, record.location_id):
+                outlet = candidate
+        if outlet is None and fuzzy:
+            outlet = lookups.fuzzy.best_match(record, skip=self._claimed)
+        return outlet
+
+    @staticmethod
+    def _digest(values: dict, stored) -> str:
+        merged = dict(values)
+        for column in _KEEP_IF_MISSING:
+            if merged[column] is None:
+                merged[column] = getattr(stored, column)
+        return content_hash(merged)
+
+    def _is_current(self, stored, digest: str) -> bool:
+        return stored.content_hash == digest and stored.status == OUTLET_OPEN
+
+    def flush(self) -> FlushStats:
+        batch, self._pending = self._pending, []
+        stats = FlushStats()
+        if not batch:
+            return stats
+
+        started = time.perf_counter()
+        keyed = [(record, canonical_id(record)) for record in batch]
+        lookups = self._load_existing(keyed)
+        # Load full rows only for the records whose content hash moved,
+        # fuzzy matches included
+        fuzzy_matches, stale = [], set()
+        for record, cid in keyed:
+            stored = self._match(record, cid, lookups, fuzzy=True)
+            fuzzy_matches.append(stored)
+            if stored is not None and not self._is_current(
+                    stored, self._digest(_outlet_values(record), stored)):
+                stale.add(stored.id)
+        full = {}
+        if stale:
+            full = {o.id: o for o in self.db.query(Outlet).filter(Outlet.id.in_(stale))}
+
+        inserted, reparse = [], []
+        for (record, cid), fuzzy in zip(keyed, fuzzy_matches):
+            stored = self._match(record, cid, lookups)
+            if stored is None:
+                # The match found above stands unless an earlier record took
+                # it; with none, an outlet inserted since may be the one
+                if fuzzy is None or self._claimed(fuzzy):
+                    fuzzy = lookups.fuzzy.best_match(record, skip=self._claimed)
+                stored = fuzzy
+            values = _outlet_values(record)
+            if stored is None:
+                outlet = Outlet(**values, canonical_id=cid, content_hash=content_hash(values),
+                                status=OUTLET_OPEN)
+                outlet.geohash = _cell(outlet)
+                self.db.add(outlet)
+                lookups.fuzzy.add(outlet)
+                stats.inserted += 1
+                inserted.append(outlet)
+                if outlet.latitude is not None:
+                    self._moved.append(outlet)
+                reparse.append(outlet)
+            else:
+                digest = self._digest(values, stored)
+                if self._is_current(stored, digest):
+                    stats.unchanged += 1
+                    if stored.id is not None:
+                        self.seen_ids.add(stored.id)
+                    continue
+
+                if isinstance(stored, Outlet):
+                    outlet = stored  # written earlier in this batch
+                else:
+                    outlet = full.get(stored.id) or self.db.get(Outlet, stored.id)
+                changed = []
+                for column, value in values.items():
+                    if value is None and column in _KEEP_IF_MISSING:
+                        continue
+                    if getattr(outlet, column) != value:
+                        setattr(outlet, column, value)
+                        changed.append(column)
+                        if column in _COORDINATES:
+                            self._moved.append(outlet)
+                            outlet.geohash = _cell(outlet)
+                        elif column == "operating_hours":
+                            reparse.append(outlet)
+                # A stored hash from an older run (or none at all) is
+                # refreshed without counting as a change, as is a missing
+                # canonical id
+                outlet.content_hash = digest
+                if outlet.canonical_id is None and cid not in lookups.by_canon:
+                    outlet.canonical_id = cid
+                if outlet.status != OUTLET_OPEN:
+                    outlet.status, outlet.closed_at = OUTLET_OPEN, None
+                    stats.reopened += 1
+                    self._note("reopened", outlet)
+                    if outlet.latitude is not None:
+                        self._moved.append(outlet)
+                    changed.append("status")
+                if changed:
+                    stats.updated += 1
+                    self._note("updated", outlet, fields=changed)
+                else:
+                    stats.unchanged += 1
+                if outlet.id is not None:
+                    self.seen_ids.add(outlet.id)
+
+            # Later records in this batch resolve to it by any of its keys
+            lookups.by_canon[cid] = outlet
+            if outlet.canonical_id:
+                lookups.by_canon[outlet.canonical_id] = outlet
+            if outlet.location_id:
+                lookups.by_id[outlet.location_id] = outlet
+            lookups.by_key[outlet.natural_key] = outlet
+
+        self.db.flush()
+        for outlet in inserted:
+            self.seen_ids.add(outlet.id)
+            self._note("inserted", outlet)
+        # Hours are parsed once here, at ingest, never per request
+        new_ids = {outlet.id for outlet in inserted}
+        for outlet in replace_hours(self.db, reparse, new_ids):
+            if outlet.operating_hours:
+                self.unparsed_hours.add(outlet.operating_hours)
+        self.db.flush()
+        self._changed = self._changed or bool(stats.inserted or stats.updated)
+        self.totals += stats
+        if self.on_flush is not None:
+            self.on_flush(stats, time.perf_counter() - started)
+        logging.info(
+            f"Flushed {stats.total} outlets: {stats.inserted} inserted, "
+            f"{stats.updated} updated, {stats.unchanged} unchanged")
+        return stats
+
+    def _note(self, kind: str, outlet: Outlet, **extra):
+        entries = self.changes[kind]
+        if len(entries) < MAX_DIFF_ENTRIES:
+            entries.append({"id": outlet.id, "name": outlet.name, **extra})
+
+    def retire_unseen(self, cities: Iterable[str]) -> int:
+        """Mark open outlets of fully scraped cities that this run never saw as closed.
+
+        Only call this once every listed city has been scraped to the end;
+        a partial listing would tombstone outlets that still exist. Outlets
+        without a city are never retired.
+        """
+        self.flush()
+        cities = [c for c in cities if c]
+        if not cities:
+            return 0
+        missing = [
+            outlet for outlet in self.db.query(Outlet).filter(
+                Outlet.city.in_(cities), Outlet.status == OUTLET_OPEN)
+            if outlet.id not in self.seen_ids
+        ]
+        now = _now()
+        for outlet in missing:
+            outlet.status, outlet.closed_at = OUTLET_CLOSED, now
+            self._note("closed", outlet)
+            if outlet.latitude is not None:
+                # Closed outlets drop out of the overlap graph
+                self._moved.append(outlet)
+        if missing:
+            self.db.flush()
+            self._changed = True
+            self.totals.closed += len(missing)
+            logging.info(f"Marked {len(missing)} outlets not seen in {', '.join(cities)} as closed")
+        return len(missing)
+
+    def locate(self, outlet: Outlet, latitude: float, longitude: float):
+        """Give a stored outlet coordinates found outside a scrape (e.g. geocoded).
+
+        The outlet's geohash, content hash and overlap pairs follow, and the
+        next commit bumps the dataset version.
+        """
+        outlet.latitude, outlet.longitude = latitude, longitude
+        outlet.geohash = _cell(outlet)
+        # A later card without coordinates keeps these, so hash them in
+        outlet.content_hash = content_hash({c: getattr(outlet, c) for c in _HASHED})
+        self._moved.append(outlet)
+        self._changed = True
+
+    def commit(self):
+        self.flush()
+        if self._moved:
+            # Coordinates set by locate() reach the R*Tree only once flushed
+            self.db.flush()
+            # Keep the precomputed overlap graph in step with this run
+            refresh_overlaps(self.db, [outlet.id for outlet in self._moved])
+            self._moved = []
+        if self._changed:
+            bump_dataset_version(self.db)
+            self._changed = False
+        self.db.commit()
+
+    def close(self) -> FlushStats:
+        self.commit()
+        if self.unparsed_hours:
+            logging.warning(
+                f"{len(self.unparsed_hours)} distinct operating-hours strings could "
+                f"not be parsed: {sorted(self.unparsed_hours)[:10]}")
+            self.unparsed_hours = set()
+        return self.totals
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep what was scraped before the failure
+            try:
+                self.close()
+            except Exception as e:
+                self.db.rollback()
+                logging.error(f"Failed to save buffered outlets: {str(e)}")
+        return False
+
+
+def start_scrape_run(db: Session, engine: str, cities: Iterable[str]) -> ScrapeRun:
+    run = ScrapeRun(started_at=_now(), status="running", engine=engine,
+                    cities=",".join(cities))
+    db.add(run)
     db.commit()
-    db.refresh(outlet)
-    return outlet
+    return run
+
+
+def finish_scrape_run(db: Session, run: ScrapeRun, writer: OutletWriter,
+                      status: str) -> ScrapeRun:
+    """Record a run's outcome and diff, and log the summary."""
+    totals = writer.totals
+    run.status = status
+    run.finished_at = _now()
+    run.inserted, run.updated, run.unchanged = totals.inserted, totals.updated, totals.unchanged
+    run.closed, run.reopened = totals.closed, totals.reopened
+    run.summary = json.dumps(writer.changes, ensure_ascii=False)
+    db.commit()
+
+    logging.info(
+        f"Scrape run {run.id} {status}: {totals.inserted} inserted, {totals.updated} updated, "
+        f"{totals.unchanged} unchanged, {totals.closed} closed, {totals.reopened} reopened")
+    for entry in writer.changes["updated"][:10]:
+        logging.info(f"  updated {entry['name']!r}: {', '.join(entry['fields'])}")
+    for entry in writer.changes["closed"][:10]:
+        logging.info(f"  closed {entry['name']!r}")
+    return run
@@ -0,0 +1,293 @@
+import argparse
+import logging
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (day, open minute, close minute), 0 = Monday; close <= 1440
+Interval = Tuple[int, int, int]
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_BYTES = 7 * SLOTS_PER_DAY // 8  # 84 bytes: one bit per 15 minutes of the week
+
+ALL_DAYS = tuple(range(7))
+
+_DAY = (r"(?:mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?"
+        r"|fri(?:day)?|sat(?:urday)?|sun(?:day)?)")
+_DAY_INDEX = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+_CLOCK = r"(\d{1,2})(?:[:.](\d{2}))?\s*(a\.?m\.?|p\.?m\.?)?"
+_TOKEN = re.compile(
+    rf"(?P<range>{_CLOCK}\s*(?:-|–|to|until)\s*{_CLOCK})"
+    r"|(?P<allday>\b24\s*(?:hours?|hrs?|h)\b|\b24\s*/\s*7\b)"
+    rf"|(?P<dayrange>\b{_DAY}\b\s*(?:-|–|to|until)\s*\b{_DAY}\b)"
+    rf"|(?P<day>\b{_DAY}\b)"
+    r"|(?P<every>\bdaily\b|\bevery\s*day\b|\ball\s+days\b|\b7\s+days\b)"
+    r"|(?P<weekdays>\bweekdays?\b)"
+    r"|(?P<weekends>\bweekends?\b)"
+    r"|(?P<holiday>\bpublic\s+holidays?\b|\bph\b)"
+    r"|(?P<closed>\bclosed\b)",
+    re.IGNORECASE)
+
+_DAY_KINDS = ("dayrange", "day", "every", "weekdays", "weekends")
+_HOURS_KINDS = ("range", "allday", "closed")
+# What may separate a day group from the hours it introduces ("Mon-Fri: 9am")
+_LEADING_GAP = re.compile(r"[\s:]*")
+
+
+def _day_index(word: str) -> int:
+    return _DAY_INDEX[word.strip().lower()[:3]]
+
+
+def _minutes(hour: str, minute: Optional[str], meridiem: Optional[str]) -> Optional[int]:
+    hour, minute = int(hour), int(minute or 0)
+    if hour > 24 or minute > 59:
+        return None
+    meridiem = (meridiem or "").lower().replace(".", "")
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+
+def _days_between(first: int, last: int) -> List[int]:
+    return [(first + i) % 7 for i in range((last - first) % 7 + 1)]
+
+
+def _add(intervals: List[Interval], days: Iterable[int], start: int, end: int):
+    if end <= start:
+        end += 1440  # closes after midnight
+    for day in days:
+        intervals.append((day, start, min(end, 1440)))
+        if end > 1440:
+            intervals.append(((day + 1) % 7, 0, end - 1440))
+
+
+def _token_days(match) -> List[int]:
+    kind = match.lastgroup
+    if kind == "dayrange":
+        first, last = re.split(r"\s*(?:-|–|to|until)\s*", match.group(kind), flags=re.I)
+        return _days_between(_day_index(first), _day_index(last))
+    if kind == "day":
+        return [_day_index(match.group(kind))]
+    if kind == "every":
+        return list(ALL_DAYS)
+    if kind == "weekdays":
+        return list(range(5))
+    return [5, 6]
+
+
+def _leads(text: str, matches, index: int) -> bool:
+    # Whether the day group ending at matches[index] introduces the hours after it
+    following = matches[index + 1] if index + 1 < len(matches) else None
+    return (following is not None and following.lastgroup in _HOURS_KINDS
+            and _LEADING_GAP.fullmatch(text, matches[index].end(), following.start()))
+
+
+def parse_hours(text: Optional[str]) -> Optional[List[Interval]]:
+    """Turn scraped opening-hours text into (day, open, close) intervals.
+
+    Day names, ranges ("Mon - Fri"), lists ("Sat, Sun"), daily/weekday/
+    weekend keywords, 12/24-hour clocks, "24 hours" and "Closed" are
+    understood. Times apply to the days named before them; times named
+    before any day apply to the days that follow them ("10am-10pm
+    (Mon-Fri)"), else to every day not marked closed. Public-holiday lines
+    are skipped. Returns None when the text has no recognizable hours, or
+    names days it gives no hours for.
+    """
+    if not text or not text.strip():
+        return None
+    matches = list(_TOKEN.finditer(text))
+    intervals: List[Interval] = []
+    days: List[int] = []
+    closed_days = set()
+    floating = []  # hours given before any day; None for "Closed"
+    clause = 0  # where the latest run of floating hours (or closings) starts
+    assigned = False  # whether the current day group already got its hours
+    trailing = False  # the current day group qualifies the floating hours
+    skipping = False  # inside a public-holiday clause
+    recognized = False
+
+    def give(to_days: Sequence[int], hours: Optional[Tuple[int, int]]):
+        if hours is None:
+            closed_days.update(to_days)
+        else:
+            _add(intervals, to_days, *hours)
+
+    for index, match in enumerate(matches):
+        kind = match.lastgroup
+        if kind in _DAY_KINDS:
+            if assigned or skipping:
+                days, assigned, skipping = [], False, False
+            if not days:
+                trailing = bool(floating)
+            days.extend(d for d in _token_days(match) if d not in days)
+            group_ends = index + 1 == len(matches) or matches[index + 1].lastgroup not in _DAY_KINDS
+            if trailing and group_ends and not _leads(text, matches, index):
+                # Only the latest clause: in "10am-10pm, closed on Sunday"
+                # the day closes, and the opening hours stay for the rest
+                for hours in floating[clause:]:
+                    give(days, hours)
+                del floating[clause:]
+                days, trailing = [], False
+            continue
+        if kind == "holiday":
+            skipping = True
+            continue
+        if skipping:
+            continue
+
+        if kind == "closed":
+            hours = None
+        elif kind == "allday":
+            hours = (0, 1440)
+        else:
+            g = match.groups()
+            start, end = _minutes(g[1], g[2], g[3]), _minutes(g[4], g[5], g[6])
+            if start is None or end is None:
+                continue
+            if start == end:
+                end = start + 1440  # e.g. "12:00 AM - 12:00 AM"
+            hours = (start, end)
+        if days:
+            give(days, hours)
+        else:
+            if not floating or (floating[-1] is None) != (hours is None):
+                clause = len(floating)
+            floating.append(hours)
+        recognized = assigned = True
+
+    if not recognized or (days and not assigned and not skipping):
+        return None
+    for hours in floating:
+        give([d for d in ALL_DAYS if d not in closed_days], hours)
+    return sorted(set(i for i in intervals if i[2] > i[1]))
+
+
+def encode_bitmap(intervals: Sequence[Interval]) -> bytes:
+    """Pack intervals into a 7x96 bitmask; a slot is set if open at its start."""
+    bits = np.zeros(7 * SLOTS_PER_DAY, dtype=np.uint8)
+    for day, start, end in intervals:
+        first = day * SLOTS_PER_DAY + -(-start // SLOT_MINUTES)
+        last = day * SLOTS_PER_DAY + -(-end // SLOT_MINUTES)
+        bits[first:last] = 1
+    return np.packbits(bits, bitorder="little").tobytes()
+
+
+def slot(day: int, minute: int) -> int:
+    return day * SLOTS_PER_DAY + min(minute, 1439) // SLOT_MINUTES
+
+
+def is_open(bitmap: bytes, day: int, minute: int) -> bool:
+    index = slot(day, minute)
+    return bool(bitmap[index // 8] >> (index % 8) & 1)
+
+
+def slot_mask(days: Iterable[int], first_minute: int = 0, last_minute: int = 1440) -> np.ndarray:
+    """Byte mask selecting [first_minute, last_minute) on each of the days."""
+    bits = np.zeros(7 * SLOTS_PER_DAY, dtype=np.uint8)
+    for day in days:
+        start = day * SLOTS_PER_DAY + first_minute // SLOT_MINUTES
+        end = day * SLOTS_PER_DAY + -(-last_minute // SLOT_MINUTES)
+        bits[start:end] = 1
+    return np.packbits(bits, bitorder="little")
+
+
+class OpenHoursIndex:
+    """All outlets' weekly bitmaps as one (n, 84) uint8 matrix.
+
+    Every "open at/after/before" question is a vectorized AND against a
+    query mask instead of a per-row parse.
+    """
+
+    def __init__(self, ids: Sequence[int], bitmaps: Sequence[bytes]):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        if len(bitmaps):
+            self.matrix = np.frombuffer(b"".join(bitmaps), dtype=np.uint8).reshape(-1, BITMAP_BYTES)
+        else:
+            self.matrix = np.zeros((0, BITMAP_BYTES), dtype=np.uint8)
+
+    @classmethod
+    def load(cls, db) -> "OpenHoursIndex":
+        from database.models import OUTLET_OPEN, Outlet
+
+        rows = (db.query(Outlet.id, Outlet.hours_bitmap)
+                .filter(Outlet.hours_bitmap.isnot(None), Outlet.status == OUTLET_OPEN)
+                .order_by(Outlet.id).all())
+        return cls([r[0] for r in rows], [r[1] for r in rows])
+
+    def _any(self, mask: np.ndarray) -> np.ndarray:
+        return self.ids[(self.matrix & mask).any(axis=1)]
+
+    def open_at(self, minute: int, days: Iterable[int] = ALL_DAYS) -> np.ndarray:
+        return self._any(slot_mask(days, minute, minute + 1))
+
+    def open_after(self, minute: int, days: Iterable[int] = ALL_DAYS) -> np.ndarray:
+        return self._any(slot_mask(days, minute, 1440))
+
+    def open_until(self, minute: int, days: Iterable[int] = ALL_DAYS) -> np.ndarray:
+        # Open right up to ``minute``: an outlet closing at 10pm is open until 10pm
+        return self.open_at((minute - 1) % 1440, days)
+
+    def open_before(self, minute: int, days: Iterable[int] = ALL_DAYS) -> np.ndarray:
+        return self._any(slot_mask(days, 0, minute))
+
+    def open_all_day(self, days: Iterable[int] = ALL_DAYS) -> np.ndarray:
+        days = list(days)
+        hits = np.zeros(len(self.ids), dtype=bool)
+        for day in days:
+            mask = slot_mask([day])
+            hits |= ((self.matrix & mask) == mask).all(axis=1)
+        return self.ids[hits]
+
+
+def backfill(db, batch_size: int = 500) -> Counter:
+    """Re-parse every stored outlet's hours; returns unparseable strings."""
+    from database.crud import bump_dataset_version, replace_hours
+    from database.models import Outlet
+
+    unparsed = Counter()
+    outlets = db.query(Outlet).order_by(Outlet.id).all()
+    for start in range(0, len(outlets), batch_size):
+        for outlet in replace_hours(db, outlets[start:start + batch_size]):
+            if outlet.operating_hours:
+                unparsed[outlet.operating_hours] += 1
+        db.commit()
+    if outlets:
+        # Hours indexes and answers cached on the old bitmaps are stale now
+        bump_dataset_version(db)
+        db.commit()
+    logging.info(f"Backfilled hours for {len(outlets)} outlets, "
+                 f"{sum(unparsed.values())} unparseable")
+    return unparsed
+
+
+def main(argv=None):
+    from database.session import create_db_engine, init_db, make_session_factory
+
+    parser = argparse.ArgumentParser(
+        description="Parse stored operating hours into intervals and weekly bitmaps")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args(argv)
+
+    engine = create_db_engine(args.database_url) if args.database_url else create_db_engine()
+    init_db(engine)
+    db = make_session_factory(engine)()
+    try:
+        unparsed = backfill(db)
+    finally:
+        db.close()
+        engine.dispose()
+
+    if unparsed:
+        print(f"{sum(unparsed.values())} outlets have hours that could not be parsed:")
+        for text, count in unparsed.most_common():
+            print(f"  {count:4d}  {text!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,6 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database.models import Base  # Corrected import path
-from database.crud import create_outlet
-from scraper.scraper import scrape_subway_outlets
+from scraper.main import main
 
-# Initialize database
-engine = create_engine("sqlite:///database/subway.db")
-Base.metadata.create_all(bind=engine)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Run scraper
-db = SessionLocal()
-scrape_subway_outlets(db)
-db.close()
+# Kept as an entry point for `python -m database.main`; the scraper only
+# runs when invoked, never on import.
+if __name__ == "__main__":
+    raise SystemExit(main())
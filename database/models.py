@@ -1,6 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, LargeBinary, Text
 from database.base import Base  # Corrected import path
 
+# Outlet.status values; closed outlets are kept as tombstones, never deleted
+OUTLET_OPEN = "open"
+OUTLET_CLOSED = "closed"
+
 
 class Outlet(Base):
     __tablename__ = "outlets"
@@ -8,6 +12,75 @@ class Outlet(Base):
     name = Column(String)
     address = Column(String)
     operating_hours = Column(String)
+    # 7x96 bitmask of 15-minute slots (see database.hours); NULL if unparseable
+    hours_bitmap = Column(LargeBinary)
     waze_link = Column(String)
     latitude = Column(Float)
     longitude = Column(Float)
+    phone = Column(String)
+    google_map_link = Column(String)
+    city = Column(String, index=True)
+    # Upsert keys: the site's data-id when present, else normalized name+address
+    location_id = Column(String, index=True)
+    natural_key = Column(String, index=True)
+    # Stable identity assigned by entity resolution (database.resolution)
+    canonical_id = Column(String, unique=True, index=True)
+    # Geohash cell of the coordinates; the blocking key for entity resolution
+    geohash = Column(String, index=True)
+    # sha1 over the scraped columns, compared in bulk to skip unchanged rows
+    content_hash = Column(String)
+    status = Column(String, nullable=False, default=OUTLET_OPEN,
+                    server_default=OUTLET_OPEN, index=True)
+    closed_at = Column(DateTime)
+
+
+class OutletHours(Base):
+    """Normalized opening intervals parsed from Outlet.operating_hours."""
+    __tablename__ = "outlet_hours"
+    id = Column(Integer, primary_key=True)
+    outlet_id = Column(Integer, ForeignKey("outlets.id", ondelete="CASCADE"),
+                       nullable=False, index=True)
+    day = Column(Integer, nullable=False)  # 0 = Monday
+    open_minute = Column(Integer, nullable=False)
+    close_minute = Column(Integer, nullable=False)
+
+
+class OutletOverlap(Base):
+    """Precomputed pairs of outlets whose catchments intersect.
+
+    Each pair is stored in both directions so an outlet's overlaps are a
+    primary-key range scan.
+    """
+    __tablename__ = "outlet_overlaps"
+    outlet_id = Column(Integer, ForeignKey("outlets.id", ondelete="CASCADE"), primary_key=True)
+    other_id = Column(Integer, ForeignKey("outlets.id", ondelete="CASCADE"), primary_key=True)
+    distance_km = Column(Float, nullable=False)
+
+
+class DatasetVersion(Base):
+    """Single-row counter bumped whenever a scrape changes outlet data.
+
+    The API derives ETag/Last-Modified from it and drops its response cache
+    when it moves.
+    """
+    __tablename__ = "dataset_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class ScrapeRun(Base):
+    """One scraper run and the diff it applied to the outlets table."""
+    __tablename__ = "scrape_runs"
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    status = Column(String, nullable=False, default="running")  # running, complete, partial, failed
+    engine = Column(String)
+    cities = Column(String)  # comma-separated
+    inserted = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    unchanged = Column(Integer, nullable=False, default=0)
+    closed = Column(Integer, nullable=False, default=0)
+    reopened = Column(Integer, nullable=False, default=0)
+    summary = Column(Text)  # JSON diff: which outlets were inserted/updated/closed
@@ -0,0 +1,219 @@
+import hashlib
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Optional, Set
+
+# ~150 m x 150 m cells at Malaysian latitudes, so a cell plus its eight
+# neighbours covers everything within MATCH_RADIUS_M of a point inside it
+GEOHASH_PRECISION = 7
+MATCH_RADIUS_M = 150.0
+# Weighted name/address/distance similarity needed to call two records one outlet
+MATCH_THRESHOLD = 0.8
+# A name-token block bigger than this is too common a word to narrow anything
+MAX_TOKEN_BLOCK = 200
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+_TOKEN = re.compile(r"\w+")
+# Common Malaysian address abbreviations, expanded so variants share a key.
+# Every text comparison (upsert keys, fuzzy matching, geocoding) uses these.
+ABBREVIATIONS = {
+    "jln": "jalan",
+    "jl": "jalan",
+    "tmn": "taman",
+    "bdr": "bandar",
+    "lrg": "lorong",
+    "kg": "kampung",
+    "sek": "seksyen",
+    "bt": "batu",
+    "kl": "kuala lumpur",
+}
+# Words nearly every outlet name carries
+_NAME_STOPWORDS = frozenset({"subway", "restaurant", "outlet", "the", "at", "sdn", "bhd"})
+
+
+def tokens(value: Optional[str]) -> List[str]:
+    """Normalized words of ``value``, with abbreviations expanded.
+
+    Unicode forms, case, punctuation and spacing are ignored.
+    """
+    if not value:
+        return []
+    text = unicodedata.normalize("NFKC", value).casefold()
+    words = []
+    for word in _TOKEN.findall(text):
+        words.extend(ABBREVIATIONS.get(word, word).split())
+    return words
+
+
+def name_tokens(name: Optional[str]) -> FrozenSet[str]:
+    return frozenset(t for t in tokens(name) if t not in _NAME_STOPWORDS)
+
+
+def natural_key(name: Optional[str], address: Optional[str]) -> str:
+    """Normalized name+address; records that share it are the same outlet.
+
+    The one identity of a card without a data-id: both engines dedup on
+    it and the writer upserts on it.
+    """
+    return f"{' '.join(sorted(name_tokens(name)))}|{' '.join(tokens(address))}"
+
+
+def canonical_id(record) -> str:
+    """Canonical id for a newly seen outlet: its data-id, else its entity key.
+
+    Once stored, an outlet keeps its canonical id even if the site later
+    gives it a data-id or rewords its address.
+    """
+    if record.location_id:
+        return f"id:{record.location_id}"
+    digest = hashlib.sha1(natural_key(record.name, record.address).encode("utf-8"))
+    return f"nk:{digest.hexdigest()[:16]}"
+
+
+def geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision: int):
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+@lru_cache(maxsize=4096)
+def geohash_neighbors(latitude: float, longitude: float,
+                      precision: int = GEOHASH_PRECISION) -> FrozenSet[str]:
+    """The cell containing the point and the eight cells around it.
+
+    Memoized: the writer blocks a record by these cells and then matches it
+    against them, so each point is expanded once.
+    """
+    dlat, dlng = _cell_size(precision)
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = min(90.0, max(-90.0, latitude + i * dlat))
+            lng = (longitude + j * dlng + 180.0) % 360.0 - 180.0
+            cells.add(geohash(lat, lng, precision))
+    return frozenset(cells)
+
+
+def _distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # Equirectangular is exact enough at the few hundred metres compared here
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371008.8 * math.hypot(x, y)
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Features:
+    __slots__ = ("names", "address", "numbers", "latitude", "longitude", "location_id")
+
+    def __init__(self, entity):
+        self.names = name_tokens(entity.name)
+        self.address = frozenset(tokens(entity.address))
+        # Lot/unit numbers: two outlets in one mall differ mainly here
+        self.numbers = frozenset(t for t in self.address if any(c.isdigit() for c in t))
+        self.latitude = entity.latitude
+        self.longitude = entity.longitude
+        self.location_id = entity.location_id
+
+    @property
+    def located(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+
+def similarity(a: _Features, b: _Features) -> float:
+    """0..1 score of how likely two outlets are the same; 0 rules it out."""
+    if a.location_id and b.location_id and a.location_id != b.location_id:
+        return 0.0
+    # Each has a lot/unit number the other lacks (an added postcode is fine)
+    if a.numbers - b.numbers and b.numbers - a.numbers:
+        return 0.0
+    parts = [(0.5, _jaccard(a.names, b.names))]
+    if a.address and b.address:
+        parts.append((0.3, _jaccard(a.address, b.address)))
+    if a.located and b.located:
+        distance = _distance_m(a.latitude, a.longitude, b.latitude, b.longitude)
+        if distance > MATCH_RADIUS_M:
+            return 0.0
+        parts.append((0.2, 1.0 - distance / MATCH_RADIUS_M))
+    return sum(w * s for w, s in parts) / sum(w for w, _ in parts)
+
+
+class EntityIndex:
+    """Blocks outlets by geohash cell and name token for fuzzy matching.
+
+    Entities are anything with name, address, latitude, longitude and
+    location_id attributes (OutletRecord, Outlet, or a row of those
+    columns). ``best_match`` only scores entities sharing a block with the
+    probe, so matching n records costs about n times the block size rather
+    than n squared.
+    """
+
+    def __init__(self):
+        self._entities: Dict[int, object] = {}
+        self._features: Dict[int, _Features] = {}
+        self._blocks: Dict[str, List[int]] = defaultdict(list)
+
+    def __len__(self):
+        return len(self._entities)
+
+    def add(self, entity):
+        key = len(self._entities)
+        features = _Features(entity)
+        self._entities[key] = entity
+        self._features[key] = features
+        if features.located:
+            self._blocks["g:" + geohash(features.latitude, features.longitude)].append(key)
+        for token in features.names:
+            self._blocks["t:" + token].append(key)
+
+    def _candidates(self, features: _Features) -> Set[int]:
+        if features.located:
+            cells = geohash_neighbors(features.latitude, features.longitude)
+            return {key for cell in cells for key in self._blocks.get("g:" + cell, ())}
+        found = set()
+        for token in features.names:
+            block = self._blocks.get("t:" + token, ())
+            if len(block) <= MAX_TOKEN_BLOCK:
+                found.update(block)
+        return found
+
+    def best_match(self, entity, skip: Optional[Callable[[object], bool]] = None,
+                   threshold: float = MATCH_THRESHOLD):
+        """The indexed entity most similar to ``entity``, if any reaches ``threshold``."""
+        features = _Features(entity)
+        best, best_score = None, threshold
+        for key in sorted(self._candidates(features)):
+            candidate = self._entities[key]
+            if skip is not None and skip(candidate):
+                continue
+            score = similarity(features, self._features[key])
+            if score >= best_score and (best is None or score > best_score):
+                best, best_score = candidate, score
+        return best
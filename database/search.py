@@ -0,0 +1,83 @@
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# External-content FTS5 index over the searchable outlet columns. Triggers
+# keep it in step with every write to outlets, like the R*Tree in spatial.
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS outlets_fts USING fts5(
+        name, address, operating_hours, city,
+        content='outlets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS outlets_fts_insert AFTER INSERT ON outlets
+    BEGIN
+        INSERT INTO outlets_fts(rowid, name, address, operating_hours, city)
+        VALUES (NEW.id, NEW.name, NEW.address, NEW.operating_hours, NEW.city);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS outlets_fts_delete AFTER DELETE ON outlets
+    BEGIN
+        INSERT INTO outlets_fts(outlets_fts, rowid, name, address, operating_hours, city)
+        VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.operating_hours, OLD.city);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS outlets_fts_update
+    AFTER UPDATE OF name, address, operating_hours, city ON outlets
+    BEGIN
+        INSERT INTO outlets_fts(outlets_fts, rowid, name, address, operating_hours, city)
+        VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.operating_hours, OLD.city);
+        INSERT INTO outlets_fts(rowid, name, address, operating_hours, city)
+        VALUES (NEW.id, NEW.name, NEW.address, NEW.operating_hours, NEW.city);
+    END""",
+]
+
+# bm25 column weights: name and area matter more than the hours text
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 5.0)
+
+
+def install_search_index(engine: Engine):
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        existed = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'outlets_fts'")).first()
+        for statement in SEARCH_DDL:
+            conn.execute(text(statement))
+        if not existed:
+            # Index rows written before the FTS table existed
+            conn.execute(text("INSERT INTO outlets_fts(outlets_fts) VALUES ('rebuild')"))
+
+
+def match_expression(terms: Iterable[str]) -> Optional[str]:
+    """AND of prefix matches; terms are quoted so user text is never FTS syntax."""
+    quoted = ['"%s"*' % term.replace('"', '""') for term in terms if term]
+    return " AND ".join(quoted) if quoted else None
+
+
+def search_outlet_ids(db: Session, terms: Iterable[str],
+                      limit: Optional[int] = None) -> List[int]:
+    """Ids of open outlets matching every term, best BM25 match first."""
+    expression = match_expression(terms)
+    if expression is None:
+        return []
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    sql = ("SELECT outlets_fts.rowid FROM outlets_fts "
+           "JOIN outlets ON outlets.id = outlets_fts.rowid AND outlets.status = 'open' "
+           f"WHERE outlets_fts MATCH :expression ORDER BY bm25(outlets_fts, {weights})")
+    params = {"expression": expression}
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+    return [row[0] for row in db.execute(text(sql), params)]
+
+
+def similar_outlet_ids(db: Session, terms: Iterable[str], limit: int = 20) -> List[int]:
+    """Ids of outlets, open or closed, matching any of the terms, best first."""
+    quoted = ['"%s"' % term.replace('"', '""') for term in terms if term]
+    if not quoted:
+        return []
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    sql = ("SELECT rowid FROM outlets_fts WHERE outlets_fts MATCH :expression "
+           f"ORDER BY bm25(outlets_fts, {weights}) LIMIT :limit")
+    return [row[0] for row in db.execute(
+        text(sql), {"expression": " OR ".join(quoted), "limit": limit})]
@@ -0,0 +1,119 @@
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from database.base import Base
+
+DATABASE_URL = "sqlite:///database/subway.db"
+
+# WAL lets readers keep going while the scraper writes, and NORMAL sync
+# only fsyncs at checkpoints instead of on every commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -20000,  # ~20 MB page cache
+    "foreign_keys": "ON",
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def _register_sql_functions(dbapi_connection, connection_record):
+    # Lets spatial queries filter and order by great-circle distance in SQL
+    from database.spatial import haversine_km
+
+    dbapi_connection.create_function("haversine_km", 4, haversine_km, deterministic=True)
+
+
+def create_db_engine(url: str = DATABASE_URL, **kwargs) -> Engine:
+    engine = create_engine(url, **kwargs)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+        event.listen(engine, "connect", _register_sql_functions)
+    return engine
+
+
+def _add_missing_columns(engine: Engine):
+    # create_all() never alters existing tables, so databases created by
+    # older versions of the models get new nullable columns added here
+    # (existing rows take the column's server default, if any).
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                default = ""
+                if column.server_default is not None:
+                    default = f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}{default}'))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def _backfill_resolution_keys(engine: Engine):
+    # Rows stored before entity resolution get their canonical id and
+    # geohash here. A duplicate whose id is already taken keeps NULL; scrapes
+    # resolve to the row that has it, so the duplicate is closed as unseen.
+    from database.resolution import canonical_id, geohash, natural_key
+
+    with engine.begin() as conn:
+        # Keys written by an older normalizer; unchanged outlets never rewrite them
+        stale = []
+        for row in conn.execute(text("SELECT id, name, address, natural_key FROM outlets")):
+            key = natural_key(row.name, row.address)
+            if row.natural_key != key:
+                stale.append({"id": row.id, "natural_key": key})
+        if stale:
+            conn.execute(text("UPDATE outlets SET natural_key = :natural_key WHERE id = :id"),
+                         stale)
+
+        rows = conn.execute(text(
+            "SELECT id, name, address, location_id, latitude, longitude, canonical_id "
+            "FROM outlets WHERE canonical_id IS NULL OR (geohash IS NULL "
+            "AND latitude IS NOT NULL AND longitude IS NOT NULL) "
+            "ORDER BY status != 'open', id")).all()
+        if not rows:
+            return
+        taken = {row[0] for row in conn.execute(text(
+            "SELECT canonical_id FROM outlets WHERE canonical_id IS NOT NULL"))}
+        updates = []
+        for row in rows:
+            cid = row.canonical_id
+            if cid is None and canonical_id(row) not in taken:
+                cid = canonical_id(row)
+                taken.add(cid)
+            located = row.latitude is not None and row.longitude is not None
+            updates.append({"id": row.id, "canonical_id": cid,
+                            "geohash": geohash(row.latitude, row.longitude) if located else None})
+        conn.execute(text(
+            "UPDATE outlets SET canonical_id = :canonical_id, geohash = :geohash "
+            "WHERE id = :id"), updates)
+
+
+def init_db(engine: Engine):
+    # Import for side effect: registers the models on Base.metadata
+    import database.models  # noqa: F401
+    from database.search import install_search_index
+    from database.spatial import install_spatial_index
+
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    _backfill_resolution_keys(engine)
+    install_spatial_index(engine)
+    install_search_index(engine)
+
+
+def make_session_factory(engine: Engine) -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,201 @@
+import logging
+import math
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database.models import OUTLET_OPEN, Outlet, OutletOverlap
+
+EARTH_RADIUS_KM = 6371.0088
+# Two outlets overlap when they are closer than this (catchment diameter)
+OVERLAP_DISTANCE_KM = 5.0
+
+# The R*Tree mirrors outlets.latitude/longitude through triggers, so every
+# write path (ORM, raw SQL, backfills) keeps it current.
+SPATIAL_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS outlets_rtree USING rtree(
+        id, min_lat, max_lat, min_lng, max_lng)""",
+    """CREATE TRIGGER IF NOT EXISTS outlets_rtree_insert AFTER INSERT ON outlets
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO outlets_rtree
+        VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS outlets_rtree_update
+    AFTER UPDATE OF latitude, longitude ON outlets
+    BEGIN
+        DELETE FROM outlets_rtree WHERE id = OLD.id;
+        INSERT INTO outlets_rtree
+        SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS outlets_rtree_delete AFTER DELETE ON outlets
+    BEGIN
+        DELETE FROM outlets_rtree WHERE id = OLD.id;
+    END""",
+]
+
+
+def install_spatial_index(engine: Engine):
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for statement in SPATIAL_DDL:
+            conn.execute(text(statement))
+        # Pick up rows written before the index existed
+        conn.execute(text(
+            "INSERT OR REPLACE INTO outlets_rtree "
+            "SELECT id, latitude, latitude, longitude, longitude FROM outlets "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL "
+            "AND id NOT IN (SELECT id FROM outlets_rtree)"))
+
+
+_HALF_RADIAN = math.pi / 360
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # Also called from SQL once per candidate pair, so kept to plain arithmetic
+    a = (math.sin((lat2 - lat1) * _HALF_RADIAN) ** 2
+         + math.cos(lat1 * 2 * _HALF_RADIAN) * math.cos(lat2 * 2 * _HALF_RADIAN)
+         * math.sin((lng2 - lng1) * _HALF_RADIAN) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lng, max_lng) enclosing a circle of radius_km."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def _candidates(db: Session, lat: float, lng: float, radius_km: float,
+                limit: Optional[int] = None) -> List[Tuple[int, float]]:
+    # The R*Tree narrows to the bounding box; SQLite trims the corners,
+    # orders by distance and stops after ``limit`` rows
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    # CROSS JOIN pins the R*Tree as the outer loop; left to itself SQLite
+    # drives the join from ix_outlets_status and scans the tree per outlet
+    query = (
+        "SELECT o.id, haversine_km(:lat, :lng, o.latitude, o.longitude) AS distance "
+        "FROM outlets_rtree r "
+        "CROSS JOIN outlets o ON o.id = r.id AND o.status = 'open' "
+        "WHERE r.max_lat >= :min_lat AND r.min_lat <= :max_lat "
+        "AND r.max_lng >= :min_lng AND r.min_lng <= :max_lng "
+        "AND distance <= :radius ORDER BY distance")
+    params = {"lat": lat, "lng": lng, "radius": radius_km,
+              "min_lat": min_lat, "max_lat": max_lat, "min_lng": min_lng, "max_lng": max_lng}
+    if limit is not None:
+        query += " LIMIT :limit"
+        params["limit"] = limit
+    return [(outlet_id, distance) for outlet_id, distance in db.execute(text(query), params)]
+
+
+def _with_outlets(db: Session, pairs: List[Tuple[int, float]]) -> List[Tuple[Outlet, float]]:
+    if not pairs:
+        return []
+    outlets = {o.id: o for o in db.query(Outlet).filter(Outlet.id.in_([i for i, _ in pairs]))}
+    return [(outlets[i], d) for i, d in pairs if i in outlets]
+
+
+def within_radius(db: Session, lat: float, lng: float, radius_km: float,
+                  limit: Optional[int] = None) -> List[Tuple[Outlet, float]]:
+    """Outlets within radius_km of a point, nearest first, with distances.
+
+    With ``limit``, only that many of the nearest are read.
+    """
+    return _with_outlets(db, _candidates(db, lat, lng, radius_km, limit))
+
+
+def nearest(db: Session, lat: float, lng: float, k: int = 5,
+            start_radius_km: float = 2.0,
+            max_radius_km: float = 2000.0) -> List[Tuple[Outlet, float]]:
+    """The k closest outlets to a point, found by widening the search box."""
+    radius = start_radius_km
+    while True:
+        found = _candidates(db, lat, lng, radius, limit=k)
+        if len(found) >= k or radius >= max_radius_km:
+            return _with_outlets(db, found)
+        radius *= 2
+
+
+def overlapping(db: Session, outlet_id: Optional[int] = None) -> List[OutletOverlap]:
+    """Precomputed overlap pairs, for one outlet or (each pair once) for all."""
+    query = db.query(OutletOverlap)
+    if outlet_id is not None:
+        query = query.filter(OutletOverlap.outlet_id == outlet_id)
+    else:
+        query = query.filter(OutletOverlap.outlet_id < OutletOverlap.other_id)
+    return query.order_by(OutletOverlap.outlet_id, OutletOverlap.distance_km).all()
+
+
+# Each target probes the R*Tree with its own box, the longitude margin
+# taken at the targets' highest latitude so it is wide enough for all. A
+# planar bound (as loose as that margin) drops the box corners before any
+# haversine_km call. A pair of two targets is found once, from its lower id.
+_OVERLAP_PAIRS_SQL = """
+INSERT INTO temp.overlap_pairs
+SELECT t.id, o.id, haversine_km(t.latitude, t.longitude, o.latitude, o.longitude) AS distance
+FROM temp.overlap_targets x
+CROSS JOIN outlets t ON t.id = x.id
+CROSS JOIN outlets_rtree r
+CROSS JOIN outlets o ON o.id = r.id AND o.status = 'open'
+WHERE r.max_lat >= t.latitude - :dlat AND r.min_lat <= t.latitude + :dlat
+AND r.max_lng >= t.longitude - :dlng AND r.min_lng <= t.longitude + :dlng
+AND (o.id > t.id OR o.id NOT IN temp.overlap_targets)
+AND (o.latitude - t.latitude) * (o.latitude - t.latitude) / (:dlat * :dlat)
+    + (o.longitude - t.longitude) * (o.longitude - t.longitude) / (:dlng * :dlng) <= 1.0
+AND distance <= :distance_km
+"""
+
+
+def refresh_overlaps(db: Session, outlet_ids: Optional[Iterable[int]] = None,
+                     distance_km: float = OVERLAP_DISTANCE_KM) -> int:
+    """Recompute overlap pairs for the given outlets (all when None).
+
+    Called at ingest time with the ids whose coordinates changed, so the
+    work is proportional to the change set rather than the table. The
+    pairs of the whole change set come from one R*Tree self-join.
+    """
+    if outlet_ids is None:
+        db.query(OutletOverlap).delete(synchronize_session=False)
+        targets = db.query(Outlet.id, Outlet.latitude, Outlet.longitude)
+    else:
+        ids = list(set(outlet_ids))
+        if not ids:
+            return 0
+        db.query(OutletOverlap).filter(
+            OutletOverlap.outlet_id.in_(ids) | OutletOverlap.other_id.in_(ids)
+        ).delete(synchronize_session=False)
+        targets = db.query(Outlet.id, Outlet.latitude, Outlet.longitude).filter(Outlet.id.in_(ids))
+
+    # Closed outlets lose their pairs above and get none back
+    targets = targets.filter(Outlet.latitude.isnot(None), Outlet.longitude.isnot(None),
+                             Outlet.status == OUTLET_OPEN).all()
+    if not targets:
+        return 0
+    dlat = math.degrees(distance_km / EARTH_RADIUS_KM)
+    widest = max(abs(lat) for _, lat, _ in targets)
+    dlng = bounding_box(min(widest + dlat, 90.0), 0.0, distance_km)[3]
+
+    # The whole change set is paired in one statement and stored in two
+    db.execute(text("CREATE TEMP TABLE IF NOT EXISTS overlap_targets (id INTEGER PRIMARY KEY)"))
+    db.execute(text("CREATE TEMP TABLE IF NOT EXISTS overlap_pairs "
+                    "(outlet_id INTEGER, other_id INTEGER, distance_km REAL)"))
+    try:
+        db.execute(text("INSERT INTO temp.overlap_targets VALUES (:id)"),
+                   [{"id": outlet_id} for outlet_id, _, _ in targets])
+        db.execute(text(_OVERLAP_PAIRS_SQL),
+                   {"dlat": dlat, "dlng": dlng, "distance_km": distance_km})
+        for columns in ("outlet_id, other_id", "other_id, outlet_id"):
+            db.execute(text(
+                "INSERT INTO outlet_overlaps (outlet_id, other_id, distance_km) "
+                f"SELECT {columns}, distance_km FROM temp.overlap_pairs"))
+        count = db.execute(text("SELECT count(*) FROM temp.overlap_pairs")).scalar()
+    finally:
+        db.execute(text("DELETE FROM temp.overlap_targets"))
+        db.execute(text("DELETE FROM temp.overlap_pairs"))
+    logging.info(f"Refreshed {count} outlet overlap pairs")
+    return count
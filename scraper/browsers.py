@@ -0,0 +1,215 @@
+import logging
+import multiprocessing.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from scraper.metrics import metrics
+
+# URL patterns the browser never fetches: the scraper reads text and data
+# attributes only, so images, media, fonts and analytics are dead weight.
+# File types are blocked from any host. Third parties are a denylist of
+# known trackers and ad networks, not a first/third-party split (Chrome's
+# setBlockedURLs only matches patterns), so a script from a host missing
+# here still loads; pass block_resources other patterns to change that.
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.mp4", "*.webm", "*.ogg", "*.mp3", "*.wav",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*connect.facebook.net*", "*hotjar.com*",
+    "*clarity.ms*", "*tiktok.com*",
+]
+
+
+def chrome_options(headless: bool = True):
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    # A fixed viewport instead of --start-maximized, which headless ignores
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-notifications")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    # /dev/shm is tiny in containers; several browsers per host exhaust it
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+    })
+    return options
+
+
+def block_resources(driver, patterns: Optional[List[str]] = None):
+    """Have Chrome drop requests matching ``patterns`` before they are sent."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs",
+                           {"urls": BLOCKED_URL_PATTERNS if patterns is None else patterns})
+
+
+def launch_chrome(headless: bool = True):
+    from selenium import webdriver
+
+    with metrics.phase("browser_launch"):
+        driver = webdriver.Chrome(options=chrome_options(headless))
+        block_resources(driver)
+    metrics.incr("browser.launches")
+    return driver
+
+
+@dataclass
+class BrowserSession:
+    driver: object
+    created: float = field(default_factory=time.monotonic)
+    pages: int = 0
+    leases: int = 0
+
+
+class BrowserPool:
+    """Keeps up to ``size`` Chrome instances warm between scrapes.
+
+    ``lease()`` hands out an idle browser after a cheap health check,
+    starting one only when none is idle and the pool has room, and
+    otherwise waits for a browser to be returned. A browser is quit and
+    replaced once it has navigated to ``max_pages`` pages, is older than
+    ``max_age`` seconds, failed a health check, or was returned after an
+    error. Idle browsers sit on about:blank with cookies cleared, so they
+    hold no page memory and every lease starts from a clean visit.
+    """
+
+    def __init__(self, size: int = 1, max_pages: int = 100, max_age: float = 1800.0,
+                 factory: Optional[Callable[[], object]] = None, headless: bool = True):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.factory = factory or (lambda: launch_chrome(headless))
+        self._idle: List[BrowserSession] = []
+        self._leased = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+    @staticmethod
+    def _healthy(session: BrowserSession) -> bool:
+        try:
+            session.driver.execute_script("return 1")
+            return True
+        except Exception as e:
+            logging.warning(f"Discarding unresponsive browser: {str(e)}")
+            return False
+
+    def _expired(self, session: BrowserSession) -> bool:
+        return (session.pages >= self.max_pages
+                or time.monotonic() - session.created >= self.max_age)
+
+    def _quit(self, session: BrowserSession):
+        metrics.incr("browser.recycled")
+        try:
+            session.driver.quit()
+        except Exception as e:
+            logging.warning(f"Could not quit browser: {str(e)}")
+
+    def acquire(self, timeout: Optional[float] = None) -> BrowserSession:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                if self._idle:
+                    session = self._idle.pop()
+                elif self._leased < self.size:
+                    session = None
+                else:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No browser free after {timeout}s")
+                    self._lock.wait(remaining)
+                    continue
+                self._leased += 1
+
+            # Health checks and launches happen outside the lock
+            try:
+                if session is not None and (self._expired(session) or not self._healthy(session)):
+                    self._quit(session)
+                    session = None
+                if session is None:
+                    session = BrowserSession(self.factory())
+                else:
+                    metrics.incr("browser.reused")
+            except Exception:
+                self._return_slot()
+                raise
+            session.leases += 1
+            return session
+
+    def _return_slot(self):
+        with self._lock:
+            self._leased -= 1
+            self._lock.notify()
+
+    def release(self, session: BrowserSession, failed: bool = False):
+        keep = not failed and not self._closed and not self._expired(session)
+        if keep:
+            try:
+                # Drop the page (a long listing holds a lot of DOM) and its state
+                session.driver.delete_all_cookies()
+                session.driver.get("about:blank")
+            except Exception as e:
+                logging.warning(f"Could not reset browser: {str(e)}")
+                keep = False
+        if not keep:
+            self._quit(session)
+        with self._lock:
+            self._leased -= 1
+            if keep:
+                self._idle.append(session)
+            self._lock.notify()
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        """Yield a BrowserSession; the caller adds its page navigations to ``pages``."""
+        session = self.acquire(timeout)
+        failed = False
+        try:
+            yield session
+        except Exception:
+            # Whatever broke may have left the browser in a bad state
+            failed = True
+            raise
+        finally:
+            self.release(session, failed=failed)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for session in idle:
+            self._quit(session)
+
+
+_shared_pool: Optional[BrowserPool] = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool() -> BrowserPool:
+    """This process's pool, reused by every Selenium scrape it runs.
+
+    A scrape holds one browser at a time and a process runs one scrape at
+    a time, so by default the pool keeps a single browser;
+    SUBWAY_BROWSER_POOL_SIZE keeps more, for callers that run scrapes on
+    several threads. SUBWAY_HEADLESS=0 shows them, for debugging.
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool(size=int(os.environ.get("SUBWAY_BROWSER_POOL_SIZE", "1")),
+                                       headless=os.environ.get("SUBWAY_HEADLESS") != "0")
+            # Unlike atexit, also runs when a multiprocessing worker exits,
+            # so parallel scrapes do not leave Chrome processes behind
+            multiprocessing.util.Finalize(None, _shared_pool.close, exitpriority=10)
+        return _shared_pool
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, List, Optional
+
+CHECKPOINT_DIR = "database/checkpoints"
+
+
+@dataclass
+class ScrapeCheckpoint:
+    """How far a city's scrape got, enough to pick it up again."""
+
+    city: str
+    pages: int = 0
+    # DOM cursor: how many outlet cards had been extracted, in page order
+    cards: int = 0
+    # Card keys (data-id, else entity key) already yielded
+    seen: List[str] = field(default_factory=list)
+    # Database ids the writer had stored, so tombstoning still sees them
+    outlet_ids: List[int] = field(default_factory=list)
+    updated_at: float = 0.0
+
+
+def _slug(city: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", city.casefold()).strip("-") or "city"
+
+
+class CheckpointStore:
+    """One JSON file per city, replaced atomically on every save."""
+
+    def __init__(self, directory: str = CHECKPOINT_DIR):
+        self.directory = directory
+
+    def path(self, city: str) -> str:
+        return os.path.join(self.directory, f"{_slug(city)}.json")
+
+    def load(self, city: str) -> Optional[ScrapeCheckpoint]:
+        try:
+            with open(self.path(city), encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint for {city}: {str(e)}")
+            return None
+        if data.get("city") != city:
+            return None
+        return ScrapeCheckpoint(**data)
+
+    def save(self, checkpoint: ScrapeCheckpoint):
+        os.makedirs(self.directory, exist_ok=True)
+        checkpoint.updated_at = time.time()
+        path = self.path(checkpoint.city)
+        part = path + ".part"
+        with open(part, "w", encoding="utf-8") as f:
+            json.dump(asdict(checkpoint), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(part, path)
+
+    def clear(self, city: str):
+        try:
+            os.remove(self.path(city))
+        except FileNotFoundError:
+            pass
+
+
+class Checkpointer:
+    """Tracks one city's progress and saves it every N pages or outlets.
+
+    ``before_save`` runs ahead of each save. The scraper uses it to commit
+    the database writer, so a checkpoint never claims outlets that were not
+    stored yet.
+    """
+
+    def __init__(self, store: CheckpointStore, checkpoint: ScrapeCheckpoint,
+                 every_pages: int = 1, every_outlets: int = 100,
+                 before_save: Optional[Callable[[ScrapeCheckpoint], None]] = None):
+        self.store = store
+        self.checkpoint = checkpoint
+        self.every_pages = every_pages
+        self.every_outlets = every_outlets
+        self.before_save = before_save
+        self.resumed = checkpoint.cards > 0
+        self.replayed = False
+        self._seen = set(checkpoint.seen)
+        self._pages_since = 0
+        self._outlets_since = 0
+
+    @classmethod
+    def start(cls, store: CheckpointStore, city: str, resume: bool = False,
+              **kwargs) -> "Checkpointer":
+        checkpoint = store.load(city) if resume else None
+        if checkpoint is None:
+            store.clear(city)
+            checkpoint = ScrapeCheckpoint(city)
+        else:
+            logging.info(
+                f"Resuming {city} from page {checkpoint.pages} "
+                f"({checkpoint.cards} cards, {len(checkpoint.seen)} outlets seen)")
+        return cls(store, checkpoint, **kwargs)
+
+    def replay(self) -> int:
+        """The DOM cursor to scroll back to; the browser resumes from it."""
+        self.replayed = True
+        return self.checkpoint.cards
+
+    def is_seen(self, key: str) -> bool:
+        return key in self._seen
+
+    def outlet(self, key: str):
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self.checkpoint.seen.append(key)
+        self._outlets_since += 1
+        if self._outlets_since >= self.every_outlets:
+            self.save()
+
+    def page(self, cards: int):
+        """Record one more page, with the DOM cursor after extracting it."""
+        self.checkpoint.pages += 1
+        self.checkpoint.cards = cards
+        self._pages_since += 1
+        if self._pages_since >= self.every_pages:
+            self.save()
+
+    def save(self):
+        if self.before_save is not None:
+            self.before_save(self.checkpoint)
+        self.store.save(self.checkpoint)
+        self._pages_since = self._outlets_since = 0
+
+    def finish(self):
+        """The city was scraped to the end; the next run starts fresh."""
+        self.store.clear(self.checkpoint.city)
@@ -0,0 +1,177 @@
+import csv
+import json
+import logging
+import os
+from typing import Dict, Optional, Type
+
+# Columns and order of the original subway_locations.csv (OutletRecord.to_dict)
+EXPORT_COLUMNS = ("id", "name", "address", "hours", "phone", "latitude",
+                  "longitude", "google_map", "waze_map", "city")
+
+
+def _fsync_dir(path: str):
+    # Makes the rename itself durable; not supported everywhere (e.g. Windows)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Exporter:
+    """Writes outlet records to ``path`` as they are scraped.
+
+    Rows go to ``<path>.part`` and are fsynced every ``checkpoint_every``
+    records, so memory stays bounded and a crash loses at most one
+    checkpoint. ``close()`` renames the finished file over ``path``
+    atomically; readers never see a half-written export. After a failure
+    the ``.part`` file is left behind with every checkpointed row.
+    """
+
+    binary = False
+
+    def __init__(self, path: str, checkpoint_every: int = 1000):
+        self.path = path
+        self.part_path = path + ".part"
+        self.checkpoint_every = checkpoint_every
+        self.count = 0
+        self._since_checkpoint = 0
+        self._file = open(self.part_path, "wb" if self.binary else "w",
+                          **({} if self.binary else {"newline": "", "encoding": "utf-8"}))
+        self._closed = False
+
+    def write(self, record):
+        self._write_row(record.to_dict())
+        self.count += 1
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _write_row(self, row: dict):
+        raise NotImplementedError
+
+    def _flush_rows(self):
+        """Hand buffered rows to the file; formats that batch override this."""
+
+    def checkpoint(self):
+        self._flush_rows()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._since_checkpoint = 0
+
+    def _finish(self):
+        """Write any trailer before the file is closed."""
+
+    def _seal(self):
+        self._closed = True
+        try:
+            self._flush_rows()
+            self._finish()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+    def close(self) -> int:
+        if self._closed:
+            return self.count
+        self._seal()
+        os.replace(self.part_path, self.path)
+        _fsync_dir(self.path)
+        logging.info(f"Exported {self.count} outlets to {self.path}")
+        return self.count
+
+    def abort(self):
+        if self._closed:
+            return
+        # Still a complete, readable file, just not renamed into place
+        self._seal()
+        logging.warning(
+            f"Export to {self.path} aborted; {self.count} rows kept in {self.part_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class CsvExporter(Exporter):
+    def __init__(self, path: str, checkpoint_every: int = 1000):
+        super().__init__(path, checkpoint_every)
+        self._writer = csv.DictWriter(self._file, fieldnames=EXPORT_COLUMNS)
+        self._writer.writeheader()
+
+    def _write_row(self, row: dict):
+        self._writer.writerow(row)
+
+
+class JsonlExporter(Exporter):
+    def _write_row(self, row: dict):
+        self._file.write(json.dumps(row, ensure_ascii=False))
+        self._file.write("\n")
+
+
+class ParquetExporter(Exporter):
+    """Buffers ``row_group_size`` rows and writes each batch as a row group."""
+
+    binary = True
+
+    def __init__(self, path: str, checkpoint_every: int = 1000,
+                 row_group_size: Optional[int] = None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(path, checkpoint_every)
+        self._pa = pa
+        self.row_group_size = row_group_size or checkpoint_every
+        self.schema = pa.schema([
+            (column, pa.float64() if column in ("latitude", "longitude") else pa.string())
+            for column in EXPORT_COLUMNS
+        ])
+        self._rows = {column: [] for column in EXPORT_COLUMNS}
+        self._buffered = 0
+        self._writer = pq.ParquetWriter(self._file, self.schema)
+
+    def _write_row(self, row: dict):
+        for column in EXPORT_COLUMNS:
+            self._rows[column].append(row.get(column))
+        self._buffered += 1
+        if self._buffered >= self.row_group_size:
+            self._flush_rows()
+
+    def _flush_rows(self):
+        if not self._buffered:
+            return
+        table = self._pa.Table.from_pydict(self._rows, schema=self.schema)
+        self._writer.write_table(table, row_group_size=self._buffered)
+        self._rows = {column: [] for column in EXPORT_COLUMNS}
+        self._buffered = 0
+
+    def _finish(self):
+        # Writes the footer; without it the file is unreadable
+        self._writer.close()
+
+
+EXPORTERS: Dict[str, Type[Exporter]] = {
+    "csv": CsvExporter,
+    "jsonl": JsonlExporter,
+    "parquet": ParquetExporter,
+}
+
+
+def open_exporter(path: str, fmt: Optional[str] = None, **kwargs) -> Exporter:
+    """Exporter for ``path``, with the format taken from its suffix by default."""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {tuple(EXPORTERS)}")
+    return EXPORTERS[fmt](path, **kwargs)
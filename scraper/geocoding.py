@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database.resolution import tokens
+
+Coordinates = Tuple[float, float]
+
+GEOCODE_CACHE_PATH = "database/geocode_cache.db"
+DEFAULT_TTL = 90 * 24 * 3600  # addresses rarely move; re-check quarterly
+NEGATIVE_TTL = 7 * 24 * 3600  # retry unresolvable addresses weekly
+
+_SEPARATORS = re.compile(r"\s*[,;]\s*")
+
+
+def normalize_address(address: Optional[str]) -> str:
+    """Canonical form of an address used as the cache and dedup key.
+
+    Words are normalized as for entity resolution; the comma-separated
+    parts are kept, for the provider's sake.
+    """
+    if not address:
+        return ""
+    parts = (" ".join(tokens(part)) for part in _SEPARATORS.split(address))
+    return ", ".join(part for part in parts if part)
+
+
+def address_hash(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class GeocodeCache:
+    """Persistent address hash -> coordinates store with TTL eviction.
+
+    Misses are stored too (with NULL coordinates) so that an address the
+    provider cannot resolve is not looked up again on every run.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 negative_ttl: float = NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            " address_hash TEXT PRIMARY KEY,"
+            " address TEXT NOT NULL,"
+            " latitude REAL,"
+            " longitude REAL,"
+            " provider TEXT NOT NULL,"
+            " created_at REAL NOT NULL)")
+        self.conn.commit()
+
+    def _is_fresh(self, latitude, created_at: float, now: float) -> bool:
+        ttl = self.ttl if latitude is not None else self.negative_ttl
+        return now - created_at < ttl
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, Optional[Coordinates]]:
+        """Fresh entries only; a key mapped to None is a cached miss."""
+        hashes = list(hashes)
+        found = {}
+        now = time.time()
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                "SELECT address_hash, latitude, longitude, created_at "
+                f"FROM geocode_cache WHERE address_hash IN ({placeholders})", chunk)
+            for key, latitude, longitude, created_at in rows:
+                if self._is_fresh(latitude, created_at, now):
+                    found[key] = (latitude, longitude) if latitude is not None else None
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, str, Optional[Coordinates], str]]):
+        """Store (hash, normalized address, coordinates or None, provider) rows."""
+        now = time.time()
+        rows = [
+            (key, address, coords[0] if coords else None,
+             coords[1] if coords else None, provider, now)
+            for key, address, coords, provider in entries
+        ]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO geocode_cache "
+            "(address_hash, address, latitude, longitude, provider, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        cursor = self.conn.execute(
+            "DELETE FROM geocode_cache WHERE "
+            "(latitude IS NOT NULL AND created_at < ?) OR "
+            "(latitude IS NULL AND created_at < ?)",
+            (now - self.ttl, now - self.negative_ttl))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
+
+
+class GeocodingProvider:
+    """Resolves one normalized address; subclasses implement ``geocode``."""
+
+    name = "base"
+
+    async def geocode(self, address: str) -> Optional[Coordinates]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class StubProvider(GeocodingProvider):
+    """Offline provider backed by a dict of normalized address -> coordinates."""
+
+    name = "stub"
+
+    def __init__(self, known: Optional[Dict[str, Coordinates]] = None):
+        self.known = {normalize_address(k): v for k, v in (known or {}).items()}
+        self.calls: List[str] = []
+
+    async def geocode(self, address: str) -> Optional[Coordinates]:
+        self.calls.append(address)
+        return self.known.get(address)
+
+
+class NominatimProvider(GeocodingProvider):
+    """OpenStreetMap Nominatim; its usage policy allows one request a second."""
+
+    name = "nominatim"
+    URL = "https://nominatim.openstreetmap.org/search"
+
+    def __init__(self, user_agent: str = "subway-scraper/1.0", timeout: float = 10.0):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.client = None
+
+    async def geocode(self, address: str) -> Optional[Coordinates]:
+        if self.client is None:
+            # Created lazily so the pool belongs to the geocoder's event loop
+            import httpx
+
+            self.client = httpx.AsyncClient(
+                headers={"User-Agent": self.user_agent}, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4))
+        response = await self.client.get(self.URL, params={
+            "q": address, "format": "json", "limit": 1, "countrycodes": "my"})
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across all tasks."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Geocoder:
+    """Resolves addresses through the cache first, then the provider.
+
+    Addresses are normalized and deduplicated before anything is looked up,
+    so each distinct address costs at most one provider call per TTL.
+    """
+
+    def __init__(self, provider: GeocodingProvider, cache: GeocodeCache,
+                 concurrency: int = 4, rate: float = 1.0):
+        self.provider = provider
+        self.cache = cache
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.cache_hits = 0
+        self.lookups = 0
+        self.failures = 0
+        # One loop for the geocoder's lifetime keeps provider connections reusable
+        self._loop = asyncio.new_event_loop()
+
+    async def _resolve(self, pending: Dict[str, str]) -> Dict[str, Optional[Coordinates]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        resolved = {}
+
+        async def lookup(key: str, address: str):
+            async with semaphore:
+                await self.limiter.wait()
+                try:
+                    resolved[key] = await self.provider.geocode(address)
+                except Exception as e:
+                    # Leave it uncached so the next run tries again
+                    self.failures += 1
+                    logging.warning(f"Geocoding failed for {address!r}: {str(e)}")
+
+        await asyncio.gather(*(lookup(k, a) for k, a in pending.items()))
+        return resolved
+
+    async def geocode_many_async(self, addresses: Iterable[Optional[str]]) -> Dict[str, Optional[Coordinates]]:
+        """Map each distinct input address to coordinates (or None)."""
+        keys = {}
+        for address in addresses:
+            normalized = normalize_address(address)
+            if normalized:
+                keys[address] = (address_hash(normalized), normalized)
+
+        unique = {key: normalized for key, normalized in keys.values()}
+        cached = self.cache.get_many(unique)
+        self.cache_hits += len(cached)
+        pending = {key: unique[key] for key in unique if key not in cached}
+
+        if pending:
+            self.lookups += len(pending)
+            resolved = await self._resolve(pending)
+            self.cache.put_many(
+                (key, pending[key], coords, self.provider.name)
+                for key, coords in resolved.items())
+            cached.update(resolved)
+        logging.info(
+            f"Geocoded {len(unique)} distinct addresses: {len(unique) - len(pending)} "
+            f"from cache, {len(pending)} looked up")
+        return {address: cached.get(key) for address, (key, _) in keys.items()}
+
+    def geocode_many(self, addresses: Iterable[Optional[str]]) -> Dict[str, Optional[Coordinates]]:
+        return self._loop.run_until_complete(self.geocode_many_async(addresses))
+
+    def close(self):
+        self._loop.run_until_complete(self.provider.aclose())
+        self._loop.close()
+        self.cache.close()
+
+
+def geocode_missing_outlets(db, geocoder: Geocoder, batch_size: int = 500) -> int:
+    """Fill coordinates for open outlets that have none; returns rows updated.
+
+    Coordinates go in through OutletWriter.locate, so each batch's geohashes,
+    content hashes, overlap pairs and dataset version change in one commit.
+    """
+    from database.crud import OutletWriter
+    from database.models import OUTLET_OPEN, Outlet
+
+    # Closed outlets keep their last known coordinates; none are looked up
+    outlets = (db.query(Outlet)
+               .filter(Outlet.status == OUTLET_OPEN)
+               .filter((Outlet.latitude.is_(None)) | (Outlet.longitude.is_(None)))
+               .filter(Outlet.address.isnot(None))
+               .all())
+    writer = OutletWriter(db)
+    updated = 0
+    for start in range(0, len(outlets), batch_size):
+        batch = outlets[start:start + batch_size]
+        coords = geocoder.geocode_many(o.address for o in batch)
+        for outlet in batch:
+            found = coords.get(outlet.address)
+            if found:
+                writer.locate(outlet, *found)
+                updated += 1
+        writer.commit()
+    logging.info(f"Geocoded {updated} of {len(outlets)} outlets without coordinates")
+    return updated
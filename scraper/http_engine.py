@@ -0,0 +1,277 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin
+
+import requests
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from scraper.records import ListingProgress, OutletRecord
+
+FIND_A_SUBWAY_URL = "https://subway.com.my/find-a-subway"
+
+HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "en-MY,en;q=0.9",
+}
+
+# Class on the card's child element -> record field
+_TEXT_FIELDS = {
+    "address": "address",
+    "phone": "phone",
+    "hours": "hours",
+}
+_LINK_FIELDS = {
+    "waze": "waze_map",
+    "google-map": "google_map",
+}
+
+
+def make_session(pool_size: int = 10, retries: int = 2) -> requests.Session:
+    """A keep-alive session with a connection pool and retry on 5xx."""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def _classes(element) -> set:
+    return set((element.get("class") or "").split())
+
+
+def _text(element) -> str:
+    # Same shape as Selenium's .text: one line per <br>, runs of spaces collapsed
+    lines = (" ".join(line.split()) for line in element.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _parse_card(card) -> Optional[OutletRecord]:
+    fields = {}
+    # One walk over the card's subtree picks up every field
+    for element in card.iter():
+        if not isinstance(element.tag, str):
+            continue
+        classes = _classes(element)
+        if element.tag == "h3" and "name" not in fields:
+            fields["name"] = _text(element)
+        for css_class, field in _TEXT_FIELDS.items():
+            if css_class in classes and field not in fields:
+                fields[field] = _text(element)
+        for css_class, field in _LINK_FIELDS.items():
+            if css_class in classes and field not in fields:
+                anchor = next(element.iter("a"), None)
+                if anchor is not None and anchor.get("href"):
+                    fields[field] = anchor.get("href")
+
+    if not fields.get("name"):
+        return None
+    return OutletRecord(
+        name=fields["name"],
+        address=fields.get("address"),
+        hours=fields.get("hours"),
+        phone=fields.get("phone"),
+        latitude=card.get("data-latitude"),
+        longitude=card.get("data-longitude"),
+        google_map=fields.get("google_map"),
+        waze_map=fields.get("waze_map"),
+        location_id=card.get("data-id"),
+    )
+
+
+def _document(markup, base_url: str):
+    document = lxml_html.fromstring(markup)
+    document.make_links_absolute(base_url, resolve_base_href=True)
+    for br in document.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+    return document
+
+
+def _cards(document) -> List[OutletRecord]:
+    records = []
+    for card in document.xpath(
+            "//div[contains(concat(' ', normalize-space(@class), ' '), ' outlet-card ')]"):
+        record = _parse_card(card)
+        if record is None:
+            logging.debug("Skipping outlet card without a name")
+            continue
+        records.append(record)
+    return records
+
+
+@dataclass(frozen=True)
+class CardEndpoint:
+    """How a listing page loads the cards it did not render server-side.
+
+    This protocol is assumed, not taken from the live site: it is the one
+    benchmarks/fixture_server.py serves. The list container names its city,
+    how many cards it rendered and how many the city has in data attributes,
+    and ``path`` answers ``?city=&offset=`` with a card fragment and the
+    next offset in ``next_offset_header``. A site that pages differently
+    needs a different CardEndpoint. A page without the container is read
+    as it is.
+    """
+
+    path: str = "/api/cards"
+    next_offset_header: str = "X-Next-Offset"
+    list_class: str = "outlet-list"
+    city_attribute: str = "data-city"
+    offset_attribute: str = "data-offset"
+    total_attribute: str = "data-total"
+
+
+CARD_ENDPOINT = CardEndpoint()
+
+
+@dataclass
+class _ListingHints:
+    city: Optional[str]  # slug the page passes to the card endpoint
+    offset: Optional[int]  # cards rendered server-side
+    total: Optional[int]  # outlets the city has in all, when the page says
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _listing_hints(document, endpoint: CardEndpoint) -> Optional[_ListingHints]:
+    # The list container says how far it got and how many outlets there are
+    for listing in document.xpath(
+            f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {endpoint.list_class} ')]"):
+        return _ListingHints(listing.get(endpoint.city_attribute),
+                             _int(listing.get(endpoint.offset_attribute)),
+                             _int(listing.get(endpoint.total_attribute)))
+    return None
+
+
+def parse_outlet_cards(markup, base_url: str = FIND_A_SUBWAY_URL) -> List[OutletRecord]:
+    """Parse every ``div.outlet-card`` in a page or HTML fragment."""
+    if not markup or not markup.strip():
+        return []
+    return _cards(_document(markup, base_url))
+
+
+def fetch_outlets(urls: Optional[Iterable[str]] = None,
+                  session: Optional[requests.Session] = None,
+                  timeout: float = 15,
+                  progress: Optional[ListingProgress] = None,
+                  endpoint: CardEndpoint = CARD_ENDPOINT) -> List[OutletRecord]:
+    """Fetch the find-a-subway page (and any listing URLs) without a browser.
+
+    A page may render only the first cards of its city; the rest are read
+    from ``endpoint`` (see CardEndpoint) until the next offset reaches the
+    total, or until a page comes back empty with no next offset.
+    Returns an empty list when the markup carries no outlet cards, which is
+    the signal for callers to fall back to the Selenium engine. With
+    ``progress``, records the advertised total and whether the whole
+    listing was fetched: every outlet in the total, or every page the
+    endpoint had when the page gives no total.
+    """
+    urls = list(urls or [FIND_A_SUBWAY_URL])
+    own_session = session is None
+    session = session or make_session()
+    records = []
+    seen = set()
+    total = None
+    resume_from = None  # (page URL, hints) of the last page with a list
+    exhausted = False  # the endpoint answered with an empty last page
+
+    def add(cards: List[OutletRecord]):
+        for record in cards:
+            if record.key in seen:
+                continue
+            seen.add(record.key)
+            records.append(record)
+
+    try:
+        for url in urls:
+            logging.info(f"Fetching {url}")
+            response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+            cards = []
+            if response.content and response.content.strip():
+                document = _document(response.content, response.url)
+                cards = _cards(document)
+                hints = _listing_hints(document, endpoint)
+                if hints is not None:
+                    total = hints.total if total is None else total
+                    resume_from = response.url, hints
+            logging.info(f"Parsed {len(cards)} outlet cards from {url}")
+            add(cards)
+
+        if resume_from is not None and (total is None or len(records) < total):
+            page_url, hints = resume_from
+            offset = hints.offset
+            while hints.city and offset is not None and (total is None or offset < total):
+                try:
+                    response = session.get(urljoin(page_url, endpoint.path),
+                                           params={"city": hints.city, "offset": offset},
+                                           timeout=timeout)
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    # Keep what the page gave; the listing just stays incomplete
+                    logging.warning(f"Stopped reading {endpoint.path} at {offset}: {str(e)}")
+                    break
+                cards = parse_outlet_cards(response.content, base_url=response.url)
+                add(cards)
+                next_offset = _int(response.headers.get(endpoint.next_offset_header))
+                if not cards and (next_offset is None or next_offset <= offset):
+                    exhausted = True
+                if next_offset is None or next_offset <= offset:
+                    break
+                offset = next_offset
+            logging.info(f"Read {len(records)} of {total or 'an unknown number of'} "
+                         f"outlets from {endpoint.path}")
+    finally:
+        if own_session:
+            session.close()
+    if progress is not None:
+        progress.total = total
+        progress.complete = (len(records) >= total) if total is not None else exhausted
+    return records
+
+
+def parse_city_list(markup, base_url: str = FIND_A_SUBWAY_URL) -> Dict[str, Optional[str]]:
+    """Read the ``#fp_locationlist`` menu into {city name: listing URL or None}."""
+    if not markup or not markup.strip():
+        return {}
+    document = lxml_html.fromstring(markup)
+    document.make_links_absolute(base_url, resolve_base_href=True)
+    cities = {}
+    for menu in document.xpath("//*[@id='fp_locationlist']"):
+        for item in menu.iter():
+            if not isinstance(item.tag, str) or len(item):
+                continue
+            name = " ".join(item.text_content().split())
+            if not name or name in cities:
+                continue
+            url = item.get("href") or item.get("data-url")
+            cities[name] = urljoin(base_url, url) if url else None
+    return cities
+
+
+def discover_cities(session: Optional[requests.Session] = None,
+                    timeout: float = 15) -> Dict[str, Optional[str]]:
+    own_session = session is None
+    session = session or make_session()
+    try:
+        response = session.get(FIND_A_SUBWAY_URL, timeout=timeout)
+        response.raise_for_status()
+        cities = parse_city_list(response.content, base_url=response.url)
+    finally:
+        if own_session:
+            session.close()
+    logging.info(f"Discovered {len(cities)} cities in #fp_locationlist")
+    return cities
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from scraper.metrics import metrics
+
+SELECTOR_CACHE_PATH = "database/selector_cache.json"
+
+# Checks every candidate in one round-trip and returns [index, element] for
+# the first match that is rendered and enabled, i.e. what Selenium's
+# element_to_be_clickable would accept; null when nothing qualifies yet.
+PROBE_SELECTORS_JS = """
+const candidates = arguments[0];
+const usable = el => {
+    if (!el || el.disabled) return false;
+    const style = window.getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.pointerEvents === 'none') return false;
+    const rect = el.getBoundingClientRect();
+    return rect.width > 0 && rect.height > 0;
+};
+for (let i = 0; i < candidates.length; i++) {
+    const selector = candidates[i];
+    let found = [];
+    try {
+        if (selector.startsWith('//') || selector.startsWith('(')) {
+            const result = document.evaluate(
+                selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let j = 0; j < result.snapshotLength; j++) found.push(result.snapshotItem(j));
+        } else {
+            found = document.querySelectorAll(selector);
+        }
+    } catch (e) {
+        continue;  // a selector the browser cannot parse just never matches
+    }
+    for (const el of found) {
+        if (usable(el)) return [i, el];
+    }
+}
+return null;
+"""
+
+
+class SelectorCache:
+    """Winning selector per UI step, kept in a small JSON file between runs.
+
+    Each step also counts hits (the cached selector won again) and misses
+    (no cached selector, a different one won, or nothing matched), so
+    markup drift shows up in the file as well as in the run's metrics.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        # The env var reaches worker processes spawned for multi-city runs
+        self.path = path or os.environ.get("SUBWAY_SELECTOR_CACHE") or SELECTOR_CACHE_PATH
+        self.winners: Dict[str, str] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable selector cache {self.path}: {str(e)}")
+            return
+        self.winners = dict(data.get("winners", {}))
+        self.stats = {step: dict(s) for step, s in data.get("stats", {}).items()}
+
+    def get(self, step: str) -> Optional[str]:
+        return self.winners.get(step)
+
+    def record(self, step: str, selector: Optional[str], hit: bool):
+        stats = self.stats.setdefault(step, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+        if selector is not None:
+            self.winners[step] = selector
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Per-process part file: parallel workers may save at the same time
+        part = f"{self.path}.{os.getpid()}.part"
+        with open(part, "w", encoding="utf-8") as f:
+            json.dump({"winners": self.winners, "stats": self.stats}, f, indent=2, sort_keys=True)
+        os.replace(part, self.path)
+
+
+class SelectorResolver:
+    """Finds the element for a UI step among several candidate selectors.
+
+    All candidates are probed together with one ``execute_script`` call,
+    the cached winner first, and the probe is repeated every ``poll``
+    seconds until something matches or ``timeout`` runs out. A page that
+    matches costs one round-trip; one whose markup drifted costs a single
+    timeout for the whole step rather than one per candidate.
+    """
+
+    def __init__(self, driver, cache: Optional[SelectorCache] = None, poll: float = 0.25):
+        self.driver = driver
+        self.cache = cache
+        self.poll = poll
+
+    def resolve(self, step: str, candidates: Sequence[str],
+                timeout: float = 10.0) -> Optional[Tuple[object, str]]:
+        """``(element, selector)`` for the first usable candidate, else None."""
+        cached = self.cache.get(step) if self.cache is not None else None
+        ordered: List[str] = list(candidates)
+        if cached is not None:
+            ordered = [cached] + [c for c in ordered if c != cached]
+
+        deadline = time.monotonic() + timeout
+        probes = 0
+        with metrics.phase("selector_probe"):
+            while True:
+                probes += 1
+                found = self.driver.execute_script(PROBE_SELECTORS_JS, ordered)
+                if found or time.monotonic() >= deadline:
+                    break
+                time.sleep(self.poll)
+        metrics.incr("selector_probes", probes)
+
+        if not found:
+            logging.warning(f"No selector matched for {step} after {probes} probes")
+            metrics.incr("selector_cache.misses")
+            self._record(step, None, hit=False)
+            return None
+        index, element = found
+        selector = ordered[index]
+        hit = selector == cached
+        metrics.incr("selector_cache.hits" if hit else "selector_cache.misses")
+        if not hit:
+            logging.info(f"Selector for {step} is now {selector} (was {cached})")
+        self._record(step, selector, hit)
+        return element, selector
+
+    def _record(self, step: str, selector: Optional[str], hit: bool):
+        if self.cache is None:
+            return
+        self.cache.record(step, selector, hit)
+        try:
+            self.cache.save()
+        except OSError as e:
+            logging.warning(f"Could not save selector cache: {str(e)}")
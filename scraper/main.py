@@ -1,15 +1,152 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database.models import Base
-from database.crud import create_outlet
-from scraper.scraper import scrape_subway_outlets
-
-# Initialize database
-engine = create_engine("sqlite:///database/subway.db")
-Base.metadata.create_all(bind=engine)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Run scraper
-db = SessionLocal()
-scrape_subway_outlets(db)
-db.close()
+import argparse
+import logging
+import os
+import sys
+from typing import Dict, List, Optional
+
+import requests
+
+from database.session import create_db_engine, init_db, make_session_factory
+from scraper.checkpoint import CHECKPOINT_DIR, CheckpointStore
+from scraper.exporters import EXPORTERS, open_exporter
+from scraper.http_engine import discover_cities
+from scraper.locators import SELECTOR_CACHE_PATH
+from scraper.metrics import metrics
+from scraper.scraper import DEFAULT_CITY, ENGINES, scrape_subway_outlets
+
+
+def configure_logging():
+    # Write to both file and console; done here rather than at import so
+    # that library users and the API keep their own logging setup
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler('subway_scraper.log'),
+                            logging.StreamHandler(sys.stdout)
+                        ])
+
+
+def city_urls(names: Optional[List[str]], all_cities: bool,
+              engine: str) -> Dict[str, Optional[str]]:
+    """Map each city to scrape to its listing URL from the location menu.
+
+    The menu is only fetched when something needs it: every city was
+    asked for, or the static engine has to reach a city other than the
+    default one. When it cannot be fetched the named cities are still
+    scraped, without URLs, which leaves them to the browser.
+    """
+    names = names or [DEFAULT_CITY]
+    discovered = {}
+    if all_cities or (engine != "selenium" and any(c != DEFAULT_CITY for c in names)):
+        try:
+            discovered = discover_cities()
+        except requests.RequestException as e:
+            logging.warning(f"Could not read the city list, scraping {', '.join(names)}: {str(e)}")
+    if all_cities and discovered:
+        return discovered
+    return {city: discovered.get(city) for city in names}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape Subway Malaysia outlets")
+    parser.add_argument("--engine", choices=ENGINES, default="auto")
+    parser.add_argument("--cities", nargs="+", metavar="CITY",
+                        help=f"cities to scrape (default: {DEFAULT_CITY})")
+    parser.add_argument("--all-cities", action="store_true",
+                        help="scrape every city listed in #fp_locationlist")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="worker processes for multi-city runs")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--export-csv", action="store_true",
+                        help="shorthand for --export subway_locations.csv")
+    parser.add_argument("--export", metavar="PATH",
+                        help="stream outlets to PATH while scraping (.csv, .jsonl or .parquet)")
+    parser.add_argument("--export-format", choices=tuple(EXPORTERS),
+                        help="export format when PATH has no recognized suffix")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue a single-city scrape from its last checkpoint")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("--metrics-report", default="scrape_report.json", metavar="PATH",
+                        help="where to write the JSON timing/counter report")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve live Prometheus metrics on this port during the run")
+    parser.add_argument("--debug-screenshots", action="store_true",
+                        help="keep a ring buffer of screenshots, written out on failure")
+    parser.add_argument("--show-browser", action="store_true",
+                        help="run Chrome with a visible window instead of headless")
+    parser.add_argument("--browser-pool-size", type=int, default=1, metavar="N",
+                        help="Chrome instances each process keeps warm between scrapes")
+    parser.add_argument("--selector-cache", default=SELECTOR_CACHE_PATH, metavar="PATH",
+                        help="where the winning UI selectors are remembered between runs")
+    parser.add_argument("--geocode", action="store_true",
+                        help="fill missing coordinates through the geocoding cache")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    if args.resume and (args.all_cities or (args.cities and len(args.cities) > 1)):
+        logging.warning("--resume only applies to single-city runs; starting from scratch")
+    if args.debug_screenshots:
+        # Read by FailureSnapshots, including in spawned worker processes
+        os.environ["SUBWAY_DEBUG_SCREENSHOTS"] = "1"
+    # Read by SelectorCache and shared_pool, including in spawned worker processes
+    os.environ["SUBWAY_SELECTOR_CACHE"] = args.selector_cache
+    if args.show_browser:
+        os.environ["SUBWAY_HEADLESS"] = "0"
+    os.environ["SUBWAY_BROWSER_POOL_SIZE"] = str(args.browser_pool_size)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    export_path = args.export or ("subway_locations.csv" if args.export_csv else None)
+
+    # Initialize database
+    engine = create_db_engine()
+    init_db(engine)
+    SessionLocal = make_session_factory(engine)
+
+    # Run scraper
+    db = SessionLocal()
+    exporter = open_exporter(export_path, args.export_format) if export_path else None
+    try:
+        cities = city_urls(args.cities, args.all_cities, args.engine)
+        if args.all_cities or len(cities) > 1:
+            from scraper.parallel import scrape_cities
+
+            results = scrape_cities(db, cities, workers=args.workers,
+                                    engine=args.engine, batch_size=args.batch_size,
+                                    exporter=exporter)
+            status = 1 if any(r.status == "failed" for r in results) else 0
+        else:
+            (city, url), = cities.items()
+            scrape_subway_outlets(db, batch_size=args.batch_size, engine=args.engine,
+                                  city=city, url=url, exporter=exporter,
+                                  checkpoints=CheckpointStore(args.checkpoint_dir),
+                                  resume=args.resume)
+            status = 0
+
+        if args.geocode:
+            from scraper.geocoding import (GeocodeCache, Geocoder, NominatimProvider,
+                                           geocode_missing_outlets)
+
+            geocoder = Geocoder(NominatimProvider(), GeocodeCache())
+            try:
+                geocoder.cache.evict_expired()
+                geocode_missing_outlets(db, geocoder)
+            finally:
+                geocoder.close()
+        return status
+    finally:
+        if exporter is not None:
+            exporter.abort()  # no-op once the scrape closed it
+        if args.metrics_report:
+            report = metrics.write_report(args.metrics_report)
+            slowest = sorted(report["phases"].items(), key=lambda p: -p[1]["seconds"])[:5]
+            logging.info("Time by phase: " + ", ".join(
+                f"{name} {t['seconds']:.1f}s/{t['count']}" for name, t in slowest))
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
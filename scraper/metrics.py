@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+METRIC_PREFIX = "subway_scraper"
+
+
+class Metrics:
+    """Per-phase timers and counters for one process's scrape runs.
+
+    Phases are timed with ``with metrics.phase("page"):`` and summarized
+    as count/total/max; counters are plain integers. Both are cheap enough
+    to leave on for every run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.timers: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+
+    def observe(self, phase: str, seconds: float):
+        with self._lock:
+            timer = self.timers.setdefault(phase, {"count": 0, "seconds": 0.0, "max": 0.0})
+            timer["count"] += 1
+            timer["seconds"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_flush(self, stats, seconds: float):
+        """``OutletWriter(on_flush=...)`` hook: time DB flushes, count writes."""
+        self.observe("db_flush", seconds)
+        self.incr("outlets_inserted", stats.inserted)
+        self.incr("outlets_updated", stats.updated)
+        self.incr("outlets_unchanged", stats.unchanged)
+
+    def merge(self, report: dict):
+        """Fold in another process's ``report()``, e.g. a worker's."""
+        with self._lock:
+            for name, t in report.get("phases", {}).items():
+                timer = self.timers.setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0})
+                timer["count"] += t["count"]
+                timer["seconds"] += t["seconds"]
+                timer["max"] = max(timer["max"], t["max_seconds"])
+            for name, value in report.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.timers = {}
+            self.counters = {}
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "phases": {
+                    name: {"count": t["count"], "seconds": round(t["seconds"], 4),
+                           "max_seconds": round(t["max"], 4)}
+                    for name, t in sorted(self.timers.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write_report(self, path: str) -> dict:
+        report = self.report()
+        part = path + ".part"
+        with open(part, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(part, path)
+        return report
+
+    def prometheus(self) -> str:
+        return render_prometheus(self.report())
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Expose /metrics in Prometheus text format from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Serving scraper metrics on http://{host}:{port}/metrics")
+        return server
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(report: dict) -> str:
+    """Prometheus text exposition of a ``Metrics.report()`` dict."""
+    phases = report.get("phases", {})
+    counters = report.get("counters", {})
+    lines = [
+        f"# HELP {METRIC_PREFIX}_phase_seconds_total Time spent in each scrape phase.",
+        f"# TYPE {METRIC_PREFIX}_phase_seconds_total counter",
+    ]
+    lines += [f'{METRIC_PREFIX}_phase_seconds_total{{phase="{_label(name)}"}} {t["seconds"]}'
+              for name, t in phases.items()]
+    lines += [
+        f"# HELP {METRIC_PREFIX}_phase_count_total Times each scrape phase ran.",
+        f"# TYPE {METRIC_PREFIX}_phase_count_total counter",
+    ]
+    lines += [f'{METRIC_PREFIX}_phase_count_total{{phase="{_label(name)}"}} {t["count"]}'
+              for name, t in phases.items()]
+    lines += [
+        f"# HELP {METRIC_PREFIX}_phase_max_seconds Slowest single run of each phase.",
+        f"# TYPE {METRIC_PREFIX}_phase_max_seconds gauge",
+    ]
+    lines += [f'{METRIC_PREFIX}_phase_max_seconds{{phase="{_label(name)}"}} {t["max_seconds"]}'
+              for name, t in phases.items()]
+    lines += [
+        f"# HELP {METRIC_PREFIX}_events_total Scraper event counters.",
+        f"# TYPE {METRIC_PREFIX}_events_total counter",
+    ]
+    lines += [f'{METRIC_PREFIX}_events_total{{event="{_label(name)}"}} {value}'
+              for name, value in counters.items()]
+    if "started" in report:
+        lines += [
+            f"# HELP {METRIC_PREFIX}_run_start_time_seconds When the reported run started.",
+            f"# TYPE {METRIC_PREFIX}_run_start_time_seconds gauge",
+            f"{METRIC_PREFIX}_run_start_time_seconds {report['started']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the scraper modules
+metrics = Metrics()
+
+
+class InstrumentedDriver:
+    """Counts every WebDriver round-trip made through the wrapped driver.
+
+    Calls are counted per method as ``webdriver.<method>`` counters plus a
+    ``webdriver.calls`` total. Waits built on the wrapper (WebDriverWait
+    polling, expected conditions) are counted too; calls made on returned
+    WebElements are not.
+    """
+
+    def __init__(self, driver, registry: Metrics = metrics):
+        self._driver = driver
+        self._metrics = registry
+
+    def __getattr__(self, name):
+        attr = getattr(self._driver, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        registry = self._metrics
+
+        def call(*args, **kwargs):
+            registry.incr("webdriver.calls")
+            registry.incr(f"webdriver.{name}")
+            return attr(*args, **kwargs)
+
+        return call
+
+
+class FailureSnapshots:
+    """Ring buffer of the last few screenshots, written out only on failure.
+
+    Off unless ``enabled`` (or SUBWAY_DEBUG_SCREENSHOTS=1); while off,
+    ``capture`` and ``dump`` do nothing, so a healthy run never renders a PNG.
+    """
+
+    def __init__(self, driver=None, size: int = 5, directory: str = "debug_screenshots",
+                 enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.environ.get("SUBWAY_DEBUG_SCREENSHOTS") == "1"
+        self.driver = driver
+        self.enabled = enabled
+        self.directory = directory
+        self.frames = deque(maxlen=size)
+
+    def capture(self, label: str):
+        if not self.enabled or self.driver is None:
+            return
+        try:
+            self.frames.append((label, self.driver.get_screenshot_as_png()))
+            metrics.incr("screenshots")
+        except Exception as e:
+            logging.warning(f"Could not capture {label} screenshot: {str(e)}")
+
+    def dump(self, label: str) -> int:
+        """Capture the failure itself and write the buffer to ``directory``."""
+        if not self.enabled:
+            return 0
+        self.capture(label)
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        for index, (name, png) in enumerate(self.frames, 1):
+            with open(os.path.join(self.directory, f"{stamp}-{index:02d}-{name}.png"), "wb") as f:
+                f.write(png)
+        logging.info(f"Wrote {len(self.frames)} debug screenshots to {self.directory}")
+        written = len(self.frames)
+        self.frames.clear()
+        return written
@@ -0,0 +1,229 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Iterator, List
+
+from scraper.metrics import metrics
+
+CARD_SELECTOR = "div.outlet-card"
+
+# Installs a MutationObserver counting added cards plus fetch/XHR hooks
+# tracking in-flight requests. Idempotent, so it is safe to call per page.
+INSTALL_OBSERVER_JS = """
+const selector = arguments[0];
+if (!window.__subwayPager) {
+    const pager = {added: 0, inflight: 0,
+                   lastMutation: performance.now(), lastNetwork: performance.now()};
+    new MutationObserver(records => {
+        for (const record of records) {
+            for (const node of record.addedNodes) {
+                if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                const found = (node.matches(selector) ? 1 : 0)
+                    + node.querySelectorAll(selector).length;
+                if (found) {
+                    pager.added += found;
+                    pager.lastMutation = performance.now();
+                }
+            }
+        }
+    }).observe(document.body, {childList: true, subtree: true});
+
+    const settle = () => {
+        pager.inflight = Math.max(0, pager.inflight - 1);
+        pager.lastNetwork = performance.now();
+    };
+    if (window.fetch) {
+        const fetch = window.fetch;
+        window.fetch = function () {
+            pager.inflight++;
+            return fetch.apply(this, arguments).finally(settle);
+        };
+    }
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        pager.inflight++;
+        this.addEventListener('loadend', settle);
+        return send.apply(this, arguments);
+    };
+    window.__subwayPager = pager;
+}
+return document.querySelectorAll(selector).length;
+"""
+
+# Optionally scrolls to the bottom, then resolves as soon as new cards have
+# arrived and the DOM has been quiet for quietMs, the network has been idle
+# for idleMs without any new cards, or timeoutMs has passed.
+WAIT_FOR_CARDS_JS = """
+const [scroll, timeoutMs, idleMs, quietMs, done] = arguments;
+const pager = window.__subwayPager;
+const baseline = pager.added;
+const start = performance.now();
+if (scroll) {
+    window.scrollTo(0, document.body.scrollHeight);
+}
+const check = () => {
+    const now = performance.now();
+    const added = pager.added - baseline;
+    const networkIdle = pager.inflight === 0
+        && now - Math.max(start, pager.lastNetwork) >= idleMs;
+    const result = {added: added, elapsed: now - start, timedOut: false};
+    if (added > 0 && pager.inflight === 0 && now - pager.lastMutation >= quietMs) {
+        return done(result);
+    }
+    if (added === 0 && networkIdle) {
+        return done(result);
+    }
+    if (now - start >= timeoutMs) {
+        result.timedOut = true;
+        return done(result);
+    }
+    setTimeout(check, 25);
+};
+check();
+"""
+
+# Resolves once the document has loaded and no new resources have been
+# requested for idleMs (or timeoutMs passes); replaces fixed setup sleeps.
+WAIT_FOR_IDLE_JS = """
+const [timeoutMs, idleMs, done] = arguments;
+// The default buffer stops at 250 entries, which would look like idleness
+performance.setResourceTimingBufferSize(10000);
+const start = performance.now();
+let seen = -1;
+let lastChange = start;
+const check = () => {
+    const now = performance.now();
+    const entries = performance.getEntriesByType('resource').length;
+    if (entries !== seen) {
+        seen = entries;
+        lastChange = now;
+    }
+    const loaded = document.readyState === 'complete';
+    if ((loaded && now - lastChange >= idleMs) || now - start >= timeoutMs) {
+        return done(now - start);
+    }
+    setTimeout(check, 25);
+};
+check();
+"""
+
+
+@dataclass
+class PageLoad:
+    number: int
+    new_cards: int
+    elapsed: float
+    timed_out: bool = False
+
+
+def wait_for_network_idle(driver, timeout: float = 15.0, idle: float = 0.5) -> float:
+    """Block until the page is loaded and quiet; returns seconds waited."""
+    driver.set_script_timeout(timeout + 5)
+    waited_ms = driver.execute_async_script(
+        WAIT_FOR_IDLE_JS, int(timeout * 1000), int(idle * 1000))
+    return waited_ms / 1000
+
+
+class InfiniteScroller:
+    """Loads the outlet list page by page, waiting on DOM and network events.
+
+    A scroll counts as empty when the network goes idle without new cards.
+    Each empty scroll multiplies the idle window by ``backoff`` (capped at
+    ``max_idle``) before retrying, and ``max_empty_scrolls`` empty scrolls
+    in a row end the pagination.
+    """
+
+    def __init__(self, driver, card_selector: str = CARD_SELECTOR,
+                 timeout: float = 15.0, idle: float = 0.5, quiet: float = 0.2,
+                 backoff: float = 2.0, max_idle: float = 4.0,
+                 max_empty_scrolls: int = 3):
+        self.driver = driver
+        self.card_selector = card_selector
+        self.timeout = timeout
+        self.idle = idle
+        self.quiet = quiet
+        self.backoff = backoff
+        self.max_idle = max_idle
+        self.max_empty_scrolls = max_empty_scrolls
+        self.timings: List[PageLoad] = []
+
+    def install(self) -> int:
+        """Hook the page; returns the number of cards already rendered."""
+        self.driver.set_script_timeout(self.timeout + 5)
+        return self.driver.execute_script(INSTALL_OBSERVER_JS, self.card_selector)
+
+    def _wait(self, scroll: bool, idle: float) -> dict:
+        return self.driver.execute_async_script(
+            WAIT_FOR_CARDS_JS, scroll, int(self.timeout * 1000),
+            int(idle * 1000), int(self.quiet * 1000))
+
+    def _record(self, new_cards: int, elapsed: float, timed_out: bool) -> PageLoad:
+        page = PageLoad(len(self.timings) + 1, new_cards, elapsed, timed_out)
+        self.timings.append(page)
+        metrics.observe("page", elapsed)
+        if timed_out:
+            metrics.incr("page_timeouts")
+        return page
+
+    def pages(self) -> Iterator[PageLoad]:
+        """Yield once per batch of newly loaded cards, starting with the first."""
+        start = time.perf_counter()
+        existing = self.install()
+        if not existing:
+            result = self._wait(scroll=False, idle=self.max_idle)
+            existing = result["added"]
+        if not existing:
+            logging.warning("No outlets found or loading timed out")
+            return
+        yield self._record(existing, time.perf_counter() - start, False)
+
+        empty_scrolls = 0
+        idle = self.idle
+        while empty_scrolls < self.max_empty_scrolls:
+            result = self._wait(scroll=True, idle=idle)
+            elapsed = result["elapsed"] / 1000
+            if result["added"]:
+                empty_scrolls = 0
+                idle = self.idle
+                yield self._record(result["added"], elapsed, result["timedOut"])
+                continue
+
+            empty_scrolls += 1
+            metrics.incr("empty_scrolls")
+            idle = min(idle * self.backoff, self.max_idle)
+            logging.info(
+                f"No new outlets after scrolling ({empty_scrolls}/"
+                f"{self.max_empty_scrolls}), next idle window {idle:.1f}s")
+
+        logging.info("Reached end of scrolling, all outlets processed")
+
+    def fast_forward(self, cards: int) -> int:
+        """Scroll until ``cards`` cards are rendered, without yielding pages.
+
+        Used to replay a resumed scrape up to its checkpoint; the site has
+        no page parameter, so scrolling is the only way back. Returns the
+        number of cards rendered when it stopped.
+        """
+        loaded = self.install()
+        empty_scrolls = 0
+        idle = self.idle
+        while loaded < cards and empty_scrolls < self.max_empty_scrolls:
+            result = self._wait(scroll=True, idle=idle)
+            if result["added"]:
+                loaded += result["added"]
+                empty_scrolls = 0
+                idle = self.idle
+            else:
+                empty_scrolls += 1
+                idle = min(idle * self.backoff, self.max_idle)
+        return self.install()
+
+    def summary(self) -> dict:
+        elapsed = [page.elapsed for page in self.timings]
+        return {
+            "pages": len(self.timings),
+            "cards": sum(page.new_cards for page in self.timings),
+            "total_seconds": round(sum(elapsed), 3),
+            "slowest_page_seconds": round(max(elapsed), 3) if elapsed else 0.0,
+            "timeouts": sum(page.timed_out for page in self.timings),
+        }
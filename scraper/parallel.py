@@ -0,0 +1,189 @@
+import logging
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database.crud import OutletWriter, finish_scrape_run, start_scrape_run
+from scraper.metrics import metrics
+
+if TYPE_CHECKING:
+    from scraper.exporters import Exporter
+
+
+@dataclass
+class CityResult:
+    city: str
+    status: str = "pending"  # pending, done or failed
+    outlets: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+    complete: bool = False  # the whole listing was read
+
+
+def _scrape_city(city: str, url: Optional[str], engine: str, records, stop) -> None:
+    # Runs in a worker process; everything goes back over the queue so a
+    # broken city never takes the writer or the other workers down with it.
+    # ``stop`` is set when the collector gives up, so the worker returns
+    # instead of feeding a queue nobody reads any more.
+    from scraper.records import ListingProgress
+    from scraper.scraper import iter_outlets
+
+    progress = ListingProgress()
+    start = time.perf_counter()
+    count = 0
+    # Pool processes are reused across cities; report only this city's share
+    metrics.reset()
+    try:
+        for record in iter_outlets(engine, city, url, progress=progress):
+            if stop.is_set():
+                return
+            records.put(("record", city, record))
+            count += 1
+        records.put(("metrics", city, metrics.report()))
+        records.put(("done", city, (count, time.perf_counter() - start, progress.complete)))
+    except Exception as e:
+        if stop.is_set():
+            return
+        records.put(("metrics", city, metrics.report()))
+        records.put(("failed", city, (count, time.perf_counter() - start,
+                                      f"{type(e).__name__}: {e}")))
+
+
+def _stop_workers(pool: ProcessPoolExecutor, futures, records, stop):
+    # Workers blocked on the full queue would keep the pool's shutdown
+    # waiting forever: tell them to stop and keep the queue moving until
+    # every running city has returned.
+    stop.set()
+    pool.shutdown(wait=False, cancel_futures=True)
+    while not all(future.done() for future in futures):
+        try:
+            records.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            break  # the manager is gone, and with it the queue
+
+
+def _collect(cities: Dict[str, Optional[str]], results: Dict[str, CityResult],
+             writer: OutletWriter, exporter, workers: int, engine: str, batch_size: int):
+    context = multiprocessing.get_context("spawn")
+    finished = 0
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        records = manager.Queue(maxsize=batch_size * workers)
+        stop = manager.Event()
+        futures = {
+            pool.submit(_scrape_city, city, url, engine, records, stop): city
+            for city, url in cities.items()
+        }
+        try:
+            while finished < len(results):
+                try:
+                    kind, city, payload = records.get(timeout=1)
+                except queue.Empty:
+                    # A worker that died without reporting (e.g. a crashed
+                    # process) surfaces as a failed future instead
+                    for future, city in futures.items():
+                        result = results[city]
+                        if result.status == "pending" and future.done() and future.exception():
+                            result.status = "failed"
+                            result.error = str(future.exception())
+                            finished += 1
+                            logging.error(
+                                f"[{finished}/{len(results)}] {city} failed: {result.error}")
+                    continue
+
+                result = results[city]
+                if kind == "record":
+                    writer.add(payload)
+                    if exporter is not None:
+                        exporter.write(payload)
+                    result.outlets += 1
+                    continue
+                if kind == "metrics":
+                    metrics.merge(payload)
+                    continue
+
+                if result.status != "pending":
+                    continue
+                finished += 1
+                if kind == "done":
+                    result.status = "done"
+                    _, result.seconds, result.complete = payload
+                    logging.info(
+                        f"[{finished}/{len(results)}] {city}: {result.outlets} outlets "
+                        f"in {result.seconds:.1f}s")
+                else:
+                    result.status = "failed"
+                    _, result.seconds, result.error = payload
+                    logging.error(
+                        f"[{finished}/{len(results)}] {city} failed after "
+                        f"{result.outlets} outlets: {result.error}")
+        except BaseException:
+            # The writer or exporter failed, or the run was interrupted
+            _stop_workers(pool, futures, records, stop)
+            raise
+
+
+def scrape_cities(db: Session, cities: Dict[str, Optional[str]], workers: int = 2,
+                  engine: str = "auto", batch_size: int = 500,
+                  exporter: Optional["Exporter"] = None) -> List[CityResult]:
+    """Scrape several cities in parallel and store them through one writer.
+
+    ``cities`` maps each city name to its listing URL (or None when only the
+    browser can reach it), as returned by ``http_engine.discover_cities``.
+    Each city runs in its own worker process; this process is the single
+    database writer, and the writer's upsert keys dedup outlets that show up
+    under more than one city. Outlets missing from a city that finished
+    cleanly are marked closed, and the run is recorded in scrape_runs.
+    Records are also streamed to ``exporter`` as they arrive, if given.
+    """
+    results = {city: CityResult(city) for city in cities}
+    if not results:
+        return []
+    workers = max(1, min(workers, len(results)))
+    logging.info(f"Scraping {len(results)} cities with {workers} workers")
+
+    run = start_scrape_run(db, engine, cities)
+    writer = OutletWriter(db, batch_size=batch_size, on_flush=metrics.record_flush)
+    try:
+        _collect(cities, results, writer, exporter, workers, engine, batch_size)
+        # Only cities whose listing was read to the end can tombstone outlets
+        retired = [r.city for r in results.values()
+                   if r.status == "done" and r.complete and r.outlets]
+        partial = [r.city for r in results.values()
+                   if r.status == "done" and r.outlets and not r.complete]
+        if partial:
+            logging.warning(f"Read only part of the listing for {', '.join(partial)}; "
+                            "not retiring their outlets")
+        writer.retire_unseen(retired)
+    finally:
+        # Keep what was scraped before a failure
+        try:
+            writer.close()
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Failed to save buffered outlets: {str(e)}")
+        done = sum(r.status == "done" and r.complete and r.outlets > 0
+                   for r in results.values())
+        status = "complete" if done == len(results) else "partial" if done else "failed"
+        finish_scrape_run(db, run, writer, status)
+        if exporter is not None:
+            if status == "failed":
+                exporter.abort()
+            else:
+                exporter.close()
+
+    totals = writer.totals
+    logging.info(
+        f"Multi-city scrape finished: {totals.inserted} inserted, "
+        f"{totals.updated} updated, {totals.unchanged} unchanged, {totals.closed} closed")
+    failed = [r.city for r in results.values() if r.status == "failed"]
+    if failed:
+        logging.warning(f"{len(failed)} cities failed: {', '.join(failed)}")
+    return list(results.values())
@@ -0,0 +1,64 @@
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from database.resolution import natural_key
+
+
+def _to_float(value) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class OutletRecord:
+    """One outlet card as extracted from find-a-subway."""
+
+    name: str
+    address: Optional[str] = None
+    hours: Optional[str] = None
+    phone: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    google_map: Optional[str] = None
+    waze_map: Optional[str] = None
+    location_id: Optional[str] = None
+    city: Optional[str] = None
+
+    def __post_init__(self):
+        self.name = (self.name or "").strip()
+        self.address = self.address.strip() if self.address else None
+        self.latitude = _to_float(self.latitude)
+        self.longitude = _to_float(self.longitude)
+        self.location_id = (str(self.location_id).strip()
+                            if self.location_id not in (None, "") else None)
+
+    @property
+    def natural_key(self) -> str:
+        return natural_key(self.name, self.address)
+
+    @property
+    def key(self) -> str:
+        """Identity of the outlet within a scrape: its data-id, else its natural key."""
+        return self.location_id or self.natural_key
+
+    def to_dict(self) -> dict:
+        # Keep the column names and order of the original CSV export
+        data = asdict(self)
+        return {"id": data.pop("location_id"), **data}
+
+
+@dataclass
+class ListingProgress:
+    """How much of a city's listing a scrape has read, filled in as it runs.
+
+    ``total`` is the outlet count the page advertises, when it does.
+    ``complete`` is set only once the whole listing was read, the one case
+    in which outlets the scrape did not see may be marked closed.
+    """
+
+    total: Optional[int] = None
+    complete: bool = False
@@ -1,52 +1,181 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
-from sqlalchemy.orm import Session
-import time
-import pandas as pd
 import logging
-import sys
-from database.models import Outlet
-from database.crud import create_outlet
-
-
-# Configure logging to write to both file and console
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler('subway_scraper.log'),
-                        logging.StreamHandler(sys.stdout)
-                    ])
-
-
-def scrape_subway_outlets(db: Session, export_csv=False):
-    driver = None
+import time
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+import requests
+
+from scraper.browsers import shared_pool
+from scraper.http_engine import FIND_A_SUBWAY_URL, fetch_outlets
+from scraper.locators import SelectorCache, SelectorResolver
+from scraper.metrics import FailureSnapshots, InstrumentedDriver, metrics
+from scraper.pagination import InfiniteScroller, wait_for_network_idle
+from scraper.records import ListingProgress, OutletRecord
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+    from scraper.browsers import BrowserPool
+    from scraper.checkpoint import Checkpointer, CheckpointStore
+    from scraper.exporters import Exporter
+
+# Selenium, SQLAlchemy and the exporters' dependencies are imported where
+# they are used, so importing this module (e.g. for iter_outlets or the
+# constants below) stays cheap.
+
+ENGINES = ("auto", "http", "selenium")
+
+DEFAULT_CITY = "Kuala Lumpur"
+
+# Short forms the location menu has used for some cities
+CITY_ALIASES = {
+    "Kuala Lumpur": ["KL", "KUL", "KUALA"],
+}
+
+# Candidates for the button that opens the location menu, most likely first
+CITY_MENU_SELECTORS = [
+    "div.location_left",
+    "div[class*='location_left']",
+    "div.city-selector",
+    "div[class*='city-selector']",
+    "div.dropdown-toggle",
+    "//div[contains(@class, 'city') and contains(@class, 'selector')]",
+]
+
+SCROLL_TO_CITY_JS = """
+const [menu, city] = arguments;
+const wanted = city.toLowerCase();
+for (const item of menu.querySelectorAll('*')) {
+    if (item.children.length === 0 && item.textContent.trim().toLowerCase() === wanted) {
+        item.scrollIntoView({block: 'center'});
+        return true;
+    }
+}
+return false;
+"""
+
+# Reads every field of the cards not seen before in one round-trip and tags
+# them, so each scroll costs one call however many outlets are loaded. The
+# card selector is passed in, so it matches the cards the scroller counts.
+EXTRACT_NEW_CARDS_JS = """
+const [selector] = arguments;
+const SEEN = 'data-scraper-seen';
+const text = (card, selector) => {
+    const el = card.querySelector(selector);
+    return el ? el.innerText.trim() : null;
+};
+const href = (card, selector) => {
+    const el = card.querySelector(selector);
+    return el ? el.href : null;
+};
+const cards = [...document.querySelectorAll(selector)].filter(card => !card.hasAttribute(SEEN));
+const batch = [];
+for (const card of cards) {
+    card.setAttribute(SEEN, '1');
+    batch.push({
+        name: text(card, 'h3'),
+        address: text(card, '.address'),
+        phone: text(card, '.phone'),
+        hours: text(card, '.hours'),
+        waze_map: href(card, '.waze a'),
+        google_map: href(card, '.google-map a'),
+        latitude: card.getAttribute('data-latitude'),
+        longitude: card.getAttribute('data-longitude'),
+        location_id: card.getAttribute('data-id'),
+    });
+}
+return batch;
+"""
+
+# Tags the first N cards as already extracted, so a resumed scrape picks up
+# after its checkpoint's DOM cursor without reading those cards again.
+MARK_SEEN_JS = """
+const [selector, count] = arguments;
+const cards = document.querySelectorAll(selector);
+const marked = Math.min(count, cards.length);
+for (let i = 0; i < marked; i++) {
+    cards[i].setAttribute('data-scraper-seen', '1');
+}
+return marked;
+"""
+
+
+def _xpath_literal(value: str) -> str:
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    parts = value.split("'")
+    return "concat('" + "', \"'\", '".join(parts) + "')"
+
+
+def city_xpaths(city: str) -> List[str]:
+    """XPath candidates for a city's entry in the location menu."""
+    literal = _xpath_literal(city)
+    xpaths = [
+        f"//div[text()={literal}]",
+        f"//div[contains(text(), {literal})]",
+        f"//span[contains(text(), {literal})]",
+        f"//li[contains(text(), {literal})]",
+        f"//a[contains(text(), {literal})]",
+    ]
+    for alias in [city.split()[0], *CITY_ALIASES.get(city, [])]:
+        xpath = ("//div[contains(@class, 'infoboxcontent') and "
+                 f"contains(text(), {_xpath_literal(alias)})]")
+        if xpath not in xpaths:
+            xpaths.append(xpath)
+    return xpaths
+
+
+def scrape_with_selenium(city: str = DEFAULT_CITY,
+                         checkpointer: Optional["Checkpointer"] = None,
+                         start_url: str = FIND_A_SUBWAY_URL,
+                         selector_cache: Optional[SelectorCache] = None,
+                         pool: Optional["BrowserPool"] = None,
+                         progress: Optional[ListingProgress] = None):
+    """Drive find-a-subway in Chrome and yield one OutletRecord per card.
+
+    With a ``checkpointer``, progress is recorded page by page, and a
+    resumed checkpoint is replayed by scrolling back to its DOM cursor
+    before extraction continues. The selectors that opened the location
+    menu and picked the city are remembered in ``selector_cache``
+    (SELECTOR_CACHE_PATH by default) and tried first next time. The
+    browser is leased from ``pool`` (the process's shared pool by default)
+    and handed back afterwards, warm, for the next scrape. ``progress`` is
+    marked complete once scrolling reached the end of the list with every
+    card read.
+    """
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    pool = pool or shared_pool()
+    session = None
+    failed = False
     error_count = 0
+    started = time.perf_counter()
+    # Screenshots are only taken (and only written, on failure) in debug runs
+    snapshots = FailureSnapshots()
     try:
-        # Initialize Chrome with options
-        options = webdriver.ChromeOptions()
-        options.add_argument('--disable-notifications')
-        options.add_argument('--start-maximized')
-        # Add these additional options for stability
-        options.add_argument('--disable-extensions')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--no-sandbox')
-        driver = webdriver.Chrome(options=options)
+        with metrics.phase("driver_start"):
+            # A warm headless browser when one is idle, a fresh one otherwise
+            session = pool.acquire()
+        # Every call through the wrapper counts as a WebDriver round-trip
+        driver = InstrumentedDriver(session.driver)
+        snapshots.driver = driver
 
         # Increased timeout for loading pages
         wait = WebDriverWait(driver, 30)  # Increased from 20 to 30 seconds
 
         logging.info("Starting to scrape Subway outlets")
-        driver.get("https://subway.com.my/find-a-subway")
+        with metrics.phase("page_load"):
+            driver.get(start_url)
+            session.pages += 1
 
-        # Wait for page to fully load
-        time.sleep(5)  # Give the page more time to load completely
-
-        # Take a screenshot to debug
-        driver.save_screenshot("page_loaded.png")
-        logging.info("Saved initial page screenshot")
+            # Wait until the page has loaded and stopped fetching resources
+            waited = wait_for_network_idle(driver)
+        logging.info(f"Page settled after {waited:.2f}s")
+        snapshots.capture("page_loaded")
 
         # Optional popup handling - won't fail if no popup exists
         try:
@@ -62,8 +191,9 @@ def scrape_subway_outlets(db: Session, export_csv=False):
                         logging.info(
                             "Found visible popup, attempting to close")
                         popup.click()
+                        WebDriverWait(driver, 5).until(
+                            EC.invisibility_of_element(popup))
                         logging.info("Popup closed successfully")
-                        time.sleep(1)
                         break
                     except Exception as e:
                         logging.info(f"Could not click popup: {str(e)}")
@@ -73,128 +203,76 @@ def scrape_subway_outlets(db: Session, export_csv=False):
             # Don't fail the entire scraper just because of popup handling
             logging.info(f"Skipping popup handling: {str(e)}")
 
-        # Try multiple selector strategies for city selection
-        selectors = [
-            "div.location_left",
-            "div[class*='location_left']",
-            "div.city-selector",
-            "div[class*='city-selector']",
-            "div.dropdown-toggle",
-            "//div[contains(@class, 'city') and contains(@class, 'selector')]"
-        ]
-
-        clicked = False
-        for selector in selectors:
-            try:
-                logging.info(f"Trying selector: {selector}")
-                if selector.startswith("//"):
-                    # XPath selector
-                    element = wait.until(
-                        EC.element_to_be_clickable((By.XPATH, selector)))
-                else:
-                    # CSS selector
-                    element = wait.until(EC.element_to_be_clickable(
-                        (By.CSS_SELECTOR, selector)))
-
-                # Try JavaScript click if regular click might fail
-                driver.execute_script(
-                    "arguments[0].scrollIntoView(true);", element)
-                time.sleep(1)
-
-                # Take screenshot before clicking
-                driver.save_screenshot("before_click.png")
-
-                try:
-                    element.click()
-                except:
-                    # If regular click fails, try JavaScript click
-                    driver.execute_script("arguments[0].click();", element)
-
-                clicked = True
-                logging.info(
-                    f"Successfully clicked city selector with: {selector}")
-                time.sleep(3)  # Wait longer after clicking
-                break
-            except Exception as e:
-                logging.warning(f"Failed with selector {selector}: {str(e)}")
-
-        if not clicked:
+        city_select_started = time.perf_counter()
+        # Every candidate for the menu button is probed in one call, the
+        # selector that worked last run first
+        resolver = SelectorResolver(driver, selector_cache or SelectorCache())
+        resolved = resolver.resolve("city_menu", CITY_MENU_SELECTORS, timeout=30)
+        if resolved is None:
             error_msg = "Could not click city selector with any selector"
             logging.error(error_msg)
             print(f"ERROR: {error_msg}")
-            # Take screenshot to see what's happening
-            driver.save_screenshot("failed_city_selector.png")
+            snapshots.dump("failed_city_selector")
             raise Exception(error_msg)
+        element, selector = resolved
+
+        # Try JavaScript click if regular click might fail
+        driver.execute_script(
+            "arguments[0].scrollIntoView({block: 'center'});", element)
+
+        snapshots.capture("before_click")
 
-        # Scroll to Kuala Lumpur in the menu
+        try:
+            element.click()
+        except Exception:
+            # If regular click fails, try JavaScript click
+            metrics.incr("click_retries")
+            driver.execute_script("arguments[0].click();", element)
+        logging.info(f"Successfully clicked city selector with: {selector}")
+
+        # Scroll to the city in the menu
         try:
             city_menu = wait.until(
-                EC.presence_of_element_located(
+                EC.visibility_of_element_located(
                     (By.ID, "fp_locationlist"))
             )
-            # Take screenshot of city menu before scrolling
-            driver.save_screenshot("city_menu_before_scroll.png")
+            snapshots.capture("city_menu_before_scroll")
 
-            # Adjust scroll position
-            driver.execute_script("arguments[0].scrollTop = 500", city_menu)
+            # Bring the city's entry into view (the old fixed scrollTop
+            # only ever reached Kuala Lumpur)
+            found = driver.execute_script(SCROLL_TO_CITY_JS, city_menu, city)
+            if not found:
+                driver.execute_script("arguments[0].scrollTop = 500", city_menu)
             logging.info("Scrolled city menu")
-            time.sleep(2)  # Wait after scrolling
 
-            # Take screenshot after scrolling
-            driver.save_screenshot("city_menu_after_scroll.png")
+            snapshots.capture("city_menu_after_scroll")
         except (TimeoutException, NoSuchElementException) as e:
             logging.error(f"Failed to scroll city menu: {str(e)}")
             raise
 
-        # Select Kuala Lumpur - with multiple fallback strategies
+        # Select the city - with multiple fallback strategies
         try:
-            # Try multiple selectors for finding Kuala Lumpur
-            city_selectors = [
-                "//div[text()='Kuala Lumpur']",
-                "//div[contains(text(), 'Kuala Lumpur')]",
-                "//span[contains(text(), 'Kuala Lumpur')]",
-                "//li[contains(text(), 'Kuala Lumpur')]",
-                "//a[contains(text(), 'Kuala Lumpur')]",
-                "//div[contains(@class, 'infoboxcontent') and contains(text(), 'Kuala')]",
-                "//div[contains(@class, 'infoboxcontent') and contains(text(), 'Kuala')]",
-                "//div[contains(@class, 'infoboxcontent') and contains(text(), 'KL')]",
-                "//div[contains(@class, 'infoboxcontent') and contains(text(), 'KUL')]",
-                "//div[contains(@class, 'infoboxcontent') and contains(text(), 'KUALA')]",
-
-
-            ]
-
             city_selected = False
-            for selector in city_selectors:
-                try:
-                    logging.info(
-                        f"Trying to find Kuala Lumpur with: {selector}")
-                    # Use a shorter timeout (10s) for each attempt
-                    city_element = WebDriverWait(driver, 10).until(
-                        EC.element_to_be_clickable((By.XPATH, selector))
-                    )
+            resolved = resolver.resolve(f"city:{city}", city_xpaths(city), timeout=10)
+            if resolved is not None:
+                city_element, selector = resolved
+                snapshots.capture("before_city_click")
 
-                    # Take screenshot before clicking
-                    driver.save_screenshot("before_city_click.png")
+                # Try regular click
+                try:
+                    city_element.click()
+                except Exception:
+                    # If regular click fails, try JS click
+                    metrics.incr("click_retries")
+                    driver.execute_script(
+                        "arguments[0].click();", city_element)
 
-                    # Try regular click
-                    try:
-                        city_element.click()
-                    except Exception:
-                        # If regular click fails, try JS click
-                        driver.execute_script(
-                            "arguments[0].click();", city_element)
-
-                    logging.info(f"Selected Kuala Lumpur with: {selector}")
-                    city_selected = True
-                    time.sleep(3)  # Wait after selection
-                    break
-                except Exception as e:
-                    logging.warning(
-                        f"Failed with selector {selector}: {str(e)}")
+                logging.info(f"Selected {city} with: {selector}")
+                city_selected = True
 
             # If direct selection failed, try alternative approach
             if not city_selected:
+                metrics.incr("city_select_fallbacks")
                 logging.info("Trying alternative city selection approaches")
 
                 # Approach 1: Try clicking by index (e.g., the 3rd city in the list)
@@ -207,14 +285,16 @@ def scrape_subway_outlets(db: Session, export_csv=False):
                         city_texts = [item.text for item in city_items[:10]]
                         logging.info(f"Found cities: {city_texts}")
 
-                        # Try to find one with "Kuala" in the text
-                        kl_items = [
-                            item for item in city_items if "Kuala" in item.text]
-                        if kl_items:
-                            kl_items[0].click()
-                            logging.info("Selected Kuala Lumpur by text match")
+                        # Try to find one with the city in the text
+                        matches = [
+                            item for item in city_items
+                            if city.casefold() in item.text.casefold()]
+                        if matches:
+                            matches[0].click()
+                            logging.info(f"Selected {city} by text match")
                             city_selected = True
-                        elif len(city_items) >= 3:  # Assuming KL might be the 3rd item
+                        # Assuming KL might be the 3rd item
+                        elif city == DEFAULT_CITY and len(city_items) >= 3:
                             city_items[2].click()
                             logging.info("Selected city by index position")
                             city_selected = True
@@ -223,148 +303,76 @@ def scrape_subway_outlets(db: Session, export_csv=False):
 
             if not city_selected:
                 raise Exception(
-                    "Could not select Kuala Lumpur with any strategy")
+                    f"Could not select {city} with any strategy")
 
         except Exception as e:
-            logging.error(f"Failed to select Kuala Lumpur: {str(e)}")
-            # Take screenshots of what we see
-            driver.save_screenshot("city_selection_failed.png")
+            logging.error(f"Failed to select {city}: {str(e)}")
+            snapshots.dump("city_selection_failed")
             raise
 
+        # Let the selected city's outlet list finish loading
+        waited = wait_for_network_idle(driver)
+        metrics.observe("city_select", time.perf_counter() - city_select_started)
+        logging.info(f"City outlets settled after {waited:.2f}s")
+
         # Handle pagination with dynamic loading
         processed = set()
-        locations = []
-        page_count = 0
-
-        while True:
-            page_count += 1
-            logging.info(f"Processing page {page_count}")
-
-            try:
-                # Wait longer for outlet cards to load
-                wait.until(
-                    EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, "div.outlet-card"))
-                )
-            except TimeoutException:
-                logging.warning("No outlets found or loading timed out")
-                break
-
-            # Extract outlet data
-            outlets = driver.find_elements(By.CSS_SELECTOR, "div.outlet-card")
-            logging.info(f"Found {len(outlets)} outlets on current page")
-
-            for i, outlet in enumerate(outlets):
+        scroller = InfiniteScroller(driver)
+        cursor = 0
+
+        if checkpointer is not None and checkpointer.resumed:
+            target = checkpointer.replay()
+            loaded = scroller.fast_forward(target)
+            cursor = driver.execute_script(MARK_SEEN_JS, scroller.card_selector, target)
+            logging.info(
+                f"Replayed scrolling to {loaded} cards; skipping the first {cursor}")
+
+        for page in scroller.pages():
+            logging.info(
+                f"Processing page {page.number}: {page.new_cards} cards "
+                f"loaded in {page.elapsed:.2f}s")
+
+            # Extract only the cards added since the last batch
+            with metrics.phase("extraction"):
+                cards = driver.execute_script(EXTRACT_NEW_CARDS_JS, scroller.card_selector)
+            cursor += len(cards)
+            logging.info(f"Found {len(cards)} new outlets on current page")
+
+            for i, card in enumerate(cards):
                 try:
-                    # Extract basic information
-                    name = outlet.find_element(By.CSS_SELECTOR, "h3").text
-                    address = outlet.find_element(
-                        By.CSS_SELECTOR, ".address").text
-
-                    # Skip if already processed
-                    if name in processed:
+                    name = card.get("name")
+                    if not name:
+                        raise ValueError("outlet card has no name")
+
+                    # Skip if already processed, here or before a resume;
+                    # same key as the static engine's, so both keep one row
+                    record = OutletRecord(**card, city=city)
+                    key = record.key
+                    if key in processed or (
+                            checkpointer is not None and checkpointer.is_seen(key)):
                         continue
 
                     logging.info(f"Processing outlet: {name}")
-
-                    # Extract optional fields with error handling
-                    try:
-                        phone = outlet.find_element(
-                            By.CSS_SELECTOR, ".phone").text
-                    except NoSuchElementException:
-                        phone = None
-                        logging.debug(f"No phone found for {name}")
-
-                    try:
-                        hours = outlet.find_element(
-                            By.CSS_SELECTOR, ".hours").text
-                    except NoSuchElementException:
-                        hours = None
-                        logging.debug(f"No hours found for {name}")
-
-                    # Extract map links
-                    try:
-                        waze_link = outlet.find_element(
-                            By.CSS_SELECTOR, ".waze a").get_attribute("href")
-                    except NoSuchElementException:
-                        waze_link = None
-                        logging.debug(f"No Waze link found for {name}")
-
-                    try:
-                        google_map_link = outlet.find_element(
-                            By.CSS_SELECTOR, ".google-map a").get_attribute("href")
-                    except NoSuchElementException:
-                        google_map_link = None
-                        logging.debug(f"No Google Maps link found for {name}")
-
-                    # Extract coordinates if available
-                    try:
-                        latitude = outlet.get_attribute("data-latitude")
-                        longitude = outlet.get_attribute("data-longitude")
-                    except Exception:
-                        latitude = None
-                        longitude = None
-                        logging.debug(f"No coordinates found for {name}")
-
-                    # Extract location ID if available
-                    try:
-                        location_id = outlet.get_attribute("data-id")
-                    except Exception:
-                        location_id = None
-                        logging.debug(f"No location ID found for {name}")
-
-                    # Save to database
-                    try:
-                        create_outlet(db, name, address,
-                                      phone, hours, waze_link)
-                        processed.add(name)
-                        logging.info(
-                            f"Successfully saved outlet {name} to database")
-                    except Exception as e:
-                        logging.error(
-                            f"Failed to save {name} to database: {str(e)}")
-
-                    # Add to locations list for CSV export
-                    locations.append({
-                        'id': location_id,
-                        'name': name,
-                        'address': address,
-                        'hours': hours,
-                        'phone': phone,
-                        'latitude': latitude,
-                        'longitude': longitude,
-                        'google_map': google_map_link,
-                        'waze_map': waze_link
-                    })
+                    processed.add(key)
+                    if len(processed) == 1:
+                        metrics.observe("first_outlet", time.perf_counter() - started)
+                    yield record
+                    if checkpointer is not None:
+                        checkpointer.outlet(key)
                 except Exception as e:
                     error_count += 1
+                    metrics.incr("card_errors")
                     error_msg = f"Error processing outlet {i+1}: {str(e)}"
                     logging.error(error_msg)
                     print(f"ERROR: {error_msg}")
 
-            # Improved infinite scroll pagination with retry
-            scroll_attempts = 0
-            max_scroll_attempts = 3
-            last_height = driver.execute_script(
-                "return document.body.scrollHeight")
-
-            while scroll_attempts < max_scroll_attempts:
-                # Scroll down
-                driver.execute_script(
-                    "window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(3)  # Increased wait time for content to load
-
-                # Check if we've reached the end
-                new_height = driver.execute_script(
-                    "return document.body.scrollHeight")
-                if new_height == last_height:
-                    scroll_attempts += 1
-                else:
-                    break  # Content loaded, continue scraping
-
-            if scroll_attempts == max_scroll_attempts:
-                logging.info("Reached end of scrolling, all outlets processed")
-                break
+            if checkpointer is not None:
+                checkpointer.page(cursor)
+
+        logging.info(f"Page load timings: {scroller.summary()}")
+        if progress is not None:
+            # A card that could not be read may be an outlet that still exists
+            progress.complete = error_count == 0
 
         logging.info(
             f"Scraping completed. Processed {len(processed)} unique outlets.")
@@ -374,26 +382,179 @@ def scrape_subway_outlets(db: Session, export_csv=False):
             print(
                 f"⚠️ ATTENTION: {error_count} errors occurred during scraping. Check the log file for details.")
 
-        # Export to CSV if requested
-        if export_csv and locations:
-            try:
-                df = pd.DataFrame(locations)
-                df.to_csv('subway_locations.csv', index=False)
-                logging.info(f"Exported {len(df)} locations to CSV!")
-                print(f"Exported {len(df)} locations to CSV!")
-            except Exception as e:
-                error_msg = f"Failed to export to CSV: {str(e)}"
-                logging.error(error_msg)
-                print(f"ERROR: {error_msg}")
-
-        return locations
-
     except Exception as e:
+        failed = True
         error_msg = f"Fatal error in scraper: {str(e)}"
         logging.error(error_msg)
         print(f"FATAL ERROR: {error_msg}")
+        snapshots.dump("fatal_error")
         raise
     finally:
-        if driver:
-            driver.quit()
-            logging.info("WebDriver closed")
+        if session is not None:
+            # A browser that failed is quit rather than handed out again
+            pool.release(session, failed=failed)
+            logging.info("Browser returned to the pool")
+
+
+def iter_outlets(engine: str = "auto", city: str = DEFAULT_CITY,
+                 url: Optional[str] = None,
+                 checkpointer: Optional["Checkpointer"] = None,
+                 progress: Optional[ListingProgress] = None) -> Iterator[OutletRecord]:
+    """Yield the outlets of one city from the requested engine.
+
+    ``engine`` selects how pages are fetched: "http" parses the static
+    markup (following the listing's card endpoint past the first page),
+    "selenium" drives Chrome, and "auto" tries HTTP first and only starts a
+    browser when the static page carries no outlet cards or fewer than it
+    says the city has. The static engine needs a city-specific ``url`` for
+    cities other than the default one, since the landing page only lists
+    the default city. ``checkpointer`` only applies to the browser, whose
+    scrolling is slow enough to be worth resuming. ``progress`` tells the
+    caller, once the records run out, whether the whole listing was read.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if engine == "http" and not url and city != DEFAULT_CITY:
+        # Reading nothing would look like a city without outlets
+        raise ValueError(f"No listing URL for {city}; the http engine cannot reach it")
+
+    progress = progress if progress is not None else ListingProgress()
+    records = []
+    if engine in ("auto", "http") and (url or city == DEFAULT_CITY):
+        try:
+            with metrics.phase("http_fetch"):
+                records = fetch_outlets([url] if url else None, progress=progress)
+        except requests.RequestException as e:
+            metrics.incr("http_fetch_failures")
+            if engine == "http":
+                raise
+            logging.warning(f"Static fetch failed for {city}: {str(e)}")
+        # A total the cards fall short of means the rest only load in a browser
+        missing = progress.total is not None and not progress.complete
+        if engine == "auto" and (not records or missing):
+            metrics.incr("engine_fallbacks")
+            logging.info(
+                f"Static page has {len(records)} of {progress.total or 'no'} outlet cards "
+                f"for {city}, falling back to Selenium")
+            records = []
+    if engine == "selenium" or (engine == "auto" and not records):
+        records = scrape_with_selenium(city, checkpointer, progress=progress)
+
+    for record in records:
+        if record.city is None:
+            record.city = city
+        yield record
+
+
+def _stored_records(db: "Session", ids: List[int]) -> Iterator[OutletRecord]:
+    """Records for stored outlets, as the scrape that wrote them yielded them."""
+    from database.models import Outlet
+
+    for start in range(0, len(ids), 500):
+        query = db.query(Outlet).filter(Outlet.id.in_(ids[start:start + 500]))
+        for outlet in query.order_by(Outlet.id):
+            yield OutletRecord(
+                name=outlet.name, address=outlet.address, hours=outlet.operating_hours,
+                phone=outlet.phone, latitude=outlet.latitude, longitude=outlet.longitude,
+                google_map=outlet.google_map_link, waze_map=outlet.waze_link,
+                location_id=outlet.location_id, city=outlet.city)
+
+
+def scrape_subway_outlets(db: "Session", export_csv=False, batch_size=500,
+                          engine="auto", city=DEFAULT_CITY, url: Optional[str] = None,
+                          exporter: Optional["Exporter"] = None,
+                          checkpoints: Optional["CheckpointStore"] = None,
+                          resume: bool = False):
+    """Scrape one city's outlets into the database, streaming them to ``exporter``.
+
+    ``export_csv`` is shorthand for a CsvExporter on subway_locations.csv.
+    Records are written out as they arrive and never collected in memory.
+    With a ``checkpoints`` store, progress is saved as the scrape goes
+    (committing the writer first) and ``resume`` continues from the last
+    checkpoint instead of page one; the export of a resumed run still
+    covers the whole city. ``url`` is the city's listing page for
+    the static engine. Outlets are only marked closed when the whole
+    listing was read. Returns the writer's FlushStats.
+    """
+    from database.crud import OutletWriter, finish_scrape_run, start_scrape_run
+
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if export_csv and exporter is None:
+        from scraper.exporters import CsvExporter
+        exporter = CsvExporter("subway_locations.csv")
+
+    run = start_scrape_run(db, engine, [city])
+    writer = OutletWriter(db, batch_size=batch_size, on_flush=metrics.record_flush)
+    checkpointer = None
+    if checkpoints is not None:
+        from scraper.checkpoint import Checkpointer
+
+        def before_save(checkpoint):
+            writer.commit()
+            checkpoint.outlet_ids = sorted(writer.seen_ids)
+
+        checkpointer = Checkpointer.start(checkpoints, city, resume=resume,
+                                          before_save=before_save)
+        # Outlets stored before the resume still count as seen this run
+        writer.seen_ids.update(checkpointer.checkpoint.outlet_ids)
+    resumed = checkpointer is not None and checkpointer.resumed
+    progress = ListingProgress()
+    scraped = 0
+    status = "failed"
+    # The export starts over, so when the browser resumes from the checkpoint
+    # it is rebuilt from the outlets stored before the interruption. An engine
+    # that reads the listing from the top exports them itself.
+    restore_export = resumed and exporter is not None
+
+    def export_stored():
+        nonlocal restore_export
+        if restore_export and checkpointer.replayed:
+            restore_export = False
+            for stored in _stored_records(db, checkpointer.checkpoint.outlet_ids):
+                exporter.write(stored)
+
+    try:
+        for record in iter_outlets(engine, city, url, checkpointer, progress):
+            export_stored()
+            # Queue for the batched database writer
+            writer.add(record)
+            if exporter is not None:
+                exporter.write(record)
+            scraped += 1
+        export_stored()
+
+        # Only a listing read to the end shows which outlets have closed;
+        # an empty listing is more likely a broken page than a closed city
+        if progress.complete and (scraped or resumed):
+            writer.retire_unseen([city])
+            status = "complete"
+        elif scraped or resumed:
+            logging.warning(
+                f"Read {scraped} of {progress.total or 'an unknown number of'} "
+                f"outlets listed for {city}; not retiring any")
+            status = "partial"
+        else:
+            logging.warning(f"No outlets found for {city}; not retiring any")
+            status = "partial"
+        totals = writer.close()
+        logging.info(
+            f"Saved outlets to database: {totals.inserted} inserted, "
+            f"{totals.updated} updated, {totals.unchanged} unchanged, "
+            f"{totals.closed} closed")
+        if checkpointer is not None:
+            checkpointer.finish()
+
+        if exporter is not None:
+            exporter.close()
+        return totals
+    finally:
+        if exporter is not None:
+            exporter.abort()  # no-op once closed
+        # Persist whatever was extracted before a failure
+        try:
+            writer.close()
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Failed to save buffered outlets: {str(e)}")
+        finish_scrape_run(db, run, writer, status)
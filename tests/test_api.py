@@ -0,0 +1,120 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from api.dependencies import get_engine, get_session_factory
+from api.main import app
+from api.routers.outlets import response_cache
+from database.crud import OutletWriter
+from scraper.records import OutletRecord
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'api.db'}")
+    get_engine.cache_clear()
+    get_session_factory.cache_clear()
+    response_cache.clear()
+    with TestClient(app) as client:
+        yield client
+    get_engine.cache_clear()
+    get_session_factory.cache_clear()
+
+
+def _ingest(records):
+    db = get_session_factory()()
+    try:
+        with OutletWriter(db) as writer:
+            writer.add_many(records)
+    finally:
+        db.close()
+
+
+def test_outlets_keyset_pagination_and_projection(client):
+    _ingest(OutletRecord(f"Subway {i}", f"Jalan {i}", city="Kuala Lumpur") for i in range(5))
+
+    first = client.get("/outlets", params={"limit": 2, "fields": "name"}).json()
+    assert [item["name"] for item in first["items"]] == ["Subway 0", "Subway 1"]
+    assert set(first["items"][0]) == {"id", "name"}
+
+    second = client.get("/outlets", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [item["name"] for item in second["items"]] == ["Subway 2", "Subway 3"]
+    assert client.get("/outlets", params={"fields": "nope"}).status_code == 422
+
+
+def test_outlets_conditional_get_follows_dataset_version(client):
+    _ingest([OutletRecord("Subway Bangsar", "Jalan Telawi")])
+    response = client.get("/outlets")
+    etag = response.headers["etag"]
+
+    assert client.get("/outlets", headers={"If-None-Match": etag}).status_code == 304
+
+    _ingest([OutletRecord("Subway Bangsar", "Jalan Telawi")])  # unchanged
+    assert client.get("/outlets", headers={"If-None-Match": etag}).status_code == 304
+
+    _ingest([OutletRecord("Subway KLCC", "Jalan Ampang")])
+    response = client.get("/outlets", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 2
+
+
+def test_outlet_by_id_answers_from_validators_without_reading_the_row(client):
+    _ingest([OutletRecord("Subway Bangsar", "Jalan Telawi")])
+    response = client.get("/outlets/1")
+    assert response.json()["name"] == "Subway Bangsar"
+    assert client.get("/outlets/2").status_code == 404
+
+    statements = []
+    event.listen(get_engine(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    headers = {"If-None-Match": response.headers["etag"]}
+    assert client.get("/outlets/1", headers=headers).status_code == 304
+    assert client.get("/outlets/1").json()["name"] == "Subway Bangsar"
+    assert not [s for s in statements if "FROM outlets" in s]
+
+
+def test_chatbot_answers_from_search_index(client):
+    _ingest([
+        OutletRecord("Subway Bangsar Village", "Jalan Telawi 1, Bangsar",
+                     hours="Monday - Sunday, 8:00 AM - 10:00 PM"),
+        OutletRecord("Subway Bangsar South", "Jalan Kerinchi, Bangsar South",
+                     hours="Monday - Friday, 8:00 AM - 8:00 PM"),
+        OutletRecord("Subway KLCC", "Suria KLCC, Jalan Ampang",
+                     hours="Monday - Sunday, 10:00 AM - 10:00 PM"),
+    ])
+
+    answer = client.post("/chatbot/query",
+                         json={"question": "Which outlets in Bangsar open after 9pm?"}).json()
+    assert answer["count"] == 1
+    assert answer["outlets"][0]["name"] == "Subway Bangsar Village"
+    assert answer["filters"]["terms"] == ["bangsar"]
+
+    answer = client.post("/chatbot/query", json={"question": "How many outlets in Bangsar?"}).json()
+    assert answer["count"] == 2 and answer["outlets"] == []
+
+    # Open until closing time, not after it
+    answer = client.post("/chatbot/query",
+                         json={"question": "Is Subway KLCC open until 10pm?"}).json()
+    assert [o["name"] for o in answer["outlets"]] == ["Subway KLCC"]
+    assert answer["filters"]["time_op"] == "open_until"
+    answer = client.post("/chatbot/query",
+                         json={"question": "Bangsar outlets open till 9pm"}).json()
+    assert [o["name"] for o in answer["outlets"]] == ["Subway Bangsar Village"]
+
+
+def test_metrics_endpoint_serves_last_scrape_report(client, tmp_path, monkeypatch):
+    from scraper.metrics import Metrics
+
+    run = Metrics()
+    with run.phase("extraction"):
+        pass
+    run.incr("webdriver.calls", 3)
+    report_path = tmp_path / "report.json"
+    run.write_report(str(report_path))
+    monkeypatch.setenv("SCRAPER_METRICS_REPORT", str(report_path))
+    _ingest([OutletRecord("Subway Bangsar", "Jalan Telawi")])
+
+    body = client.get("/metrics").text
+    assert 'subway_scraper_outlets{status="open"} 1' in body
+    assert 'subway_scraper_phase_count_total{phase="extraction"} 1' in body
+    assert 'subway_scraper_events_total{event="webdriver.calls"} 3' in body
@@ -0,0 +1,796 @@
+import itertools
+from pathlib import Path
+
+import pytest
+import requests
+from sqlalchemy import event, func
+
+from benchmarks.fixture_server import FixtureConfig, FixtureServer
+from database.crud import OutletWriter, get_dataset_version
+from database.hours import OpenHoursIndex, backfill, encode_bitmap, is_open, parse_hours
+from database.models import OUTLET_CLOSED, OUTLET_OPEN, Outlet, OutletHours, ScrapeRun
+from database.resolution import geohash
+from database.session import create_db_engine, init_db, make_session_factory
+from database.spatial import (OVERLAP_DISTANCE_KM, haversine_km, nearest, overlapping,
+                              within_radius)
+from scraper.browsers import BLOCKED_URL_PATTERNS, BrowserPool, block_resources, shared_pool
+from scraper.checkpoint import Checkpointer, CheckpointStore
+from scraper.exporters import open_exporter
+from scraper.geocoding import (GeocodeCache, Geocoder, StubProvider, geocode_missing_outlets,
+                               normalize_address)
+from scraper.http_engine import (CardEndpoint, fetch_outlets, make_session, parse_city_list,
+                                 parse_outlet_cards)
+from scraper.locators import PROBE_SELECTORS_JS, SelectorCache, SelectorResolver
+from scraper.main import city_urls
+from scraper.metrics import FailureSnapshots, InstrumentedDriver, Metrics, metrics
+from scraper.pagination import (CARD_SELECTOR, INSTALL_OBSERVER_JS, WAIT_FOR_IDLE_JS,
+                                InfiniteScroller, wait_for_network_idle)
+from scraper.parallel import scrape_cities
+from scraper.records import ListingProgress, OutletRecord
+from scraper.scraper import (EXTRACT_NEW_CARDS_JS, iter_outlets, scrape_subway_outlets,
+                             scrape_with_selenium)
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    init_db(engine)
+    session = make_session_factory(engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_writer_upserts_by_location_id_and_natural_key(db):
+    with OutletWriter(db, batch_size=2) as writer:
+        writer.add(OutletRecord("Subway Mid Valley", "Lingkaran Syed Putra", location_id="7"))
+        writer.add(OutletRecord("Subway Bangsar", "Jalan Telawi 3"))
+        writer.add(OutletRecord("subway bangsar ", "Jalan Telawi, 3"))
+    assert writer.totals.inserted == 2
+    assert writer.totals.updated == 1
+
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("Subway Mid Valley (MV)", "Lingkaran Syed Putra", location_id="7"))
+        writer.add(OutletRecord("subway bangsar ", "Jalan Telawi, 3"))
+    assert (writer.totals.inserted, writer.totals.updated, writer.totals.unchanged) == (0, 1, 1)
+    assert db.query(Outlet).count() == 2
+
+
+def test_http_engine_parses_saved_page():
+    records = parse_outlet_cards((FIXTURES / "find_a_subway.html").read_bytes())
+    assert [r.name for r in records] == [
+        "Subway Mid Valley", "Subway Bangsar Village", "Subway KLCC"]
+
+    mid_valley, bangsar, klcc = records
+    assert mid_valley.location_id == "1021"
+    assert (mid_valley.latitude, mid_valley.longitude) == (3.1181, 101.6774)
+    assert mid_valley.phone == "03-2201 1234"
+    assert mid_valley.google_map.startswith("https://maps.google.com/")
+    assert bangsar.phone is None
+    assert bangsar.hours == (
+        "Monday - Friday, 8:00 AM - 9:00 PM\nSaturday - Sunday, 9:00 AM - 10:00 PM")
+    assert bangsar.waze_map == "https://subway.com.my/redirect/waze/1022"
+    assert klcc.location_id is None and klcc.hours is None
+
+
+def test_http_engine_follows_card_endpoint_past_first_page():
+    config = FixtureConfig(outlets=45, page_size=20, popup=False)
+    with FixtureServer(config) as server:
+        progress = ListingProgress()
+        records = fetch_outlets([server.landing_url], progress=progress)
+        assert [r.location_id for r in records] == [f"kuala-lumpur-{i}" for i in range(45)]
+        assert (progress.total, progress.complete) == (45, True)
+        # Two card fragments after the landing page
+        assert server.requests == 3
+
+        records = list(iter_outlets("http", "Johor", server.city_url("Johor")))
+        assert len(records) == 45 and {r.city for r in records} == {"Johor"}
+
+
+def test_card_endpoint_without_a_total_is_complete_once_it_runs_dry():
+    config = FixtureConfig(outlets=45, page_size=20, popup=False, advertise_total=False)
+    with FixtureServer(config) as server:
+        progress = ListingProgress()
+        records = fetch_outlets([server.landing_url], progress=progress)
+        assert len(records) == 45
+        assert (progress.total, progress.complete) == (None, True)
+        # Pages at 20 and 40, then the empty page that ends the listing
+        assert server.requests == 4
+
+        progress = ListingProgress()
+        endpoint = CardEndpoint(path="/api/elsewhere")
+        assert len(fetch_outlets([server.landing_url], progress=progress, endpoint=endpoint)) == 20
+        assert not progress.complete
+
+
+class FakeScrollDriver:
+    """Answers the pager's scripts from a list of (cards added, timed out) waits."""
+
+    def __init__(self, rendered, waits):
+        self.rendered = rendered
+        self.waits = list(waits)
+        self.idle_ms = []
+        self.script_timeout = None
+
+    def set_script_timeout(self, seconds):
+        self.script_timeout = seconds
+
+    def execute_script(self, script, *args):
+        return self.rendered
+
+    def execute_async_script(self, script, *args):
+        if script == WAIT_FOR_IDLE_JS:
+            return 1250
+        scroll, timeout_ms, idle_ms, quiet_ms = args
+        self.idle_ms.append(idle_ms)
+        added, timed_out = self.waits.pop(0) if self.waits else (0, False)
+        self.rendered += added
+        return {"added": added, "elapsed": 100.0, "timedOut": timed_out}
+
+
+class FakeElement:
+    def click(self):
+        pass
+
+    def is_displayed(self):
+        return True
+
+
+class FakeListingDriver(FakeScrollDriver):
+    """Enough of Chrome for scrape_with_selenium: each batch is one scroll's cards."""
+
+    def __init__(self, batches):
+        super().__init__(len(batches[0]), [(len(batch), False) for batch in batches[1:]])
+        self.batches = list(batches)
+        self.visits = []
+
+    def get(self, url):
+        self.visits.append(url)
+
+    def delete_all_cookies(self):
+        pass
+
+    def find_elements(self, by, value):
+        return []  # no popups
+
+    def find_element(self, by, value):
+        return FakeElement()
+
+    def execute_script(self, script, *args):
+        if script == INSTALL_OBSERVER_JS:
+            return self.rendered
+        if script == PROBE_SELECTORS_JS:
+            return [0, FakeElement()]
+        if script == EXTRACT_NEW_CARDS_JS:
+            assert args == (CARD_SELECTOR,)
+            return self.batches.pop(0) if self.batches else []
+        return True
+
+
+def test_extracted_card_payloads_map_onto_outlet_records(tmp_path):
+    full = {"name": "Subway Mid Valley", "address": "Lingkaran Syed Putra",
+            "phone": "03-2201 1234", "hours": "Daily 8am - 10pm",
+            "waze_map": "https://waze.com/ul?ll=3.1181,101.6774",
+            "google_map": "https://maps.google.com/?q=3.1181,101.6774",
+            "latitude": "3.1181", "longitude": "101.6774", "location_id": "1021"}
+    # What the script returns for a card missing its optional elements
+    bare = dict.fromkeys(full, None)
+    bare.update(name="Subway KLCC", latitude="", location_id="")
+    nameless = dict(bare, name=None)
+    driver = FakeListingDriver([[full], [bare, nameless]])
+
+    progress = ListingProgress()
+    records = list(scrape_with_selenium(
+        "Kuala Lumpur", start_url="http://fixture/find-a-subway",
+        selector_cache=SelectorCache(str(tmp_path / "selectors.json")),
+        pool=BrowserPool(factory=lambda: driver), progress=progress))
+
+    assert records == [
+        OutletRecord("Subway Mid Valley", "Lingkaran Syed Putra", hours="Daily 8am - 10pm",
+                     phone="03-2201 1234", latitude=3.1181, longitude=101.6774,
+                     google_map=full["google_map"], waze_map=full["waze_map"],
+                     location_id="1021", city="Kuala Lumpur"),
+        OutletRecord("Subway KLCC", city="Kuala Lumpur"),
+    ]
+    # The nameless card was skipped as an error, so the listing is not complete
+    assert not progress.complete
+    assert driver.visits == ["http://fixture/find-a-subway", "about:blank"]
+
+
+def test_infinite_scroller_backs_off_and_stops_after_empty_scrolls():
+    metrics.reset()
+    driver = FakeScrollDriver(20, [(20, False), (0, False), (5, True)])
+    scroller = InfiniteScroller(driver, idle=0.5, backoff=2.0, max_idle=1.5,
+                                max_empty_scrolls=3)
+    assert [page.new_cards for page in scroller.pages()] == [20, 20, 5]
+    # An empty scroll doubles the idle window up to max_idle; new cards reset it
+    assert driver.idle_ms == [500, 500, 1000, 500, 1000, 1500]
+    assert [page.timed_out for page in scroller.timings] == [False, False, True]
+    summary = scroller.summary()
+    assert (summary["pages"], summary["cards"], summary["timeouts"]) == (3, 45, 1)
+    assert metrics.counters["empty_scrolls"] == 4 and metrics.counters["page_timeouts"] == 1
+
+    # Nothing rendered: one wait with the longest idle window, then no pages
+    driver = FakeScrollDriver(0, [])
+    assert list(InfiniteScroller(driver, max_idle=1.5).pages()) == []
+    assert driver.idle_ms == [1500]
+
+
+def test_infinite_scroller_fast_forwards_to_a_checkpoint():
+    driver = FakeScrollDriver(20, [(20, False), (0, False), (20, False)])
+    scroller = InfiniteScroller(driver, idle=0.5)
+    assert scroller.fast_forward(50) == 60 and scroller.timings == []
+    assert driver.idle_ms == [500, 500, 1000]
+
+    # A list that ends before the checkpoint stops after max_empty_scrolls
+    assert scroller.fast_forward(100) == 60 and len(driver.idle_ms) == 6
+
+    assert wait_for_network_idle(driver, timeout=10, idle=0.5) == 1.25
+    assert driver.script_timeout == 15
+
+
+def test_city_list_is_discovered_from_location_menu():
+    cities = parse_city_list((FIXTURES / "find_a_subway.html").read_bytes())
+    assert cities == {
+        "Johor": None,
+        "Kuala Lumpur": None,
+        "Selangor": "https://subway.com.my/find-a-subway/selangor",
+    }
+
+
+def test_named_cities_get_their_listing_urls_even_when_discovery_fails(monkeypatch):
+    menu = {"Kuala Lumpur": None, "Penang": "https://subway.com.my/find-a-subway/penang"}
+    calls = []
+
+    def discover():
+        calls.append(1)
+        return menu
+
+    monkeypatch.setattr("scraper.main.discover_cities", discover)
+    assert city_urls(["Penang"], False, "http") == {"Penang": menu["Penang"]}
+    assert city_urls(None, True, "auto") == menu
+    # Neither the browser nor the default city's landing page needs the menu
+    assert city_urls(["Penang"], False, "selenium") == {"Penang": None}
+    assert city_urls(None, False, "http") == {"Kuala Lumpur": None}
+    assert len(calls) == 2
+
+    def offline():
+        raise requests.ConnectionError("no route to host")
+
+    monkeypatch.setattr("scraper.main.discover_cities", offline)
+    assert city_urls(["Penang", "Johor"], False, "auto") == {"Penang": None, "Johor": None}
+    assert city_urls(None, True, "selenium") == {"Kuala Lumpur": None}
+
+
+def test_cities_scrape_in_parallel_and_unreachable_ones_fail(db):
+    config = FixtureConfig(outlets=30, page_size=20, popup=False)
+    with FixtureServer(config) as server:
+        cities = {"Kuala Lumpur": server.landing_url,
+                  "Selangor": server.city_url("Selangor"),
+                  "Penang": None}
+        results = {r.city: r for r in scrape_cities(db, cities, workers=2, engine="http")}
+    assert {city: r.status for city, r in results.items()} == {
+        "Kuala Lumpur": "done", "Selangor": "done", "Penang": "failed"}
+    assert results["Selangor"].outlets == 30 and results["Selangor"].complete
+    assert "No listing URL for Penang" in results["Penang"].error
+    assert db.query(Outlet).count() == 60
+    assert db.query(ScrapeRun).one().status == "partial"
+
+
+def test_failing_writer_stops_workers_blocked_on_a_full_queue(db, monkeypatch):
+    add, added = OutletWriter.add, []
+
+    def add_then_fail(self, record):
+        if len(added) == 5:
+            raise RuntimeError("disk full")
+        added.append(record)
+        return add(self, record)
+
+    monkeypatch.setattr(OutletWriter, "add", add_then_fail)
+    config = FixtureConfig(outlets=200, page_size=200, popup=False)
+    with FixtureServer(config) as server:
+        cities = {"Kuala Lumpur": server.landing_url, "Selangor": server.city_url("Selangor")}
+        # A two-slot queue: both workers are blocked on put when the writer fails
+        with pytest.raises(RuntimeError, match="disk full"):
+            scrape_cities(db, cities, workers=2, engine="http", batch_size=1)
+    assert db.query(Outlet).count() == 5
+    assert db.query(ScrapeRun).one().status == "failed"
+
+
+def test_geocoder_only_resolves_unseen_addresses(tmp_path):
+    provider = StubProvider({"Jalan Telawi 3, Bangsar": (3.1319, 101.6713)})
+    geocoder = Geocoder(provider, GeocodeCache(str(tmp_path / "geo.db")), rate=0)
+    try:
+        first = geocoder.geocode_many([
+            "Jalan Telawi 3, Bangsar", "Jln. Telawi 3 ,  BANGSAR", "Nowhere Street"])
+        assert first["Jln. Telawi 3 ,  BANGSAR"] == (3.1319, 101.6713)
+        assert first["Nowhere Street"] is None
+        assert len(provider.calls) == 2
+
+        geocoder.geocode_many(["jalan telawi 3, bangsar", "Nowhere Street"])
+        assert len(provider.calls) == 2
+        assert geocoder.cache_hits == 2
+    finally:
+        geocoder.close()
+
+
+def test_geocode_cache_evicts_expired_entries(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geo.db"), ttl=0, negative_ttl=3600)
+    cache.put_many([("a", "addr a", (1.0, 2.0), "stub"), ("b", "addr b", None, "stub")])
+    assert cache.get_many(["a", "b"]) == {"b": None}
+    assert cache.evict_expired() == 1
+    cache.close()
+
+
+def test_spatial_index_answers_nearest_and_overlaps(db):
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("Mid Valley", "a", latitude=3.1181, longitude=101.6774))
+        writer.add(OutletRecord("Bangsar", "b", latitude=3.1319, longitude=101.6713))
+        writer.add(OutletRecord("Johor Bahru", "c", latitude=1.4927, longitude=103.7414))
+
+    names = [outlet.name for outlet, _ in nearest(db, 3.12, 101.67, k=2)]
+    assert names == ["Mid Valley", "Bangsar"]
+    assert [o.name for o, _ in within_radius(db, 1.49, 103.74, 5)] == ["Johor Bahru"]
+
+    pairs = overlapping(db)
+    assert len(pairs) == 1 and pairs[0].distance_km == pytest.approx(1.67, abs=0.01)
+
+
+def test_overlaps_of_a_batch_match_every_pair_within_the_distance(db):
+    points = [(3.10 + 0.004 * (i % 7), 101.60 + 0.005 * (i // 7)) for i in range(35)]
+    with OutletWriter(db) as writer:
+        for i, (lat, lng) in enumerate(points[:20]):
+            writer.add(OutletRecord(f"Outlet {i}", f"addr {i}", latitude=lat, longitude=lng))
+    with OutletWriter(db) as writer:
+        for i, (lat, lng) in enumerate(points[20:], start=20):
+            writer.add(OutletRecord(f"Outlet {i}", f"addr {i}", latitude=lat, longitude=lng))
+
+    expected = {(a + 1, b + 1) for a, b in itertools.combinations(range(35), 2)
+                if haversine_km(*points[a], *points[b]) <= OVERLAP_DISTANCE_KM}
+    assert {(pair.outlet_id, pair.other_id) for pair in overlapping(db)} == expected
+
+    found = within_radius(db, 3.11, 101.61, 2.0, limit=3)
+    assert [d for _, d in found] == sorted(d for _, d in within_radius(db, 3.11, 101.61, 2.0))[:3]
+
+
+def test_geocoded_outlets_join_the_spatial_index_and_bump_the_version(db, tmp_path):
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("Subway Bangsar", "Jalan Telawi 3, Bangsar",
+                                latitude=3.1319, longitude=101.6713))
+        writer.add(OutletRecord("Subway Bangsar Village", "Jalan Telawi 5, Bangsar"))
+        writer.add(OutletRecord("Subway Telawi", "Jalan Telawi 1, Bangsar", location_id="9"))
+    db.query(Outlet).filter(Outlet.location_id == "9").update({"status": OUTLET_CLOSED})
+    db.commit()
+    version = get_dataset_version(db).version
+
+    provider = StubProvider({"Jalan Telawi 5, Bangsar": (3.1321, 101.6710),
+                             "Jalan Telawi 1, Bangsar": (3.1330, 101.6715)})
+    geocoder = Geocoder(provider, GeocodeCache(str(tmp_path / "geo.db")), rate=0)
+    try:
+        assert geocode_missing_outlets(db, geocoder) == 1
+    finally:
+        geocoder.close()
+    assert provider.calls == [normalize_address("Jalan Telawi 5, Bangsar")]
+
+    village = db.query(Outlet).filter(Outlet.name == "Subway Bangsar Village").one()
+    assert village.geohash == geohash(3.1321, 101.6710)
+    assert [pair.other_id for pair in overlapping(db, village.id)] == [1]
+    assert get_dataset_version(db).version == version + 1
+
+    # Re-scraping the card, still without coordinates, changes nothing
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("Subway Bangsar Village", "Jalan Telawi 5, Bangsar"))
+    assert writer.totals.unchanged == 1
+
+
+def test_hours_parser_and_open_bitmap():
+    intervals = parse_hours("Mon - Thu 10am - 10pm, Fri-Sat 10:00 AM - 2:00 AM\nSun Closed")
+    assert (4, 600, 1440) in intervals and (5, 0, 120) in intervals
+    assert not any(day == 6 and start > 0 for day, start, _ in intervals)
+    assert parse_hours("Please call the outlet") is None
+
+    # Days named after the times qualify them
+    assert parse_hours("10am-10pm (Mon-Fri)") == [(day, 600, 1320) for day in range(5)]
+    assert parse_hours("10am-10pm (Mon-Fri), 8am-11pm (Sat-Sun)") == (
+        [(day, 600, 1320) for day in range(5)] + [(5, 480, 1380), (6, 480, 1380)])
+    assert parse_hours("10am-10pm, closed on Sunday") == [(day, 600, 1320) for day in range(6)]
+    # Days left without hours make the text ambiguous rather than all-week
+    assert parse_hours("Mon-Fri 9am-5pm, Sat, Sun") is None
+
+    bitmap = encode_bitmap(intervals)
+    assert is_open(bitmap, 4, 23 * 60) and is_open(bitmap, 5, 60)
+    assert not is_open(bitmap, 0, 23 * 60)
+
+    index = OpenHoursIndex([1, 2], [bitmap, encode_bitmap(parse_hours("Daily 8am - 9pm"))])
+    assert index.open_after(21 * 60 + 30, days=[0]).tolist() == [1]
+    assert index.open_before(9 * 60, days=[0]).tolist() == [2]
+    assert index.open_before(9 * 60).tolist() == [1, 2]  # Saturday 00:00-02:00
+    assert index.open_at(22 * 60 + 30).tolist() == [1]
+
+
+def test_hours_backfill_rewrites_intervals_and_bumps_the_version(db):
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("Subway Bangsar", "Jalan Telawi 3", hours="Daily 8am - 9pm"))
+        writer.add(OutletRecord("Subway KLCC", "Jalan Ampang", hours="Please call"))
+    db.query(OutletHours).delete()
+    db.query(Outlet).update({Outlet.hours_bitmap: None})
+    db.commit()
+    version = get_dataset_version(db).version
+
+    assert backfill(db) == {"Please call": 1}
+    assert db.query(OutletHours).count() == 7
+    assert get_dataset_version(db).version == version + 1
+
+
+def test_writer_replaces_hours_with_one_delete_and_one_insert_per_flush(db):
+    records = [OutletRecord(f"Subway {i}", f"Jalan {i}", hours="Daily 8am - 9pm")
+               for i in range(3)]
+    with OutletWriter(db) as writer:
+        writer.add_many(records)
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if "outlet_hours" in statement:
+            statements.append(statement.split()[0])
+
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        records[0].hours = records[1].hours = "Mon - Fri 10am - 10pm"
+        with OutletWriter(db) as writer:
+            writer.add_many(records)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+    assert statements == ["DELETE", "INSERT"]
+    days = dict(db.query(OutletHours.outlet_id, func.count()).group_by(OutletHours.outlet_id))
+    assert days == {1: 5, 2: 5, 3: 7}
+
+
+def test_rescrape_writes_only_changes_and_tombstones_missing(db):
+    def run(records):
+        with OutletWriter(db) as writer:
+            writer.add_many(records)
+            writer.retire_unseen(["Kuala Lumpur"])
+        return writer
+
+    outlets = [OutletRecord(f"Subway {i}", f"Jalan {i}", city="Kuala Lumpur",
+                            latitude=3.1 + i / 1000, longitude=101.6) for i in range(3)]
+    run(outlets)
+    version = get_dataset_version(db).version
+
+    writer = run(outlets)
+    assert (writer.totals.unchanged, writer.totals.updated) == (3, 0)
+    assert get_dataset_version(db).version == version
+
+    # Records without coordinates still hash equal to the stored row
+    moved = OutletRecord("Subway 1", "Jalan 1", hours="Daily 8am - 9pm", city="Kuala Lumpur")
+    writer = run([outlets[0], moved])
+    assert (writer.totals.updated, writer.totals.closed) == (1, 1)
+    assert writer.changes["updated"][0]["fields"] == ["operating_hours"]
+    assert db.query(Outlet).filter(Outlet.name == "Subway 2").one().status == OUTLET_CLOSED
+    assert get_dataset_version(db).version == version + 1
+
+    writer = run(outlets)
+    assert (writer.totals.reopened, writer.totals.closed) == (1, 0)
+    assert db.query(Outlet).filter(Outlet.status == OUTLET_OPEN).count() == 3
+
+
+def test_partial_listing_never_retires_outlets(db):
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("Subway Gone", "Jalan Lama 1", city="Kuala Lumpur"))
+
+    config = FixtureConfig(outlets=45, page_size=20, cities=("Kuala Lumpur",), popup=False)
+    with FixtureServer(config) as server:
+        totals = scrape_subway_outlets(db, engine="http", url=server.landing_url)
+        assert (totals.inserted, totals.closed) == (45, 1)
+
+        # The landing page renders 20 outlets; the other 25 now fail to load
+        server.config.failure_rate = 1.0
+        totals = scrape_subway_outlets(db, engine="http", url=server.landing_url)
+    assert (totals.unchanged, totals.closed) == (20, 0)
+    assert db.query(Outlet).filter(Outlet.status == OUTLET_OPEN).count() == 45
+    runs = db.query(ScrapeRun).order_by(ScrapeRun.id).all()
+    assert [run.status for run in runs] == ["complete", "partial"]
+
+
+@pytest.mark.parametrize("suffix", ["csv", "jsonl", "parquet"])
+def test_exporters_stream_and_rename_atomically(tmp_path, suffix):
+    path = tmp_path / f"outlets.{suffix}"
+    records = parse_outlet_cards((FIXTURES / "find_a_subway.html").read_bytes())
+    with open_exporter(str(path), checkpoint_every=2) as exporter:
+        for record in records:
+            exporter.write(record)
+        assert not path.exists()
+    assert not (tmp_path / f"outlets.{suffix}.part").exists()
+
+    if suffix == "parquet":
+        import pyarrow.parquet as pq
+        rows = pq.read_table(path).to_pylist()
+        assert pq.ParquetFile(path).metadata.num_row_groups == 2
+    elif suffix == "jsonl":
+        import json
+        rows = [json.loads(line) for line in path.read_text().splitlines()]
+    else:
+        import csv
+        rows = list(csv.DictReader(path.open()))
+    assert [row["name"] for row in rows] == [r.name for r in records]
+    assert list(rows[0]) == list(records[0].to_dict())
+
+
+def test_checkpoints_save_progress_and_resume(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    saved = []
+    checkpointer = Checkpointer.start(store, "Kuala Lumpur", every_pages=2, every_outlets=3,
+                                      before_save=lambda cp: saved.append(cp.pages))
+    for key in ["1021", "1022"]:
+        checkpointer.outlet(key)
+    checkpointer.page(cards=2)
+    assert saved == [] and store.load("Kuala Lumpur") is None
+    checkpointer.outlet("subway klcc|jalan ampang")
+    assert saved == [1]
+    checkpointer.page(cards=4)
+    checkpointer.page(cards=6)
+    assert saved == [1, 3]
+
+    resumed = Checkpointer.start(store, "Kuala Lumpur", resume=True)
+    assert resumed.resumed and resumed.checkpoint.cards == 6
+    assert resumed.is_seen("1022") and not resumed.is_seen("1023")
+
+    resumed.finish()
+    assert not Checkpointer.start(store, "Kuala Lumpur", resume=True).resumed
+
+
+@pytest.mark.parametrize("engine", ["selenium", "auto"])
+def test_resumed_scrape_exports_the_whole_city(db, tmp_path, monkeypatch, engine):
+    outlets = [OutletRecord(f"Subway {i}", f"Jalan {i}", location_id=str(i)) for i in range(6)]
+    crash = True
+
+    def fake_selenium(city, checkpointer, progress=None):
+        # Two cards a page; crashes after the second page on the first run
+        for page in range(checkpointer.replay() // 2 if checkpointer.resumed else 0, 3):
+            for record in outlets[page * 2:page * 2 + 2]:
+                if not checkpointer.is_seen(record.location_id):
+                    yield record
+                    checkpointer.outlet(record.location_id)
+            checkpointer.page(page * 2 + 2)
+            if crash and page == 1:
+                raise RuntimeError("browser crashed")
+        progress.complete = True
+
+    def fake_fetch(urls, progress=None):
+        # The static page lists the whole city, so the checkpoint goes unused
+        progress.total, progress.complete = len(outlets), True
+        return [OutletRecord(**vars(record)) for record in outlets]
+
+    monkeypatch.setattr("scraper.scraper.scrape_with_selenium", fake_selenium)
+    monkeypatch.setattr("scraper.scraper.fetch_outlets", fake_fetch)
+    path = tmp_path / "outlets.csv"
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    with pytest.raises(RuntimeError):
+        scrape_subway_outlets(db, engine="selenium", exporter=open_exporter(str(path)),
+                              checkpoints=store)
+    assert not path.exists() and db.query(Outlet).count() == 4
+
+    crash = False
+    totals = scrape_subway_outlets(db, engine=engine, exporter=open_exporter(str(path)),
+                                   checkpoints=store, resume=True)
+    assert (totals.inserted, totals.closed) == (2, 0)
+    rows = path.read_text(encoding="utf-8").splitlines()
+    assert [row.split(",")[0] for row in rows[1:]] == ["0", "1", "2", "3", "4", "5"]
+
+
+def test_driver_calls_are_counted_and_screenshots_kept_for_failures(tmp_path):
+    class FakeDriver:
+        title = "Find a Subway"
+
+        def execute_script(self, script, *args):
+            return []
+
+        def get_screenshot_as_png(self):
+            return b"png"
+
+    registry = Metrics()
+    driver = InstrumentedDriver(FakeDriver(), registry)
+    driver.execute_script("return 1")
+    driver.execute_script("return 2")
+    assert driver.title == "Find a Subway"
+    assert registry.report()["counters"] == {
+        "webdriver.calls": 2, "webdriver.execute_script": 2}
+
+    off = FailureSnapshots(driver, enabled=False, directory=str(tmp_path / "off"))
+    off.capture("page_loaded")
+    assert off.dump("failed") == 0 and not (tmp_path / "off").exists()
+
+    on = FailureSnapshots(driver, size=2, enabled=True, directory=str(tmp_path / "on"))
+    for label in ["page_loaded", "before_click", "city_menu"]:
+        on.capture(label)
+    assert on.dump("failed") == 2
+    assert sorted(p.name.split("-", 3)[-1] for p in (tmp_path / "on").iterdir()) == [
+        "city_menu.png", "failed.png"]
+
+
+def test_fixture_server_pages_and_injected_failures():
+    with FixtureServer(FixtureConfig(outlets=45, page_size=20)) as server:
+        records = fetch_outlets(server.page_urls("Selangor"))
+        assert len(records) == 45 and len({r.location_id for r in records}) == 45
+        assert records[1].hours.count("\n") == 1
+        landing = make_session().get(server.landing_url).content
+        assert parse_city_list(landing, server.landing_url)["Penang"] == server.url + "/find-a-subway/penang"
+
+    with FixtureServer(FixtureConfig(outlets=5, failure_rate=1.0)) as server:
+        with pytest.raises(requests.RequestException):
+            fetch_outlets(server.page_urls("Johor"), session=make_session(retries=0))
+        assert server.failures == 1
+
+
+def test_selector_resolver_probes_once_and_prefers_cached_winner(tmp_path):
+    class FakeDriver:
+        present = {"div.city-selector", "div.dropdown-toggle"}
+        calls = 0
+
+        def execute_script(self, script, candidates):
+            self.calls += 1
+            for index, selector in enumerate(candidates):
+                if selector in self.present:
+                    return [index, f"<{selector}>"]
+            return None
+
+    candidates = ["div.location_left", "div.city-selector", "div.dropdown-toggle"]
+    path = str(tmp_path / "selectors.json")
+    driver = FakeDriver()
+    first = SelectorResolver(driver, SelectorCache(path)).resolve("city_menu", candidates)
+    assert first == ("<div.city-selector>", "div.city-selector") and driver.calls == 1
+
+    # Next run: the cached winner goes first, even behind a later candidate
+    driver.present = {"div.dropdown-toggle", "div.city-selector"}
+    cache = SelectorCache(path)
+    resolver = SelectorResolver(driver, cache)
+    assert resolver.resolve("city_menu", candidates[::-1])[1] == "div.city-selector"
+    assert cache.stats["city_menu"] == {"hits": 1, "misses": 1}
+
+    # Markup drift: a single timeout for the step, then the new winner is kept
+    driver.present = set()
+    assert resolver.resolve("city_menu", candidates, timeout=0) is None
+    driver.present = {"div.dropdown-toggle"}
+    assert resolver.resolve("city_menu", candidates)[1] == "div.dropdown-toggle"
+    assert SelectorCache(path).winners == {"city_menu": "div.dropdown-toggle"}
+    assert SelectorCache(path).stats["city_menu"] == {"hits": 1, "misses": 3}
+
+
+def test_browser_pool_reuses_recycles_and_replaces_broken_browsers():
+    class FakeBrowser:
+        def __init__(self):
+            self.alive, self.quit_called, self.visits, self.cdp = True, False, [], []
+
+        def execute_script(self, script):
+            if not self.alive:
+                raise RuntimeError("chrome not reachable")
+
+        def execute_cdp_cmd(self, command, params):
+            self.cdp.append((command, params))
+
+        def delete_all_cookies(self):
+            pass
+
+        def get(self, url):
+            self.visits.append(url)
+
+        def quit(self):
+            self.quit_called = True
+
+    launched = []
+
+    def launch():
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    pool = BrowserPool(size=1, max_pages=3, factory=launch)
+    with pool.lease() as session:
+        session.pages += 2
+    with pool.lease() as session:
+        assert session.driver is launched[0] and launched[0].visits == ["about:blank"]
+        session.pages += 1
+    # Served max_pages, so it was quit instead of going back to the pool
+    assert launched[0].quit_called and len(launched) == 1
+
+    with pool.lease():
+        pass
+    launched[1].alive = False
+    with pool.lease() as session:
+        assert session.driver is launched[2] and launched[1].quit_called
+    with pytest.raises(ValueError):
+        with pool.lease():
+            raise ValueError("page broke")
+    assert launched[2].quit_called
+    pool.close()
+
+    block_resources(launched[0])
+    assert launched[0].cdp == [("Network.enable", {}),
+                               ("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})]
+
+
+def test_shared_pool_size_comes_from_the_environment(monkeypatch):
+    monkeypatch.setattr("scraper.browsers._shared_pool", None)
+    monkeypatch.setenv("SUBWAY_BROWSER_POOL_SIZE", "3")
+    assert shared_pool().size == 3 and shared_pool() is shared_pool()
+
+
+def test_entity_resolution_merges_reworded_outlets_under_stable_ids(db):
+    first = [
+        OutletRecord("Subway Bangsar Village", "Lot 12, Jalan Telawi 3, Bangsar",
+                     latitude=3.13000, longitude=101.67100),
+        # Same mall and name, different unit: a different outlet
+        OutletRecord("Subway Bangsar Village", "Lot 40, Jalan Telawi 3, Bangsar",
+                     latitude=3.13010, longitude=101.67110),
+        OutletRecord("Subway Mid Valley", "Lingkaran Syed Putra", location_id="7"),
+    ]
+    with OutletWriter(db) as writer:
+        writer.add_many(first)
+    ids = dict(db.query(Outlet.id, Outlet.canonical_id))
+    assert len(ids) == 3 and len(set(ids.values())) == 3 and ids[3] == "id:7"
+
+    with OutletWriter(db) as writer:
+        writer.add(OutletRecord("SUBWAY  bangsar village ", "Lot 12 Jln Telawi 3 Bangsar Baru",
+                                latitude=3.13005, longitude=101.67102))
+        writer.add(OutletRecord("Subway Mid Valley", "Lingkaran Syed Putra", location_id="7"))
+    assert (writer.totals.inserted, writer.totals.updated, writer.totals.unchanged) == (0, 1, 1)
+    assert dict(db.query(Outlet.id, Outlet.canonical_id)) == ids
+    assert db.get(Outlet, 1).address == "Lot 12 Jln Telawi 3 Bangsar Baru"
+
+    # Rows from before canonical ids: duplicates keep NULL and are not matched
+    db.execute(Outlet.__table__.update().values(canonical_id=None, geohash=None))
+    db.execute(Outlet.__table__.insert().values(
+        name="Subway Mid Valley", address="Lingkaran Syed Putra", location_id="7"))
+    db.commit()
+    init_db(db.get_bind())
+    db.expire_all()
+    backfilled = dict(db.query(Outlet.id, Outlet.canonical_id))
+    assert backfilled[3] == "id:7" and backfilled[4] is None
+    assert backfilled[2] == ids[2] and backfilled[1] is not None
+    assert db.get(Outlet, 1).geohash == "w283c9f"
+
+
+def test_engines_geocoder_and_writer_share_one_normalizer(db, tmp_path):
+    a = OutletRecord("Subway Bangsar", "Jln. Telawi 3, Bt 5")
+    b = OutletRecord("BANGSAR subway", "Jalan Telawi 3 , Batu 5")
+    assert a.key == b.key == a.natural_key
+    assert normalize_address(a.address) == normalize_address(b.address) == "jalan telawi 3, batu 5"
+
+    driver = FakeListingDriver([[{"name": a.name, "address": a.address}],
+                                [{"name": b.name, "address": b.address}]])
+    records = list(scrape_with_selenium(
+        "Kuala Lumpur", start_url="http://fixture/find-a-subway",
+        selector_cache=SelectorCache(str(tmp_path / "selectors.json")),
+        pool=BrowserPool(factory=lambda: driver)))
+    assert records == [OutletRecord(a.name, a.address, city="Kuala Lumpur")]
+
+    with OutletWriter(db) as writer:
+        writer.add_many([a, b])
+    assert db.query(Outlet.natural_key).scalar() == a.natural_key
+
+
+def test_fuzzy_matching_costs_a_fixed_number_of_queries_per_batch(db):
+    streets = ["Jalan Telawi 3, Bangsar", "Jalan Ampang 8, KLCC", "Jalan Sultan 2, Klang"]
+    with OutletWriter(db) as writer:
+        writer.add_many(OutletRecord(f"Subway {street.split(', ')[1]}", street)
+                        for street in streets)
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        # Postcodes added: no key matches, so every record is fuzzy-matched
+        with OutletWriter(db) as writer:
+            writer.add_many(OutletRecord(f"Subway {street.split(', ')[1]}",
+                                         f"{street} 50000") for street in streets)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+    assert (writer.totals.inserted, writer.totals.updated) == (0, 3)
+    assert sum("outlets_fts MATCH" in s for s in statements) == 1
+    # Matched rows load in one IN query, never one primary-key get each
+    assert not any(s.startswith("SELECT") and "WHERE outlets.id = ?" in s for s in statements)